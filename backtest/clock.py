@@ -0,0 +1,44 @@
+import asyncio
+import selectors
+from datetime import datetime, timedelta
+
+
+class VirtualClock:
+    """Simulated time, in seconds since `start` (an aware datetime)."""
+
+    def __init__(self, start: datetime):
+        self.start = start
+        self.seconds = 0.0
+
+    def advance(self, seconds):
+        self.seconds += seconds
+
+    def now(self):
+        return self.start + timedelta(seconds=self.seconds)
+
+
+class _VirtualSelector(selectors.SelectSelector):
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout=None):
+        # The loop asks to block until its next timer is due: jump there
+        # instead, still polling real descriptors such as the self-pipe
+        if timeout is None:
+            raise RuntimeError("Backtest stalled: nothing scheduled")
+        if timeout > 0:
+            self.clock.advance(timeout)
+        return super().select(0)
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """Event loop on a VirtualClock. Sleeps and call_later timers complete as
+    soon as nothing else is runnable, so idle time costs nothing."""
+
+    def __init__(self, clock: VirtualClock):
+        super().__init__(selector=_VirtualSelector(clock))
+        self.clock = clock
+
+    def time(self):
+        return self.clock.seconds
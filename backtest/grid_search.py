@@ -0,0 +1,276 @@
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+import toml
+
+from backtest.replay import read_nope_log
+
+# Sweeps the NOPE entry/exit thresholds over the NOPE logs written by
+# nope_periodic. Run from the repo root:
+#   python -m backtest.grid_search --long-enter=-100:-30:5 --long-exit=-60:0:5
+
+THRESHOLDS = (
+    "long_enter",
+    "long_exit",
+    "short_enter",
+    "short_exit",
+    "long_enter_limit",
+    "short_enter_limit",
+)
+
+
+class NopeSeries(NamedTuple):
+    nope: np.ndarray
+    price: np.ndarray
+    days: int
+
+
+def load_nope_series(paths):
+    nope, price = [], []
+    days = 0
+    for path in sorted(paths):
+        rows = read_nope_log(path)
+        if rows:
+            days += 1
+        nope += [n for _, n, _ in rows]
+        price += [p for _, _, p in rows]
+    return NopeSeries(np.array(nope), np.array(price), days)
+
+
+def parse_range(spec):
+    """Parse "start:stop:step" (stop inclusive) or a single value."""
+    parts = [float(p) for p in spec.split(":")]
+    if len(parts) == 1:
+        return np.array(parts)
+    start, stop, step = parts
+    return np.arange(start, stop + step / 2, step)
+
+
+def threshold_grid(ranges):
+    """Every combination of the threshold ranges that the strategy could
+    act on, as one column per threshold."""
+    mesh = np.meshgrid(*(ranges[t] for t in THRESHOLDS), indexing="ij")
+    grid = {t: column.ravel() for t, column in zip(THRESHOLDS, mesh)}
+    valid = (
+        (grid["long_enter_limit"] < grid["long_enter"])
+        & (grid["long_exit"] > grid["long_enter"])
+        & (grid["short_enter_limit"] > grid["short_enter"])
+        & (grid["short_exit"] < grid["short_enter"])
+    )
+    return {t: column[valid] for t, column in grid.items()}
+
+
+def simulate(
+    series: NopeSeries,
+    grid,
+    call_limit,
+    put_limit,
+    call_quantity,
+    put_quantity,
+    delta,
+    commission,
+):
+    """Runs the enter_positions/exit_positions rules for every parameter set
+    at once, one NOPE reading per step.
+
+    Each buy adds `call_quantity`/`put_quantity` contracts while the position
+    is under its limit, as in buy_contracts. Options are modelled as `delta`
+    shares of the underlying per contract (times the 100 multiplier) and fill
+    at the reading's price. As in sell_held_contracts, positions are only sold
+    at a gain. Stop losses and order timeouts are not modelled; check
+    finalists with backtest.run.
+
+    There is one decision per logged reading. Live trading also decides every
+    `cadence.min_seconds` while NOPE is near a threshold, so it can enter
+    sooner and more often than ranked here.
+    """
+    n = len(grid["long_enter"])
+    long_enter, long_exit = grid["long_enter"], grid["long_exit"]
+    short_enter, short_exit = grid["short_enter"], grid["short_exit"]
+    long_limit, short_limit = grid["long_enter_limit"], grid["short_enter_limit"]
+    calls = np.zeros(n)
+    call_avg = np.zeros(n)
+    puts = np.zeros(n)
+    put_avg = np.zeros(n)
+    realized = np.zeros(n)
+    trades = np.zeros(n, dtype=np.int64)
+    peak = np.zeros(n)
+    drawdown = np.zeros(n)
+    scale = delta * 100
+
+    for nope, price in zip(series.nope, series.price):
+        long_signal = (long_enter > nope) & (nope > long_limit)
+        buy_call = long_signal & (calls < call_limit)
+        buy_put = ~long_signal & (short_enter < nope) & (nope < short_limit)
+        buy_put &= puts < put_limit
+        sell_call = (nope > long_exit) & (calls > 0) & (price > call_avg)
+        sell_put = (nope < short_exit) & (puts > 0) & (price < put_avg)
+
+        realized += np.where(sell_call, calls * (price - call_avg) * scale, 0.0)
+        realized += np.where(sell_put, puts * (put_avg - price) * scale, 0.0)
+        realized -= (
+            buy_call * call_quantity
+            + buy_put * put_quantity
+            + np.where(sell_call, calls, 0)
+            + np.where(sell_put, puts, 0)
+        ) * commission
+        trades += buy_call + buy_put + sell_call + sell_put
+        calls[sell_call] = 0
+        puts[sell_put] = 0
+
+        call_avg = np.where(
+            buy_call,
+            (call_avg * calls + price * call_quantity) / (calls + call_quantity),
+            call_avg,
+        )
+        put_avg = np.where(
+            buy_put,
+            (put_avg * puts + price * put_quantity) / (puts + put_quantity),
+            put_avg,
+        )
+        calls += buy_call * call_quantity
+        puts += buy_put * put_quantity
+
+        equity = (
+            realized + (calls * (price - call_avg) + puts * (put_avg - price)) * scale
+        )
+        np.maximum(peak, equity, out=peak)
+        np.maximum(drawdown, peak - equity, out=drawdown)
+
+    return {
+        "pnl": equity if len(series.nope) else realized,
+        "trades": trades,
+        "max_drawdown": drawdown,
+    }
+
+
+def _simulate_shard(args):
+    return simulate(*args)
+
+
+def grid_search(series, grid, workers=None, shards=None, **kwargs):
+    """simulate() sharded across a process pool by parameter set."""
+    workers = workers or os.cpu_count() or 1
+    n = len(grid["long_enter"])
+    shards = shards or workers * 4
+    bounds = np.linspace(0, n, min(shards, n) + 1, dtype=int)
+    tasks = [
+        (
+            series,
+            {t: column[lo:hi] for t, column in grid.items()},
+            kwargs["call_limit"],
+            kwargs["put_limit"],
+            kwargs["call_quantity"],
+            kwargs["put_quantity"],
+            kwargs["delta"],
+            kwargs["commission"],
+        )
+        for lo, hi in zip(bounds[:-1], bounds[1:])
+    ]
+    if workers == 1:
+        results = list(map(_simulate_shard, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_simulate_shard, tasks))
+    return {key: np.concatenate([r[key] for r in results]) for key in results[0].keys()}
+
+
+def ranked_table(grid, results, top=20):
+    order = np.argsort(-results["pnl"], kind="stable")[:top]
+    header = ["rank", *THRESHOLDS, "pnl", "trades", "max_drawdown"]
+    lines = [" ".join(f"{h:>17}" if h in THRESHOLDS else f"{h:>12}" for h in header)]
+    for rank, i in enumerate(order, 1):
+        values = [f"{rank:>12}"]
+        values += [f"{grid[t][i]:>17g}" for t in THRESHOLDS]
+        values += [
+            f"{results['pnl'][i]:>12.2f}",
+            f"{results['trades'][i]:>12d}",
+            f"{results['max_drawdown'][i]:>12.2f}",
+        ]
+        lines.append(" ".join(values))
+    return "\n".join(lines)
+
+
+def write_csv(path, grid, results):
+    order = np.argsort(-results["pnl"], kind="stable")
+    columns = [grid[t][order] for t in THRESHOLDS]
+    columns += [results[k][order] for k in ("pnl", "trades", "max_drawdown")]
+    np.savetxt(
+        path,
+        np.column_stack(columns),
+        delimiter=",",
+        header=",".join([*THRESHOLDS, "pnl", "trades", "max_drawdown"]),
+        comments="",
+        fmt="%g",
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logs", default="logs", help="Directory of NOPE logs")
+    parser.add_argument("--from", dest="from_date", default="", help="YYYY-MM-DD")
+    parser.add_argument("--to", dest="to_date", default="", help="YYYY-MM-DD")
+    parser.add_argument("--config", default="conf/conf.toml")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--csv", default="", help="Write every result here")
+    parser.add_argument("--commission", type=float, default=0.65)
+    defaults = {
+        "long_enter": "-100:-20:10",
+        "long_exit": "-60:20:10",
+        "short_enter": "20:100:10",
+        "short_exit": "-20:60:10",
+        "long_enter_limit": "-150:-70:20",
+        "short_enter_limit": "60:140:20",
+    }
+    for threshold, default in defaults.items():
+        parser.add_argument(
+            f"--{threshold.replace('_', '-')}",
+            default=default,
+            help=f"start:stop:step or a value (default {default})",
+        )
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        nope_config = toml.load(f)["nope"]
+    paths = [
+        p
+        for p in glob.glob(os.path.join(args.logs, "????-??-??.txt"))
+        if (not args.from_date or os.path.basename(p)[:10] >= args.from_date)
+        and (not args.to_date or os.path.basename(p)[:10] <= args.to_date)
+    ]
+    series = load_nope_series(paths)
+    if not len(series.nope):
+        print(f"No NOPE readings in {args.logs}")
+        return
+    grid = threshold_grid({t: parse_range(getattr(args, t)) for t in THRESHOLDS})
+
+    start = time.perf_counter()
+    results = grid_search(
+        series,
+        grid,
+        workers=args.workers,
+        call_limit=nope_config["call_limit"],
+        put_limit=nope_config["put_limit"],
+        call_quantity=nope_config["call_quantity"],
+        put_quantity=nope_config["put_quantity"],
+        delta=nope_config["auto_target_delta"] / 100,
+        commission=args.commission,
+    )
+    elapsed = time.perf_counter() - start
+    print(
+        f"{len(grid['long_enter'])} parameter sets x {len(series.nope)} readings "
+        f"({series.days} days) in {elapsed:.1f}s"
+    )
+    print(ranked_table(grid, results, args.top))
+    if args.csv:
+        write_csv(args.csv, grid, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import bisect
+import math
+import re
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+
+import numpy as np
+
+from nope.chain_recorder import ChainRecording
+from nope.greeks import SECONDS_PER_YEAR, black_scholes, expiry_close, is_call
+from nope.nope_calc import CALL, PUT, OptionChainArrays
+
+NOPE_LOG_LINE = re.compile(
+    r"NOPE @ (?P<nope>\S+) \| Stock Price @ (?P<price>\S+) \| "
+    r"(?P<dt>\d{4}-\d{2}-\d{2} at \d{2}:\d{2}:\d{2})"
+)
+
+
+class OptionQuotes:
+    """Columnar option quotes for one snapshot. Expiries are IB style
+    YYYYMMDD strings so they match Option.lastTradeDateOrContractMonth."""
+
+    def __init__(self, expiry, strike, right, bid, ask, delta, iv, index=None):
+        self.expiry = expiry
+        self.strike = strike
+        self.right = right
+        self.bid = bid
+        self.ask = ask
+        self.delta = delta
+        self.iv = iv
+        # Shared between snapshots with the same layout
+        self._index = index
+
+    def __len__(self):
+        return len(self.strike)
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = {
+                (e, float(k), r): i
+                for i, (e, k, r) in enumerate(zip(self.expiry, self.strike, self.right))
+            }
+        return self._index
+
+    def lookup(self, expiry, strike, right):
+        return self.index.get((expiry, float(strike), right))
+
+    def expirations(self):
+        return sorted(set(self.expiry))
+
+    def strikes(self):
+        return sorted(set(self.strike.tolist()))
+
+
+class Snapshot(NamedTuple):
+    time: datetime
+    nope: float
+    price: float
+    options: OptionQuotes
+
+
+class Replay:
+    """Snapshots ordered by time, looked up against a clock."""
+
+    def __init__(self, snapshots, clock):
+        self.snapshots = snapshots
+        self.clock = clock
+        self._times = [s.time for s in snapshots]
+
+    @property
+    def start(self):
+        return self._times[0]
+
+    @property
+    def end(self):
+        return self._times[-1]
+
+    def current(self) -> Snapshot:
+        idx = bisect.bisect_right(self._times, self.clock.now()) - 1
+        return self.snapshots[max(idx, 0)]
+
+
+class ReplayProvider:
+    """Stands in for QuestradeClient/TDAClient, returning recorded NOPE.
+
+    Each snapshot is returned once; fetches before the next one is due
+    return None, as a live provider never reports the same reading twice.
+    """
+
+    def __init__(self, replay: Replay):
+        self.replay = replay
+        self._last = None
+
+    async def get_nope(self):
+        snapshot = self.replay.current()
+        if snapshot is self._last:
+            return None
+        self._last = snapshot
+        return snapshot.nope, snapshot.price
+
+    def refresh_access_token(self):
+        pass
+
+
+def read_nope_log(path):
+    """(time, nope, price) rows from a logs/YYYY-MM-DD.txt NOPE log. Times
+    are local; readings logged before the first successful fetch are 0."""
+    rows = []
+    with open(path, "r") as f:
+        for line in f:
+            match = NOPE_LOG_LINE.search(line)
+            if match is None:
+                continue
+            nope, price = float(match["nope"]), float(match["price"])
+            if price == 0:
+                continue
+            dt = datetime.strptime(match["dt"], "%Y-%m-%d at %H:%M:%S")
+            rows.append((dt.astimezone(), nope, price))
+    return rows
+
+
+def trading_days(start, n):
+    days = []
+    day = start
+    while len(days) < n:
+        if day.weekday() < 5:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def snapshots_from_nope_log(
+    path, iv=0.2, n_expiries=10, strike_padding=30, half_spread=0.01
+):
+    """Snapshots for a day of NOPE logs. The log has no option data, so
+    quotes are Black-Scholes prices at a flat `iv` on daily expiries with
+    integer strikes, `half_spread` (fraction of price, min 1c) either side.
+    """
+    rows = read_nope_log(path)
+    if not rows:
+        return []
+    prices = [price for _, _, price in rows]
+    strikes = np.arange(
+        math.floor(min(prices)) - strike_padding,
+        math.ceil(max(prices)) + strike_padding + 1,
+        dtype=float,
+    )
+    expiries = [
+        d.strftime("%Y%m%d") for d in trading_days(rows[0][0].date(), n_expiries)
+    ]
+    expiry_closes = np.array([expiry_close(e) for e in expiries])
+    n = len(strikes)
+    expiry = np.repeat(expiries, 2 * n)
+    closes = np.repeat(expiry_closes, 2 * n)
+    strike = np.tile(strikes, 2 * len(expiries))
+    right = np.tile(np.repeat([CALL, PUT], n), len(expiries))
+    calls = is_call(right)
+    ivs = np.full(len(strike), iv)
+
+    snapshots = []
+    index = None
+    for dt, nope, price in rows:
+        years = (closes - dt.timestamp()) / SECONDS_PER_YEAR
+        value, delta = black_scholes(price, strike, years, ivs, calls)
+        spread = np.maximum(np.round(value * half_spread, 2), 0.01)
+        mid = np.round(value, 2)
+        options = OptionQuotes(
+            expiry,
+            strike,
+            right,
+            np.maximum(mid - spread, 0.0),
+            mid + spread,
+            delta,
+            ivs,
+            index,
+        )
+        index = options.index
+        snapshots.append(Snapshot(dt, nope, price, options))
+    return snapshots
+
+
+def _merge_partial(previous: OptionChainArrays, partial: OptionChainArrays):
+    # Expiries that were not refetched keep their last recorded quotes
+    stale = ~np.isin(previous.expiry, np.unique(partial.expiry))
+    return OptionChainArrays.concat([previous.select(stale), partial])
+
+
+def snapshots_from_recording(path):
+    """Snapshots for a day recorded by nope.chain_recorder.ChainRecorder."""
+    recording = ChainRecording(path)
+    snapshots = []
+    options = None
+    full_layout = None
+    # Merged layouts repeat, so expiry strings and lookup indexes are shared
+    layouts = {}
+    for i in range(len(recording)):
+        chain = recording.snapshot(i)
+        layout = int(recording.index[i]["layout"])
+        if chain.full or options is None:
+            options = chain.options
+            full_layout = layout
+            key = (layout,)
+        else:
+            options = _merge_partial(options, chain.options)
+            key = (full_layout, layout)
+        if key not in layouts:
+            expiry = np.char.replace(np.datetime_as_string(options.expiry), "-", "")
+            layouts[key] = (expiry, None)
+        expiry, index = layouts[key]
+        quotes = OptionQuotes(
+            expiry,
+            options.strike,
+            options.right,
+            options.bid,
+            options.ask,
+            options.delta,
+            options.iv,
+            index,
+        )
+        layouts[key] = (expiry, quotes.index)
+        time = datetime.fromtimestamp(
+            chain.time.astype("datetime64[ns]").astype(np.int64) / 1e9, timezone.utc
+        )
+        snapshots.append(Snapshot(time, chain.nope, chain.price, quotes))
+    return snapshots
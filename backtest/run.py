@@ -0,0 +1,206 @@
+import argparse
+import asyncio
+import os
+import time
+from typing import NamedTuple
+
+import toml
+
+from backtest.clock import VirtualClock, VirtualTimeLoop
+from backtest.replay import (
+    Replay,
+    ReplayProvider,
+    snapshots_from_nope_log,
+    snapshots_from_recording,
+)
+from backtest.sim_ib import SimIB
+from nope.nope_strategy import NopeStrategy
+from utils.log_writer import log_writer
+from utils.util import use_clock
+
+# Replays recorded data through NopeStrategy on a virtual clock.
+# Run from the repo root: python -m backtest.run logs/2021-03-01.txt
+# or, for a day recorded by the chain recorder, logs/chains/2021-03-01
+
+
+class BacktestResult(NamedTuple):
+    start: object
+    end: object
+    simulated_minutes: float
+    wall_seconds: float
+    orders_placed: int
+    orders_cancelled: int
+    fills: int
+    realized_pnl: float
+    unrealized_pnl: float
+    commission: float
+    open_positions: int
+
+    @property
+    def pnl(self):
+        return self.realized_pnl + self.unrealized_pnl
+
+    @property
+    def minutes_per_second(self):
+        return self.simulated_minutes / max(self.wall_seconds, 1e-9)
+
+    def report(self):
+        return (
+            f"{self.start:%Y-%m-%d %H:%M} - {self.end:%H:%M} | "
+            f"P&L {self.pnl:10.2f} (realized {self.realized_pnl:.2f}, "
+            f"unrealized {self.unrealized_pnl:.2f}, commission "
+            f"{self.commission:.2f}) | orders {self.orders_placed} "
+            f"fills {self.fills} cancelled {self.orders_cancelled} "
+            f"open {self.open_positions} | {self.simulated_minutes:.0f} sim min "
+            f"in {self.wall_seconds:.2f}s ({self.minutes_per_second:.0f} min/s)"
+        )
+
+
+class Backtest:
+    """Drives a real NopeStrategy against SimIB and a ReplayProvider.
+
+    Everything runs on one VirtualTimeLoop, so the strategy's periodic tasks,
+    order timeouts and stop-loss checks see simulated time and a trading day
+    replays as fast as the strategy code can run.
+    """
+
+    def __init__(
+        self, config, snapshots, cash=100_000.0, commission=0.65, fill_delay=1.0
+    ):
+        self.config = config
+        self.snapshots = snapshots
+        self.cash = cash
+        self.commission = commission
+        self.fill_delay = fill_delay
+
+    def run(self) -> BacktestResult:
+        clock = VirtualClock(self.snapshots[0].time)
+        loop = VirtualTimeLoop(clock)
+        replay = Replay(self.snapshots, clock)
+        ib = SimIB(
+            replay,
+            clock,
+            cash=self.cash,
+            commission=self.commission,
+            fill_delay=self.fill_delay,
+        )
+        fills = []
+        ib.execDetailsEvent += lambda trade, fill: fills.append(fill)
+
+        async def feed():
+            for snapshot in self.snapshots[1:]:
+                delay = (snapshot.time - clock.now()).total_seconds()
+                await asyncio.sleep(max(delay, 0))
+                ib.on_snapshot()
+
+        asyncio.set_event_loop(loop)
+        use_clock(clock.now)
+        wall_start = time.perf_counter()
+        try:
+            strategy = NopeStrategy(
+                self.config, ib, nope_provider=ReplayProvider(replay)
+            )
+            strategy.execute()
+            for coro in strategy.data_tasks():
+                loop.create_task(coro)
+            loop.run_until_complete(feed())
+        finally:
+            wall_seconds = time.perf_counter() - wall_start
+            for task in asyncio.all_tasks(loop):
+                task.cancel()
+            loop.run_until_complete(asyncio.sleep(0))
+            loop.close()
+            asyncio.set_event_loop(None)
+            use_clock(None)
+            log_writer.flush()
+
+        unrealized = ib.market_value() - sum(
+            p.position * p.avgCost for p in ib.positions()
+        )
+        return BacktestResult(
+            start=replay.start,
+            end=replay.end,
+            simulated_minutes=(replay.end - replay.start).total_seconds() / 60,
+            wall_seconds=wall_seconds,
+            orders_placed=ib.orders_placed,
+            orders_cancelled=ib.orders_cancelled,
+            fills=len(fills),
+            realized_pnl=ib.realized_pnl,
+            unrealized_pnl=unrealized,
+            commission=ib.total_commission,
+            open_positions=len(ib.positions()),
+        )
+
+
+def apply_overrides(config, overrides):
+    """Apply `section.key=value` overrides, values parsed as TOML."""
+    for override in overrides:
+        path, value = override.split("=", 1)
+        *sections, key = path.split(".")
+        target = config
+        for section in sections:
+            target = target[section]
+        target[key] = toml.loads(f"v = {value}")["v"]
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "days",
+        nargs="+",
+        help="logs/YYYY-MM-DD.txt NOPE logs or logs/chains/YYYY-MM-DD recordings",
+    )
+    parser.add_argument("--config", default="conf/conf.toml")
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="SECTION.KEY=VALUE",
+        help="Override a config value, e.g. --set nope.long_enter=-50",
+    )
+    parser.add_argument("--out", default="logs/backtest", help="Working directory")
+    parser.add_argument("--cash", type=float, default=100_000.0)
+    parser.add_argument("--commission", type=float, default=0.65)
+    parser.add_argument("--fill-delay", type=float, default=1.0)
+    parser.add_argument("--iv", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = apply_overrides(toml.load(f), args.set)
+    config["metrics"]["http_port"] = 0
+    paths = [os.path.abspath(p) for p in args.days]
+    # Keep trade logs and the contract cache away from the live ones
+    os.makedirs(os.path.join(args.out, "logs"), exist_ok=True)
+    os.chdir(args.out)
+
+    results = []
+    for path in paths:
+        if os.path.isdir(path):
+            snapshots = snapshots_from_recording(path)
+        else:
+            snapshots = snapshots_from_nope_log(path, iv=args.iv)
+        if not snapshots:
+            print(f"No snapshots in {path}")
+            continue
+        result = Backtest(
+            config,
+            snapshots,
+            cash=args.cash,
+            commission=args.commission,
+            fill_delay=args.fill_delay,
+        ).run()
+        results.append(result)
+        print(result.report())
+
+    if len(results) > 1:
+        minutes = sum(r.simulated_minutes for r in results)
+        wall = sum(r.wall_seconds for r in results)
+        print(
+            f"Total P&L {sum(r.pnl for r in results):.2f} over {len(results)} days, "
+            f"{minutes / max(wall, 1e-9):.0f} sim min/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
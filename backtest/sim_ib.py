@@ -0,0 +1,371 @@
+import asyncio
+import itertools
+import zlib
+
+from eventkit import Event
+from ib_insync import (
+    AccountValue,
+    CommissionReport,
+    Contract,
+    Execution,
+    Fill,
+    OptionChain,
+    OptionComputation,
+    Order,
+    OrderStatus,
+    Position,
+    Ticker,
+    Trade,
+    TradeLogEntry,
+)
+
+from backtest.clock import VirtualClock
+from backtest.replay import Replay
+
+MULTIPLIER = 100
+STOCK_CON_ID = 756733
+
+
+def sim_con_id(symbol, expiry, strike, right):
+    # Stable across runs, so a persisted ContractCache stays consistent
+    key = f"{symbol}|{expiry}|{float(strike)}|{right}"
+    return zlib.crc32(key.encode()) & 0x7FFFFFFF
+
+
+class SimIB:
+    """The subset of ib_insync.IB that NopeStrategy uses, backed by a replay.
+
+    Orders rest until the quotes cross them: buy limits fill at the limit
+    once it reaches the mid, sell limits once the mid reaches them, and sell
+    stops fill at the bid once the bid trades through the stop. Matching runs
+    `fill_delay` seconds after placement and on every new snapshot.
+    """
+
+    events = (
+        "newOrderEvent",
+        "openOrderEvent",
+        "orderStatusEvent",
+        "cancelOrderEvent",
+        "execDetailsEvent",
+        "positionEvent",
+        "accountValueEvent",
+    )
+
+    def __init__(
+        self,
+        replay: Replay,
+        clock: VirtualClock,
+        account="SIM",
+        cash=100_000.0,
+        commission=0.65,
+        fill_delay=1.0,
+    ):
+        for name in self.events:
+            setattr(self, name, Event(name))
+        self.replay = replay
+        self.clock = clock
+        self.account = account
+        self.initial_cash = cash
+        self.cash = cash
+        self.commission = commission
+        self.fill_delay = fill_delay
+        self.realized_pnl = 0.0
+        self.total_commission = 0.0
+        self.orders_placed = 0
+        self.orders_cancelled = 0
+        self._order_ids = itertools.count(1)
+        self._exec_ids = itertools.count(1)
+        self._trades = {}
+        self._positions = {}
+        self._streams = {}
+
+    # Connection and subscriptions
+
+    def isConnected(self):
+        return True
+
+    def reqMarketDataType(self, marketDataType):
+        pass
+
+    def reqAllOpenOrders(self):
+        pass
+
+    def reqPositions(self):
+        pass
+
+    def openTrades(self):
+        return [t for t in self._trades.values() if t.isActive()]
+
+    def positions(self):
+        return list(self._positions.values())
+
+    def accountValues(self, account=""):
+        return [self._buying_power()]
+
+    def _buying_power(self):
+        return AccountValue(self.account, "BuyingPower", str(self.cash), "USD", "")
+
+    # Contracts and market data
+
+    def _qualify(self, contract: Contract):
+        snapshot = self.replay.current()
+        if contract.secType == "STK":
+            contract.conId = STOCK_CON_ID
+            contract.primaryExchange = "ARCA"
+        elif contract.secType == "OPT":
+            idx = snapshot.options.lookup(
+                contract.lastTradeDateOrContractMonth, contract.strike, contract.right
+            )
+            if idx is None:
+                return False
+            contract.conId = sim_con_id(
+                contract.symbol,
+                contract.lastTradeDateOrContractMonth,
+                contract.strike,
+                contract.right,
+            )
+            contract.multiplier = str(MULTIPLIER)
+            contract.tradingClass = contract.tradingClass or contract.symbol
+        else:
+            return False
+        contract.currency = "USD"
+        return True
+
+    def qualifyContracts(self, *contracts):
+        return [c for c in contracts if self._qualify(c)]
+
+    async def qualifyContractsAsync(self, *contracts):
+        return self.qualifyContracts(*contracts)
+
+    async def reqSecDefOptParamsAsync(
+        self, underlyingSymbol, futFopExchange, underlyingSecType, underlyingConId
+    ):
+        options = self.replay.current().options
+        return [
+            OptionChain(
+                "SMART",
+                underlyingConId,
+                underlyingSymbol,
+                str(MULTIPLIER),
+                options.expirations(),
+                options.strikes(),
+            )
+        ]
+
+    def _update_ticker(self, ticker: Ticker):
+        snapshot = self.replay.current()
+        contract = ticker.contract
+        ticker.time = self.clock.now()
+        nan = float("nan")
+        if contract.secType == "STK":
+            price = snapshot.price
+            ticker.bid, ticker.ask, ticker.last = price - 0.01, price + 0.01, price
+            ticker.bidSize = ticker.askSize = 100
+            return ticker
+        options = snapshot.options
+        idx = options.lookup(
+            contract.lastTradeDateOrContractMonth, contract.strike, contract.right
+        )
+        if idx is None:
+            ticker.bid = ticker.ask = ticker.last = nan
+            ticker.modelGreeks = None
+            return ticker
+        bid, ask = float(options.bid[idx]), float(options.ask[idx])
+        ticker.bid, ticker.ask, ticker.last = bid, ask, nan
+        ticker.bidSize = ticker.askSize = 10
+        ticker.modelGreeks = OptionComputation(
+            float(options.iv[idx]),
+            float(options.delta[idx]),
+            (bid + ask) / 2,
+            0.0,
+            None,
+            None,
+            None,
+            snapshot.price,
+        )
+        return ticker
+
+    async def reqTickersAsync(self, *contracts):
+        return [self._update_ticker(Ticker(contract=c)) for c in contracts]
+
+    def reqMktData(self, contract, *args, **kwargs):
+        ticker = self._streams.get(contract.conId)
+        if ticker is None:
+            ticker = self._streams[contract.conId] = Ticker(contract=contract)
+        return self._update_ticker(ticker)
+
+    def cancelMktData(self, contract):
+        self._streams.pop(contract.conId, None)
+
+    def on_snapshot(self):
+        for ticker in self._streams.values():
+            self._update_ticker(ticker)
+        for trade in self.openTrades():
+            self._match(trade)
+
+    # Orders
+
+    def placeOrder(self, contract: Contract, order: Order):
+        now = self.clock.now()
+        trade = self._trades.get(order.orderId)
+        if trade is not None and trade.isActive():
+            # As in TWS, placing an order with a live orderId modifies it
+            trade.log.append(TradeLogEntry(now, OrderStatus.Submitted, "Modify"))
+            trade.orderStatus.remaining = order.totalQuantity
+            self.openOrderEvent.emit(trade)
+            asyncio.get_event_loop().call_later(self.fill_delay, self._match, trade)
+            return trade
+        order.orderId = next(self._order_ids)
+        order.permId = order.orderId
+        status = OrderStatus(
+            orderId=order.orderId,
+            status=OrderStatus.Submitted,
+            remaining=order.totalQuantity,
+        )
+        trade = Trade(
+            contract,
+            order,
+            status,
+            [],
+            [
+                TradeLogEntry(now, OrderStatus.PendingSubmit, ""),
+                TradeLogEntry(now, OrderStatus.Submitted, ""),
+            ],
+        )
+        self._trades[order.orderId] = trade
+        self.orders_placed += 1
+        self.newOrderEvent.emit(trade)
+        # Never fill inside placeOrder, callers attach fill handlers after
+        asyncio.get_event_loop().call_later(self.fill_delay, self._match, trade)
+        return trade
+
+    def cancelOrder(self, order: Order):
+        trade = self._trades.get(order.orderId)
+        if trade is None or trade.isDone():
+            return trade
+        trade.orderStatus.status = OrderStatus.Cancelled
+        trade.log.append(TradeLogEntry(self.clock.now(), OrderStatus.Cancelled, ""))
+        self.orders_cancelled += 1
+        trade.cancelEvent.emit(trade)
+        trade.statusEvent.emit(trade)
+        self.cancelOrderEvent.emit(trade)
+        self.orderStatusEvent.emit(trade)
+        trade.cancelledEvent.emit(trade)
+        return trade
+
+    def _quote(self, contract):
+        options = self.replay.current().options
+        idx = options.lookup(
+            contract.lastTradeDateOrContractMonth, contract.strike, contract.right
+        )
+        if idx is None:
+            return None
+        return float(options.bid[idx]), float(options.ask[idx])
+
+    def _match(self, trade: Trade):
+        if not trade.isActive():
+            return
+        quote = self._quote(trade.contract)
+        if quote is None:
+            return
+        bid, ask = quote
+        mid = (bid + ask) / 2
+        order = trade.order
+        price = None
+        if order.orderType == "LMT":
+            if order.action == "BUY" and order.lmtPrice >= mid:
+                price = order.lmtPrice
+            elif order.action == "SELL" and order.lmtPrice <= mid:
+                price = order.lmtPrice
+        elif order.orderType == "STP":
+            if order.action == "SELL" and bid <= order.auxPrice:
+                price = bid
+            elif order.action == "BUY" and ask >= order.auxPrice:
+                price = ask
+        elif order.orderType == "MKT":
+            price = ask if order.action == "BUY" else bid
+        if price is not None:
+            self._fill(trade, price)
+
+    def _fill(self, trade: Trade, price):
+        now = self.clock.now()
+        contract, order = trade.contract, trade.order
+        shares = order.totalQuantity
+        exec_id = f"sim.{next(self._exec_ids)}"
+        side = "BOT" if order.action == "BUY" else "SLD"
+        commission = self.commission * shares
+        execution = Execution(
+            execId=exec_id,
+            time=now,
+            acctNumber=self.account,
+            exchange="SMART",
+            side=side,
+            shares=shares,
+            price=price,
+            permId=order.permId,
+            orderId=order.orderId,
+            cumQty=shares,
+            avgPrice=price,
+        )
+        fill = Fill(
+            contract,
+            execution,
+            CommissionReport(exec_id, commission, "USD"),
+            now,
+        )
+        self._book_fill(contract, side, shares, price, commission)
+
+        trade.fills.append(fill)
+        trade.orderStatus.status = OrderStatus.Filled
+        trade.orderStatus.filled = shares
+        trade.orderStatus.remaining = 0
+        trade.orderStatus.avgFillPrice = price
+        trade.orderStatus.lastFillPrice = price
+        trade.log.append(TradeLogEntry(now, OrderStatus.Filled, ""))
+
+        self.execDetailsEvent.emit(trade, fill)
+        trade.fillEvent.emit(trade, fill)
+        position = self._positions.get(contract.conId)
+        if position is not None:
+            self.positionEvent.emit(position)
+        else:
+            self.positionEvent.emit(Position(self.account, contract, 0, 0.0))
+        self.accountValueEvent.emit(self._buying_power())
+        self.orderStatusEvent.emit(trade)
+        trade.statusEvent.emit(trade)
+        trade.filledEvent.emit(trade)
+
+    def _book_fill(self, contract, side, shares, price, commission):
+        held = self._positions.get(contract.conId)
+        position = held.position if held else 0
+        avg_cost = held.avgCost if held else 0.0
+        cost = price * MULTIPLIER
+        self.total_commission += commission
+        if side == "BOT":
+            self.cash -= cost * shares + commission
+            new_position = position + shares
+            avg_cost = (avg_cost * position + cost * shares) / new_position
+        else:
+            self.cash += cost * shares - commission
+            new_position = position - shares
+            self.realized_pnl += (cost - avg_cost) * min(shares, position)
+        self.realized_pnl -= commission
+        if new_position == 0:
+            self._positions.pop(contract.conId, None)
+        else:
+            self._positions[contract.conId] = Position(
+                self.account, contract, new_position, avg_cost
+            )
+
+    # Reporting
+
+    def market_value(self):
+        value = 0.0
+        for position in self._positions.values():
+            quote = self._quote(position.contract)
+            if quote is not None:
+                value += position.position * (quote[0] + quote[1]) / 2 * MULTIPLIER
+        return value
+
+    def equity(self):
+        return self.cash + self.market_value()
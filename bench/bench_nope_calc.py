@@ -0,0 +1,145 @@
+import timeit
+from datetime import datetime, timezone
+from functools import reduce
+
+from nope.greeks import ChainGreeks
+from nope.nope_calc import (
+    ChainLayout,
+    OptionChainArrays,
+    questrade_total_delta,
+)
+from sim.chains import questrade_payloads, tda_payload
+
+# Run from the repo root: python -m bench.bench_nope_calc
+
+
+def legacy_questrade_total_delta(call_option_quotes, put_option_quotes):
+    total_call_delta = sum(
+        map(lambda q: q["volume"] * q["delta"], call_option_quotes["optionQuotes"])
+    )
+    total_put_delta = sum(
+        map(lambda q: q["volume"] * q["delta"], put_option_quotes["optionQuotes"])
+    )
+    return total_call_delta + total_put_delta
+
+
+def legacy_tda_total_delta(chain):
+    def add(x, y):
+        return x + y
+
+    def gen_deltas_at_exp(type):
+        chain_map_key = f"{type}ExpDateMap"
+        for exp_date in chain[chain_map_key]:
+
+            def delta_factor(q):
+                return q["delta"] * q["totalVolume"]
+
+            yield reduce(
+                add,
+                (
+                    delta_factor(chain[chain_map_key][exp_date][strike][0])
+                    for strike in chain[chain_map_key][exp_date].keys()
+                ),
+            )
+
+    return reduce(add, gen_deltas_at_exp("call")) + reduce(
+        add, gen_deltas_at_exp("put")
+    )
+
+
+def questrade_arrays_total_delta(
+    chain, call_option_quotes, put_option_quotes, previous=None
+):
+    layout = ChainLayout.from_questrade(chain, previous=previous)
+    options = OptionChainArrays.concat(
+        OptionChainArrays.from_questrade(layout, quotes["optionQuotes"])
+        for quotes in (call_option_quotes, put_option_quotes)
+    )
+    return options.total_delta()
+
+
+def tda_total_delta(chain):
+    return OptionChainArrays.from_tda(chain).total_delta()
+
+
+def report(name, fn, number):
+    best = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    print(f"{name:<40} {best * 1000:8.2f} ms")
+    return best
+
+
+def main(n_expiries=40, n_strikes=300, number=20):
+    print(f"Chain: {n_expiries} expiries x {n_strikes} strikes x 2 rights")
+    chain, calls, puts = questrade_payloads(n_expiries=n_expiries, n_strikes=n_strikes)
+    tda_chain = tda_payload(n_expiries=n_expiries, n_strikes=n_strikes)
+
+    assert (
+        abs(
+            legacy_questrade_total_delta(calls, puts)
+            - questrade_arrays_total_delta(chain, calls, puts)
+        )
+        < 1e-6
+    )
+    quotes = calls["optionQuotes"] + puts["optionQuotes"]
+    assert (
+        abs(legacy_questrade_total_delta(calls, puts) - questrade_total_delta(quotes))
+        < 1e-6
+    )
+    assert abs(legacy_tda_total_delta(tda_chain) - tda_total_delta(tda_chain)) < 1e-6
+
+    layout = ChainLayout.from_questrade(chain)
+    options = OptionChainArrays.concat(
+        OptionChainArrays.from_questrade(layout, q["optionQuotes"])
+        for q in (calls, puts)
+    )
+
+    report(
+        "questrade legacy map/sum",
+        lambda: legacy_questrade_total_delta(calls, puts),
+        number,
+    )
+    # Without incremental mode, computed deltas or recording only the total
+    # is needed
+    report(
+        "questrade total only",
+        lambda: questrade_total_delta(quotes),
+        number,
+    )
+    report(
+        "questrade layout + pack + reduce",
+        lambda: questrade_arrays_total_delta(chain, calls, puts),
+        number,
+    )
+    report(
+        "questrade same chain + pack + reduce",
+        lambda: questrade_arrays_total_delta(chain, calls, puts, previous=layout),
+        number,
+    )
+    report(
+        "questrade pack + reduce, cached layout",
+        lambda: OptionChainArrays.concat(
+            OptionChainArrays.from_questrade(layout, q["optionQuotes"])
+            for q in (calls, puts)
+        ).total_delta(),
+        number,
+    )
+    report("questrade reduce only", options.total_delta, number)
+    report("tda legacy reduce", lambda: legacy_tda_total_delta(tda_chain), number)
+    report("tda pack + reduce", lambda: tda_total_delta(tda_chain), number)
+    report("per-expiry breakdown", lambda: options.nope_by_expiry(1e7), number)
+    report("per-strike breakdown", lambda: options.nope_by_strike(1e7), number)
+
+    priced = OptionChainArrays.concat(
+        OptionChainArrays.from_questrade(layout, q["optionQuotes"], prices=True)
+        for q in (calls, puts)
+    )
+    now = datetime.now(timezone.utc).timestamp()
+    report(
+        "computed deltas",
+        lambda: ChainGreeks().apply(priced, 400.0, now),
+        number,
+    )
+
+
+if __name__ == "__main__":
+    main()
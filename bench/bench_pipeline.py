@@ -0,0 +1,302 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import timeit
+from datetime import datetime
+
+import toml
+from ib_insync import LimitOrder, Option
+
+from backtest.clock import VirtualClock
+from backtest.replay import Replay, ReplayProvider, snapshots_from_nope_log
+from backtest.sim_ib import SimIB
+from nope.nope_strategy import NopeStrategy
+from qt.qtrade_client import QuestradeClient
+from sim.chains import tda_payload
+from sim.questrade_stub import QuestradeStub
+from utils.log_writer import log_writer
+
+# Signal-to-order pipeline benchmarks: NOPE fetch and parsing, contract
+# filtering and selection, position book queries and a full entry cycle,
+# the IB side against backtest.sim_ib.SimIB. Results are saved per commit to
+# bench/results/<commit>.json. Run from the repo root:
+#   python -m bench.bench_pipeline --compare <older commit>
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def report(name, fn, number, results):
+    best = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    print(f"{name:<45} {best * 1000:9.3f} ms")
+    results[name] = best
+    return best
+
+
+def git_commit():
+    def git(*args):
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True, check=True
+        ).stdout.strip()
+
+    try:
+        commit = git("rev-parse", "--short", "HEAD")
+        dirty = bool(git("status", "--porcelain", "--untracked-files=no"))
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+class _Response:
+    def __init__(self, payload):
+        self.content = json.dumps(payload).encode()
+
+
+class _TDAPayloadClient:
+    # Answers tda-api's get_option_chain/get_quote with fixed payloads,
+    # encoded once per date window
+    def __init__(self, chain, price):
+        self.chain = chain
+        self.quote = _Response({"SPY": {"lastPrice": price, "totalVolume": 50_000_000}})
+        self._windows = {}
+
+    def get_option_chain(self, symbol, from_date=None, to_date=None):
+        key = (from_date, to_date)
+        if key not in self._windows:
+            window = dict(self.chain)
+            for chain_map_key in ("callExpDateMap", "putExpDateMap"):
+                window[chain_map_key] = {
+                    exp_date: strikes
+                    for exp_date, strikes in self.chain[chain_map_key].items()
+                    if (from_date is None or exp_date[:10] >= from_date.isoformat())
+                    and (to_date is None or exp_date[:10] <= to_date.isoformat())
+                }
+            self._windows[key] = _Response(window)
+        return self._windows[key]
+
+    def get_quote(self, symbol):
+        return self.quote
+
+
+def bench_questrade(loop, n_expiries, n_strikes, number, results):
+    stub = QuestradeStub(n_expiries=n_expiries, n_strikes=n_strikes).start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            client = QuestradeClient(
+                stub.write_token_yaml(os.path.join(tmp, "access_token.yml")),
+                refresh_on_start=False,
+            )
+            report(
+                "questrade get_nope (local stub)",
+                lambda: loop.run_until_complete(client.get_nope()),
+                number,
+                results,
+            )
+    finally:
+        stub.stop()
+
+
+def bench_tda(loop, n_expiries, n_strikes, number, results):
+    try:
+        from tda.tda_client import TDAClient, expiry_windows
+    except ImportError as e:
+        print(f"{'tda get_nope (payload parsing)':<45} skipped, {e}")
+        return
+    client = TDAClient.__new__(TDAClient)
+    client.incremental = None
+    client.recorder = None
+    client.greeks = None
+    client.requests = 0
+    client.ticker = "SPY"
+    client.limiter = None
+    client._decode_lock = threading.Lock()
+    client.client = _TDAPayloadClient(
+        tda_payload(n_expiries=n_expiries, n_strikes=n_strikes), 400.0
+    )
+    for name, windows in (("one request", []), ("expiry windows", expiry_windows)):
+        client.windows = windows
+        report(
+            f"tda get_nope ({name})",
+            lambda: loop.run_until_complete(client.get_nope()),
+            number,
+            results,
+        )
+
+
+def make_strategy(config, tmp, n_expiries, strike_padding):
+    nope_log = os.path.join(tmp, "nope.txt")
+    with open(nope_log, "w") as f:
+        f.write("NOPE @ -70 | Stock Price @ 400.0 | 2021-03-02 at 10:00:00\n")
+    snapshots = snapshots_from_nope_log(
+        nope_log, n_expiries=n_expiries, strike_padding=strike_padding
+    )
+    clock = VirtualClock(snapshots[0].time)
+    replay = Replay(snapshots, clock)
+    ib = SimIB(replay, clock)
+    strategy = NopeStrategy(config, ib, nope_provider=ReplayProvider(replay))
+    strategy.execute()
+    # As after the first NOPE reading
+    strategy._underlying_price = snapshots[0].price
+    for task in strategy.get_tasks_dict().values():
+        task.cancel()
+    return strategy, ib, snapshots[0].options
+
+
+def bench_ib(loop, config, n_expiries, strike_padding, n_trades, number, results):
+    strategy, ib, options = make_strategy(
+        config, os.getcwd(), n_expiries, strike_padding
+    )
+
+    def run(coro):
+        return loop.run_until_complete(coro)
+
+    report(
+        "find_eligible_contracts",
+        lambda: run(strategy.find_eligible_contracts("SPY", "C")),
+        number,
+        results,
+    )
+
+    # Every call strike over 5 expiries, as select_contract sees them when
+    # the strike window is wide
+    expirations = options.expirations()[:5]
+    contracts = [
+        Option("SPY", expiry, strike, "C", "SMART", tradingClass="SPY")
+        for expiry in expirations
+        for strike in options.strikes()
+    ]
+    run(strategy.select_contract(contracts, "C"))
+    report(
+        f"select_contract, {len(contracts)} candidates",
+        lambda: run(strategy.select_contract(contracts, "C")),
+        number,
+        results,
+    )
+
+    # Hundreds of open orders and positions in the book
+    qualified = ib.qualifyContracts(*contracts)
+    held, resting = qualified[: n_trades // 2], qualified[n_trades // 2 : n_trades]
+    for contract in held:
+        _, ask = ib._quote(contract)
+        ib.placeOrder(contract, LimitOrder("BUY", 1, ask))
+    ib.on_snapshot()
+    for contract in resting:
+        ib.placeOrder(contract, LimitOrder("BUY", 1, 0.01))
+    print(
+        f"{'':<45} {len(ib.openTrades())} open trades, "
+        f"{len(ib.positions())} positions"
+    )
+    report("get_total_buys", lambda: strategy.get_total_buys("C"), number * 10, results)
+    report(
+        "get_existing_order_ids",
+        lambda: strategy.get_existing_order_ids("C", "BUY"),
+        number * 10,
+        results,
+    )
+    report(
+        "get_held_contracts_info",
+        lambda: strategy.get_held_contracts_info("C"),
+        number * 10,
+        results,
+    )
+
+    strategy._nope_value = (
+        config["nope"]["long_enter"] + config["nope"]["long_enter_limit"]
+    ) / 2
+    report(
+        "enter_positions -> placeOrder",
+        lambda: run(strategy.enter_positions()),
+        number,
+        results,
+    )
+
+
+def compare(results, ref):
+    paths = sorted(glob.glob(os.path.join(RESULTS_DIR, f"{ref}*.json")))
+    if not paths:
+        print(f"No saved results for {ref}")
+        return
+    with open(paths[0], "r") as f:
+        saved = json.load(f)
+    print(f"\nvs {saved['commit']} ({saved['date']})")
+    for name, best in results.items():
+        before = saved["results"].get(name)
+        if before:
+            print(
+                f"{name:<45} {before * 1000:9.3f} ms -> {best * 1000:9.3f} ms "
+                f"({best / before:5.2f}x)"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="conf/conf.toml")
+    parser.add_argument("--expiries", type=int, default=40)
+    parser.add_argument("--strikes", type=int, default=300)
+    parser.add_argument("--trades", type=int, default=600)
+    parser.add_argument("--number", type=int, default=10)
+    parser.add_argument("--compare", default="", help="Commit to compare against")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = toml.load(f)
+    config["metrics"]["enabled"] = False
+    config["market_data"]["max_lines"] = 0
+    config["nope"]["call_limit"] = 10**9
+    config["ib"]["account"] = ""
+    commit = git_commit()
+
+    print(f"Chain: {args.expiries} expiries x {args.strikes} strikes x 2 rights")
+    results = {}
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    bench_questrade(loop, args.expiries, args.strikes, args.number, results)
+    bench_tda(loop, args.expiries, args.strikes, args.number, results)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # The strategy writes trade logs and the contract cache under logs/
+        os.makedirs(os.path.join(tmp, "logs"))
+        os.chdir(tmp)
+        try:
+            bench_ib(
+                loop,
+                config,
+                args.expiries,
+                args.strikes // 2,
+                args.trades,
+                args.number,
+                results,
+            )
+            log_writer.flush()
+        finally:
+            os.chdir(cwd)
+
+    if args.compare:
+        compare(results, args.compare)
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{commit}.json")
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "commit": commit,
+                    "date": datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "args": vars(args),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+        print(f"Saved {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import sys
 
 import toml
 from ib_insync import IB, IBC, Watchdog, util
@@ -8,7 +9,9 @@ from nope.nope_strategy import NopeStrategy
 
 util.patchAsyncio()
 
-with open("conf/conf.toml", "r") as f:
+# A config per IB account, e.g. python main.py conf/account2.toml
+config_path = sys.argv[1] if len(sys.argv) > 1 else "conf/conf.toml"
+with open(config_path, "r") as f:
     config = toml.load(f)
 
 if config["debug"]["enabled"]:
@@ -17,15 +20,18 @@ if config["debug"]["enabled"]:
 
 
 def onConnect():
-    nope_strategy.execute()
+    for nope_strategy in nope_strategies:
+        nope_strategy.execute()
 
 
 def onDisconnect():
-    restart_tasks = ["run_ib", "check_orders"]
-    tasks = nope_strategy.get_tasks_dict()
-    for task_name in restart_tasks:
-        task = tasks.pop(task_name)
-        task.cancel()
+    restart_tasks = ["run_ib", "stop_loss_sync"]
+    for nope_strategy in nope_strategies:
+        tasks = nope_strategy.get_tasks_dict()
+        for task_name in restart_tasks:
+            task = tasks.pop(task_name, None)
+            if task is not None:
+                task.cancel()
 
 
 ibc = IBC(978, tradingMode="paper")
@@ -33,8 +39,11 @@ ib = IB()
 ib.connectedEvent += onConnect
 ib.disconnectedEvent += onDisconnect
 
-nope_strategy = NopeStrategy(config, ib)
+# One strategy per configured symbol
+nope_strategies = NopeStrategy.for_symbols(config, ib)
 
-watchdog = Watchdog(ibc, ib)
+watchdog = Watchdog(
+    ibc, ib, port=config["ib"]["port"], clientId=config["ib"]["client_id"]
+)
 watchdog.start()
 ib.run()
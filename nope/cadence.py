@@ -0,0 +1,102 @@
+import math
+from collections import deque
+
+THRESHOLDS = (
+    "long_enter",
+    "long_exit",
+    "short_enter",
+    "short_exit",
+    "long_enter_limit",
+    "short_enter_limit",
+)
+
+
+class AdaptiveCadence:
+    """Picks the interval between NOPE fetches and position checks.
+
+    Within `near_distance` of any entry/exit threshold the interval is
+    `min_seconds`. Further out it is half the time NOPE would take to reach
+    that band at its recent speed, up to `max_seconds`. With
+    `max_requests_per_hour`, the interval never runs the provider above that
+    quota, measured in provider requests (HTTP calls) per fetch.
+    """
+
+    def __init__(
+        self,
+        thresholds,
+        min_seconds=15.0,
+        max_seconds=60.0,
+        near_distance=10.0,
+        max_requests_per_hour=0,
+        alpha=0.3,
+    ):
+        self.thresholds = list(thresholds)
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.near_distance = near_distance
+        self.max_requests_per_hour = max_requests_per_hour
+        self.alpha = alpha
+        self.interval = max_seconds
+        self.distance = math.inf
+        # EWMA of |dNOPE/dt| in NOPE points per second
+        self.velocity = 0.0
+        self._last = None
+        # (time, requests) per fetch over the last hour
+        self._requests = deque()
+
+    @classmethod
+    def from_config(cls, config):
+        cadence_config = config["cadence"]
+        # The hourly quota is shared by every symbol's fetches
+        symbols = len(config["nope"]["symbols"])
+        return cls(
+            [config["nope"][t] for t in THRESHOLDS],
+            min_seconds=cadence_config["min_seconds"],
+            max_seconds=cadence_config["max_seconds"],
+            near_distance=cadence_config["near_distance"],
+            max_requests_per_hour=cadence_config["max_requests_per_hour"] // symbols,
+        )
+
+    def requests_per_hour(self):
+        return sum(n for _, n in self._requests)
+
+    def _quota_interval(self, now, requests):
+        if not self.max_requests_per_hour:
+            return 0.0
+        # Steady state at this many requests per fetch, and if the last hour
+        # is already over quota, wait for its oldest requests to age out
+        interval = requests * 3600 / self.max_requests_per_hour
+        used = self.requests_per_hour()
+        for t, n in self._requests:
+            if used + requests <= self.max_requests_per_hour:
+                break
+            used -= n
+            interval = max(interval, t + 3600 - now)
+        return interval
+
+    def record_requests(self, now, requests):
+        self._requests.append((now, requests))
+        while self._requests and self._requests[0][0] <= now - 3600:
+            self._requests.popleft()
+
+    def update(self, nope, now, requests=1):
+        """Record a fetch that took `requests` provider requests and returned
+        `nope` (None if it failed) at loop time `now`; returns the interval
+        until the next one."""
+        self.record_requests(now, requests)
+        if nope is not None:
+            if self._last is not None and now > self._last[0]:
+                speed = abs(nope - self._last[1]) / (now - self._last[0])
+                self.velocity += self.alpha * (speed - self.velocity)
+            self._last = (now, nope)
+            self.distance = min(abs(nope - t) for t in self.thresholds)
+
+        if self.distance <= self.near_distance:
+            interval = self.min_seconds
+        elif self.velocity > 0:
+            interval = (self.distance - self.near_distance) / self.velocity / 2
+        else:
+            interval = self.max_seconds
+        interval = min(max(interval, self.min_seconds), self.max_seconds)
+        self.interval = max(interval, self._quota_interval(now, requests))
+        return self.interval
@@ -0,0 +1,238 @@
+import os
+import threading
+from collections import deque
+from typing import NamedTuple
+
+import numpy as np
+
+from nope.nope_calc import CALL, PUT, OptionChainArrays
+
+# One directory per trading day. Every column is an append-only raw file that
+# np.memmap can open without copying. The chain layout (expiry, strike,
+# right) rarely changes during a day, so it is stored once per change rather
+# than once per snapshot.
+QUOTE_COLUMNS = {
+    "delta": np.float32,
+    "volume": np.float32,
+    "bid": np.float32,
+    "ask": np.float32,
+    "iv": np.float32,
+}
+LAYOUT_COLUMNS = {
+    "expiry": np.int32,  # days since the epoch
+    "strike": np.float32,
+    "right": np.uint8,  # 1 for calls
+}
+INDEX_DTYPE = np.dtype(
+    [
+        ("time", np.int64),  # ns since the epoch, UTC
+        ("offset", np.int64),
+        ("count", np.int64),
+        ("layout", np.int64),
+        ("price", np.float64),
+        ("volume", np.float64),
+        ("nope", np.float64),
+        ("full", np.bool_),
+    ]
+)
+LAYOUT_INDEX_DTYPE = np.dtype([("offset", np.int64), ("count", np.int64)])
+
+
+class ChainSnapshot(NamedTuple):
+    time: np.datetime64
+    price: float
+    volume: float
+    nope: float
+    # False when only near-dated expiries were refetched this cycle
+    full: bool
+    options: OptionChainArrays
+
+
+def _append(path, array):
+    with open(path, "ab") as f:
+        f.write(np.ascontiguousarray(array).tobytes())
+
+
+def _memmap(path, dtype):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+class ChainRecorder:
+    """Appends each fetched chain to `root/YYYY-MM-DD/` from a background
+    thread. record() only queues the arrays, so the fetch path never waits
+    on the disk; when `max_pending` snapshots are queued the oldest is
+    dropped and counted in `dropped`.
+    """
+
+    def __init__(self, root="logs/chains", max_pending=120):
+        self.root = root
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._pending = deque()
+        self._busy = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self._day = None
+        # Layout bytes to layout id for the current day. Incremental fetches
+        # alternate between the full and the near-dated layout
+        self._layouts = {}
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="chain-recorder", daemon=True
+                )
+                self._thread.start()
+
+    def record(self, time, options: OptionChainArrays, price, volume, nope, full=True):
+        """`time` is an aware datetime."""
+        self.start()
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                self._pending.popleft()
+                self.dropped += 1
+            self._pending.append((time, options, price, volume, nope, full))
+            self._cond.notify()
+
+    def flush(self):
+        with self._cond:
+            self._cond.wait_for(lambda: not self._pending and not self._busy)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                item = self._pending.popleft()
+                self._busy = True
+            try:
+                self._write(*item)
+            except OSError as e:
+                print(f"Error recording chain: {e}")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _write(self, time, options: OptionChainArrays, price, volume, nope, full):
+        day = time.astimezone().strftime("%Y-%m-%d")
+        path = os.path.join(self.root, day)
+        if day != self._day:
+            os.makedirs(path, exist_ok=True)
+            self._day = day
+            recording = ChainRecording(path)
+            self._layouts = {
+                _layout_key(recording.layout(i)): i
+                for i in range(len(recording.layouts))
+            }
+
+        n = len(options)
+        layout = (
+            options.expiry.astype(np.int32),
+            options.strike.astype(np.float32),
+            (options.right == CALL).astype(np.uint8),
+        )
+        key = _layout_key(layout)
+        layout_id = self._layouts.get(key)
+        if layout_id is None:
+            layout_offset = _size(path, "expiry", np.int32)
+            for name, column in zip(LAYOUT_COLUMNS, layout):
+                _append(os.path.join(path, f"{name}.bin"), column)
+            _append(
+                os.path.join(path, "layouts.bin"),
+                np.array([(layout_offset, n)], dtype=LAYOUT_INDEX_DTYPE),
+            )
+            layout_id = self._layouts[key] = len(self._layouts)
+
+        offset = _size(path, "delta", np.float32)
+        nan = np.full(n, np.nan)
+        for name, dtype in QUOTE_COLUMNS.items():
+            column = getattr(options, name)
+            column = nan if column is None else column
+            _append(os.path.join(path, f"{name}.bin"), column.astype(dtype))
+        # The index row goes last, readers never see a partial snapshot
+        entry = np.array(
+            [
+                (
+                    int(time.timestamp() * 1e9),
+                    offset,
+                    n,
+                    layout_id,
+                    price,
+                    volume,
+                    nope,
+                    full,
+                )
+            ],
+            dtype=INDEX_DTYPE,
+        )
+        _append(os.path.join(path, "index.bin"), entry)
+
+
+def _layout_key(layout):
+    return b"".join(np.ascontiguousarray(column).tobytes() for column in layout)
+
+
+def _size(path, name, dtype):
+    column = os.path.join(path, f"{name}.bin")
+    if not os.path.exists(column):
+        return 0
+    return os.path.getsize(column) // np.dtype(dtype).itemsize
+
+
+class ChainRecording:
+    """Read side of one day recorded by ChainRecorder. `columns` are
+    read-only memory maps, so opening a day costs nothing up front;
+    snapshot(i) packs one snapshot into OptionChainArrays."""
+
+    def __init__(self, path):
+        self.path = path
+        self.index = _memmap(os.path.join(path, "index.bin"), INDEX_DTYPE)
+        self.layouts = _memmap(os.path.join(path, "layouts.bin"), LAYOUT_INDEX_DTYPE)
+        self.columns = {
+            name: _memmap(os.path.join(path, f"{name}.bin"), dtype)
+            for name, dtype in {**QUOTE_COLUMNS, **LAYOUT_COLUMNS}.items()
+        }
+
+    def __len__(self):
+        return len(self.index)
+
+    def times(self):
+        return self.index["time"].astype("datetime64[ns]")
+
+    def layout(self, layout_id):
+        offset, count = self.layouts[layout_id]
+        return tuple(
+            self.columns[name][offset : offset + count] for name in LAYOUT_COLUMNS
+        )
+
+    def snapshot(self, i) -> ChainSnapshot:
+        entry = self.index[i]
+        offset, count = entry["offset"], entry["count"]
+        expiry, strike, right = self.layout(entry["layout"])
+        quotes = {
+            name: self.columns[name][offset : offset + count] for name in QUOTE_COLUMNS
+        }
+        options = OptionChainArrays(
+            quotes["delta"],
+            quotes["volume"],
+            expiry.astype("datetime64[D]"),
+            strike,
+            np.where(right == 1, CALL, PUT),
+            bid=quotes["bid"],
+            ask=quotes["ask"],
+            iv=quotes["iv"],
+        )
+        return ChainSnapshot(
+            np.datetime64(int(entry["time"]), "ns"),
+            float(entry["price"]),
+            float(entry["volume"]),
+            float(entry["nope"]),
+            bool(entry["full"]),
+            options,
+        )
+
+    def __iter__(self):
+        return (self.snapshot(i) for i in range(len(self)))
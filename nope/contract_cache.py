@@ -0,0 +1,149 @@
+import json
+import os
+import tempfile
+from datetime import date
+
+from ib_insync import IB, Contract, OptionChain, util
+
+from utils.metrics import metrics
+from utils.util import log_exception
+
+CONTRACT_FIELDS = (
+    "secType",
+    "conId",
+    "symbol",
+    "lastTradeDateOrContractMonth",
+    "strike",
+    "right",
+    "multiplier",
+    "exchange",
+    "primaryExchange",
+    "currency",
+    "localSymbol",
+    "tradingClass",
+)
+
+
+def contract_key(contract):
+    return "|".join(
+        (
+            contract.symbol,
+            contract.lastTradeDateOrContractMonth,
+            str(float(contract.strike)),
+            contract.right,
+        )
+    )
+
+
+class ContractCache:
+    """Per trading day cache of SecDef option chains and qualified contracts.
+
+    Contracts are keyed by (symbol, expiry, strike, right). The cache is
+    persisted after every change so a restart during the session starts warm,
+    and everything is evicted when the trading day rolls over.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._day = date.today().isoformat()
+        self._chains = {}
+        self._contracts = {}
+        self.load()
+
+    def rollover(self):
+        today = date.today().isoformat()
+        if self._day != today:
+            self._day = today
+            self._chains = {}
+            self._contracts = {}
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("day") != self._day:
+            return
+        self._chains = {
+            symbol: OptionChain(**chain) for symbol, chain in data["chains"].items()
+        }
+        self._contracts = data["contracts"]
+
+    def save(self):
+        data = {
+            "day": self._day,
+            "chains": {
+                symbol: chain._asdict() for symbol, chain in self._chains.items()
+            },
+            "contracts": self._contracts,
+        }
+        # Several processes may share the cache file, so each writes its own
+        # temporary file. A failed write only costs the next restart a cold
+        # cache, never a qualification
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                "w",
+                dir=os.path.dirname(self.path) or ".",
+                prefix=f"{os.path.basename(self.path)}.",
+                suffix=".tmp",
+                delete=False,
+            ) as f:
+                tmp_path = f.name
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log_exception(e, "ContractCache.save")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get_chain(self, symbol):
+        self.rollover()
+        return self._chains.get(symbol)
+
+    def set_chain(self, symbol, chain: OptionChain):
+        self.rollover()
+        self._chains[symbol] = chain
+        self.save()
+
+    def get_con_id(self, contract):
+        self.rollover()
+        fields = self._contracts.get(contract_key(contract))
+        return fields["conId"] if fields else None
+
+    def _apply_cached(self, contracts):
+        self.rollover()
+        misses = []
+        for contract in contracts:
+            fields = self._contracts.get(contract_key(contract))
+            if fields is None:
+                misses.append(contract)
+            else:
+                util.dataclassUpdate(contract, **fields)
+        return misses
+
+    def _store(self, contracts, misses, qualified):
+        for contract in qualified:
+            self._contracts[contract_key(contract)] = {
+                field: getattr(contract, field) for field in CONTRACT_FIELDS
+            }
+        self.save()
+        failed = set(map(id, misses)) - set(map(id, qualified))
+        return [c for c in contracts if id(c) not in failed]
+
+    def qualify(self, ib: IB, *contracts: Contract):
+        """Drop-in for ib.qualifyContracts that only asks TWS about misses."""
+        misses = self._apply_cached(contracts)
+        if not misses:
+            return list(contracts)
+        qualified = ib.qualifyContracts(*misses)
+        return self._store(contracts, misses, qualified)
+
+    async def qualify_async(self, ib: IB, *contracts: Contract):
+        misses = self._apply_cached(contracts)
+        if not misses:
+            return list(contracts)
+        with metrics.timer("qualifyContracts"):
+            qualified = await ib.qualifyContractsAsync(*misses)
+        return self._store(contracts, misses, qualified)
@@ -0,0 +1,239 @@
+from datetime import datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from nope.nope_calc import CALL
+
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60
+# Floor on time to expiry, keeps same day expiries finite at the close
+MIN_YEARS = 1 / (365 * 24 * 60)
+EXCHANGE_TZ = ZoneInfo("America/New_York")
+MIN_VOL = 0.005
+MAX_VOL = 5.0
+DELTA_SOURCES = ("provider", "computed", "fill")
+
+
+def norm_cdf(x):
+    """Standard normal CDF, Abramowitz & Stegun 7.1.26 (abs error < 1.5e-7)."""
+    x = np.asarray(x, dtype=float)
+    z = np.abs(x) / np.sqrt(2)
+    t = 1 / (1 + 0.3275911 * z)
+    poly = t * (
+        0.254829592
+        + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429)))
+    )
+    erf = 1 - poly * np.exp(-z * z)
+    return 0.5 * (1 + np.sign(x) * erf)
+
+
+def norm_pdf(x):
+    return np.exp(-0.5 * x * x) / np.sqrt(2 * np.pi)
+
+
+def black_scholes(spot, strike, years, vol, is_call, rate=0.0):
+    """Vectorized Black-Scholes price and delta for European options.
+
+    `is_call` is a boolean array (or scalar); all arguments broadcast.
+    Returns (price, delta).
+    """
+    strike = np.asarray(strike, dtype=float)
+    years = np.maximum(np.asarray(years, dtype=float), MIN_YEARS)
+    vol = np.asarray(vol, dtype=float)
+    sqrt_years = np.sqrt(years)
+    d1 = (np.log(spot / strike) + (rate + 0.5 * vol * vol) * years) / (vol * sqrt_years)
+    d2 = d1 - vol * sqrt_years
+    discount = np.exp(-rate * years)
+    call_delta = norm_cdf(d1)
+    call_price = spot * call_delta - strike * discount * norm_cdf(d2)
+    put_price = call_price - spot + strike * discount
+    price = np.where(is_call, call_price, put_price)
+    delta = np.where(is_call, call_delta, call_delta - 1)
+    return price, delta
+
+
+def is_call(right):
+    return np.asarray(right) == CALL
+
+
+def implied_vol(price, spot, strike, years, is_call, tol=1e-3, max_iter=12):
+    """Vectorized Newton solve for Black-Scholes IV, zero rate.
+
+    The solve starts from the Manaster-Koehler point sqrt(2 |ln(S/K)| / T),
+    where Newton converges monotonically. Quotes at or below intrinsic value
+    get MIN_VOL. Returns (iv, ok); ok is False for missing prices, prices
+    above the no-arbitrage bound and solves that did not converge to `tol`
+    dollars.
+    """
+    price = np.asarray(price, dtype=float)
+    strike = np.asarray(strike, dtype=float)
+    years = np.maximum(np.asarray(years, dtype=float), MIN_YEARS)
+    # Puts are solved as calls through put-call parity
+    call_price = np.where(is_call, price, price + spot - strike)
+    log_moneyness = np.log(spot / strike)
+    intrinsic = np.maximum(spot - strike, 0)
+    at_intrinsic = call_price <= intrinsic
+    valid = (call_price > intrinsic) & (call_price < spot)
+
+    vol = np.clip(np.sqrt(2 * np.abs(log_moneyness) / years), MIN_VOL, MAX_VOL)
+    vol[at_intrinsic] = MIN_VOL
+    ok = at_intrinsic.copy()
+
+    # Iterate on the unconverged quotes only
+    idx = np.flatnonzero(valid)
+    v, k, lm, t = vol[idx], strike[idx], log_moneyness[idx], years[idx]
+    target, sqrt_t = call_price[idx], np.sqrt(t)
+    for _ in range(max_iter):
+        if not len(idx):
+            break
+        vs = v * sqrt_t
+        d1 = lm / vs + 0.5 * vs
+        diff = spot * norm_cdf(d1) - k * norm_cdf(d1 - vs) - target
+        done = np.abs(diff) < tol
+        ok[idx[done]] = True
+        vol[idx[done]] = v[done]
+        vega = spot * norm_pdf(d1) * sqrt_t
+        v = np.clip(v - diff / np.maximum(vega, 1e-8), MIN_VOL, MAX_VOL)
+        keep = ~done
+        idx, v, k, lm, t = idx[keep], v[keep], k[keep], lm[keep], t[keep]
+        target, sqrt_t = target[keep], sqrt_t[keep]
+    vol[idx] = v
+    return vol, ok
+
+
+@lru_cache(maxsize=None)
+def expiry_close(expiry):
+    """Epoch seconds of the 16:00 ET close on a YYYYMMDD expiry."""
+    day = datetime.strptime(expiry, "%Y%m%d")
+    return day.replace(hour=16, tzinfo=EXCHANGE_TZ).timestamp()
+
+
+class IVSurface:
+    """Implied vols last reported by TWS, per contract and per expiry, so
+    candidates can be priced locally between ticker snapshots. Contracts
+    never seen take their expiry's latest IV, then the latest IV overall,
+    then `default_iv`.
+    """
+
+    def __init__(self, default_iv=0.2):
+        self.default_iv = default_iv
+        self._iv = {}
+        self._expiry_iv = {}
+        self._last_iv = None
+
+    def update(self, tickers):
+        for ticker in tickers:
+            greeks = ticker.modelGreeks
+            if greeks is None or not greeks.impliedVol:
+                continue
+            c = ticker.contract
+            expiry = c.lastTradeDateOrContractMonth
+            self._iv[expiry, c.strike, c.right] = greeks.impliedVol
+            self._expiry_iv[expiry] = greeks.impliedVol
+            self._last_iv = greeks.impliedVol
+
+    def lookup(self, contracts):
+        fallback = self._last_iv or self.default_iv
+        return np.array(
+            [
+                self._iv.get(
+                    (c.lastTradeDateOrContractMonth, c.strike, c.right),
+                    self._expiry_iv.get(c.lastTradeDateOrContractMonth, fallback),
+                )
+                for c in contracts
+            ]
+        )
+
+
+def nearest_delta(contracts, spot, target_delta, ivs, now, count):
+    """The `count` contracts whose Black-Scholes delta at `spot` is closest
+    to `target_delta`, closest first. `now` is epoch seconds."""
+    closes = np.array([expiry_close(c.lastTradeDateOrContractMonth) for c in contracts])
+    strikes = np.array([c.strike for c in contracts])
+    calls = np.array([c.right == CALL for c in contracts])
+    _, delta = black_scholes(
+        spot, strikes, (closes - now) / SECONDS_PER_YEAR, ivs, calls
+    )
+    order = np.argsort(np.abs(delta - target_delta), kind="stable")[:count]
+    return [contracts[i] for i in order]
+
+
+def expiry_closes(expiry):
+    """expiry_close() for a datetime64[D] array."""
+    days, inverse = np.unique(expiry, return_inverse=True)
+    closes = np.array(
+        [expiry_close(str(d).replace("-", "")) for d in days], dtype=np.float64
+    )
+    return closes[inverse]
+
+
+def _contract_keys(options):
+    # expiry, strike and right packed into one sortable int64 per option
+    days = options.expiry.astype(np.int64)
+    strikes = np.round(options.strike * 100).astype(np.int64)
+    return (days * 10_000_000 + strikes) * 2 + (options.right == CALL)
+
+
+class ChainGreeks:
+    """Computes deltas for a whole chain from bid/ask mids, for providers
+    whose deltas are missing, stale or not requested.
+
+    IVs are solved with implied_vol(). With `fill_only`, provider deltas are
+    kept and only missing ones are computed. Quotes without a usable mid keep
+    their previous IV, or their provider delta when there is none.
+    """
+
+    def __init__(self, fill_only=False):
+        self.fill_only = fill_only
+        self._keys = None
+        self._iv = None
+
+    def _previous_iv(self, keys):
+        # The last good IV of each contract, NaN where there is none
+        if self._keys is None:
+            return None
+        if len(keys) == len(self._keys) and np.array_equal(keys, self._keys):
+            return self._iv
+        order = np.argsort(self._keys)
+        sorted_keys = self._keys[order]
+        pos = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        found = sorted_keys[pos] == keys
+        return np.where(found, self._iv[order[pos]], np.nan)
+
+    def apply(self, options, spot, now):
+        """Replaces options.delta (and options.iv, when packed) in place.
+        `now` is epoch seconds."""
+        if not len(options):
+            return options
+        keys = _contract_keys(options)
+        mid = (options.bid + options.ask) / 2
+        mid[(options.bid <= 0) | (options.ask <= 0)] = np.nan
+        years = (expiry_closes(options.expiry) - now) / SECONDS_PER_YEAR
+        calls = options.right == CALL
+        iv, ok = implied_vol(mid, spot, options.strike, years, calls)
+        previous = self._previous_iv(keys)
+        if previous is not None:
+            # Unsolvable quotes fall back to their last good IV
+            stale = ~ok & ~np.isnan(previous)
+            iv[stale] = previous[stale]
+            ok |= stale
+        _, delta = black_scholes(spot, options.strike, years, iv, calls)
+
+        replace = ok & np.isnan(options.delta) if self.fill_only else ok
+        options.delta = np.where(replace, delta, options.delta)
+        if options.iv is not None:
+            options.iv = np.where(replace, iv, options.iv)
+        self._keys = keys
+        self._iv = np.where(ok, iv, np.nan)
+        return options
+
+
+def chain_greeks(delta_source):
+    """The ChainGreeks for a `delta_source` config value, None to use the
+    provider's deltas."""
+    if delta_source not in DELTA_SOURCES:
+        raise ValueError(f"delta_source must be one of {DELTA_SOURCES}")
+    if delta_source == "provider":
+        return None
+    return ChainGreeks(fill_only=delta_source == "fill")
@@ -0,0 +1,88 @@
+from ib_insync import IB, Contract, util
+
+
+class MarketDataManager:
+    """Keeps streaming reqMktData subscriptions for the underlying, the
+    candidate strike/expiry window and held positions, so decisions read
+    prices and greeks from memory instead of waiting on reqTickers snapshots.
+
+    Held positions take priority over the candidate window when the number of
+    streams would exceed `max_lines`. `max_lines = 0` disables streaming.
+    """
+
+    def __init__(self, ib: IB, max_lines=90, recenter_threshold=1.0):
+        self.ib = ib
+        self.max_lines = max_lines
+        self.recenter_threshold = recenter_threshold
+        self.reset()
+
+    def reset(self):
+        # Subscriptions do not survive a reconnect
+        self._tickers = {}
+        self._underlying = None
+        self._center = None
+        self._window = []
+        self._held = []
+
+    @property
+    def enabled(self):
+        return self.max_lines > 0
+
+    def subscribe_underlying(self, stock: Contract):
+        if self.enabled and self._underlying is None:
+            self._underlying = self.ib.reqMktData(stock)
+
+    def underlying_price(self):
+        if self._underlying is None:
+            return float("nan")
+        return self._underlying.marketPrice()
+
+    def needs_recenter(self):
+        if not self.enabled:
+            return False
+        price = self.underlying_price()
+        if self._center is None:
+            return not util.isNan(price)
+        return abs(price - self._center) >= self.recenter_threshold
+
+    def set_window(self, contracts):
+        # Contracts must be qualified and ordered by preference
+        self._center = self.underlying_price()
+        self._window = list(contracts)
+        self._sync()
+
+    def set_held(self, contracts):
+        held = list(contracts)
+        if {c.conId for c in held} != {c.conId for c in self._held}:
+            self._held = held
+            self._sync()
+
+    def _sync(self):
+        line_budget = self.max_lines - (self._underlying is not None)
+        desired = {}
+        for contract in self._held + self._window:
+            if len(desired) >= line_budget:
+                break
+            desired.setdefault(contract.conId, contract)
+
+        for con_id in list(self._tickers):
+            if con_id not in desired:
+                ticker = self._tickers.pop(con_id)
+                self.ib.cancelMktData(ticker.contract)
+        for con_id, contract in desired.items():
+            if con_id not in self._tickers:
+                self._tickers[con_id] = self.ib.reqMktData(contract)
+
+    def get_tickers(self, contracts, require_greeks=False):
+        """Split contracts into live tickers with usable data and the
+        contracts that still need a snapshot."""
+        tickers, missing = [], []
+        for contract in contracts:
+            ticker = self._tickers.get(contract.conId)
+            if ticker is None or util.isNan(ticker.marketPrice()):
+                missing.append(contract)
+            elif require_greeks and ticker.modelGreeks is None:
+                missing.append(contract)
+            else:
+                tickers.append(ticker)
+        return tickers, missing
@@ -0,0 +1,329 @@
+from datetime import date
+from operator import itemgetter, mul
+
+import numpy as np
+
+CALL = "C"
+PUT = "P"
+
+# NOPE is reported in basis points of the underlying's volume
+NOPE_SCALE = 10_000
+
+
+def expiry_day(expiry_date):
+    # Questrade: "2021-03-19T00:00:00.000000-04:00", TDA: "2021-03-19:2"
+    return np.datetime64(expiry_date[:10], "D")
+
+
+def _column(rows, key, dtype=np.float64):
+    try:
+        return np.fromiter(map(itemgetter(key), rows), dtype, count=len(rows))
+    except TypeError:
+        # Providers occasionally send null greeks
+        values = [np.nan if v is None else v for v in map(itemgetter(key), rows)]
+        return np.array(values, dtype=dtype)
+
+
+class ChainLayout:
+    """Columnar description of an option chain keyed by provider symbol id.
+
+    Built once from the chain definition, then used to map quote payloads
+    (which only carry a symbol id) back to expiry, strike and right.
+    """
+
+    def __init__(self, symbol_ids, expiry, strike, right):
+        # Symbol ids in the order of the chain definition, to recognize an
+        # unchanged chain
+        self.chain_ids = np.asarray(symbol_ids, dtype=np.int64)
+        order = np.argsort(self.chain_ids, kind="stable")
+        self.symbol_ids = self.chain_ids[order]
+        self.expiry = np.asarray(expiry, dtype="datetime64[D]")[order]
+        self.strike = np.asarray(strike, dtype=np.float64)[order]
+        self.right = np.asarray(right, dtype="U1")[order]
+
+    def __len__(self):
+        return len(self.symbol_ids)
+
+    @staticmethod
+    def _questrade_roots(chain):
+        for option_chain in chain["optionChain"]:
+            for root in option_chain["chainPerRoot"]:
+                yield option_chain["expiryDate"], root["chainPerStrikePrice"]
+
+    @classmethod
+    def from_questrade(cls, chain, previous: "ChainLayout" = None):
+        """Layout of a Questrade chain definition. `previous` is returned
+        as is when the chain lists the same contracts in the same order,
+        which costs about a third of a rebuild."""
+        symbol_ids = [
+            _column(strikes, key, np.int64)
+            for _, strikes in cls._questrade_roots(chain)
+            for key in ("callSymbolId", "putSymbolId")
+        ]
+        if not symbol_ids:
+            return cls([], [], [], [])
+        symbol_ids = np.concatenate(symbol_ids)
+        if previous is not None and np.array_equal(previous.chain_ids, symbol_ids):
+            return previous
+
+        expiry, strike, right = [], [], []
+        for expiry_date, strikes in cls._questrade_roots(chain):
+            n = len(strikes)
+            strike += [_column(strikes, "strikePrice")] * 2
+            expiry.append(np.full(2 * n, expiry_day(expiry_date)))
+            right += [np.full(n, CALL), np.full(n, PUT)]
+        return cls(
+            symbol_ids,
+            np.concatenate(expiry),
+            np.concatenate(strike),
+            np.concatenate(right),
+        )
+
+    def expiries(self):
+        return np.unique(self.expiry)
+
+    def locate(self, symbol_ids):
+        symbol_ids = np.asarray(symbol_ids, dtype=np.int64)
+        if not len(self):
+            return np.zeros(len(symbol_ids), dtype=np.intp), symbol_ids < 0
+        idx = np.searchsorted(self.symbol_ids, symbol_ids)
+        idx[idx == len(self.symbol_ids)] = 0
+        return idx, self.symbol_ids[idx] == symbol_ids
+
+
+def _volatility(values):
+    # Providers quote IV in percent; TDA sends -999 when it has none
+    iv = values / 100
+    iv[iv <= 0] = np.nan
+    return iv
+
+
+class OptionChainArrays:
+    """Option quotes packed into parallel arrays for vectorized reductions.
+
+    bid, ask and iv are only packed when asked for (e.g. for recording) and
+    are None otherwise.
+    """
+
+    PRICE_COLUMNS = ("bid", "ask", "iv")
+
+    def __init__(
+        self, delta, volume, expiry, strike, right, bid=None, ask=None, iv=None
+    ):
+        self.delta = np.asarray(delta, dtype=np.float64)
+        self.volume = np.asarray(volume, dtype=np.float64)
+        self.expiry = np.asarray(expiry, dtype="datetime64[D]")
+        self.strike = np.asarray(strike, dtype=np.float64)
+        self.right = np.asarray(right, dtype="U1")
+        self.bid = None if bid is None else np.asarray(bid, dtype=np.float64)
+        self.ask = None if ask is None else np.asarray(ask, dtype=np.float64)
+        self.iv = None if iv is None else np.asarray(iv, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.delta)
+
+    @property
+    def has_prices(self):
+        return self.bid is not None
+
+    def _price_columns(self, fn):
+        if not self.has_prices:
+            return {}
+        return {name: fn(getattr(self, name)) for name in self.PRICE_COLUMNS}
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], [], [], [])
+
+    @classmethod
+    def concat(cls, arrays):
+        # Empty parts may lack price columns the others have
+        arrays = [a for a in arrays if len(a)]
+        if not arrays:
+            return cls.empty()
+        prices = {}
+        if all(a.has_prices for a in arrays):
+            prices = {
+                name: np.concatenate([getattr(a, name) for a in arrays])
+                for name in cls.PRICE_COLUMNS
+            }
+        return cls(
+            np.concatenate([a.delta for a in arrays]),
+            np.concatenate([a.volume for a in arrays]),
+            np.concatenate([a.expiry for a in arrays]),
+            np.concatenate([a.strike for a in arrays]),
+            np.concatenate([a.right for a in arrays]),
+            **prices,
+        )
+
+    @classmethod
+    def from_questrade(cls, layout: ChainLayout, option_quotes, prices=False):
+        symbol_ids = _column(option_quotes, "symbolId", np.int64)
+        # Quotes for symbols missing from the chain layout are dropped
+        idx, found = layout.locate(symbol_ids)
+        idx = idx[found]
+        price_columns = {}
+        if prices:
+            price_columns = {
+                "bid": _column(option_quotes, "bidPrice")[found],
+                "ask": _column(option_quotes, "askPrice")[found],
+                "iv": _volatility(_column(option_quotes, "volatility")[found]),
+            }
+        return cls(
+            _column(option_quotes, "delta")[found],
+            _column(option_quotes, "volume")[found],
+            layout.expiry[idx],
+            layout.strike[idx],
+            layout.right[idx],
+            **price_columns,
+        )
+
+    @classmethod
+    def from_tda(cls, chain, prices=False):
+        quotes, expiry, right = [], [], []
+        for chain_map_key, r in (("callExpDateMap", CALL), ("putExpDateMap", PUT)):
+            for exp_date, strikes in chain.get(chain_map_key, {}).items():
+                quotes += [q[0] for q in strikes.values()]
+                expiry.append(np.full(len(strikes), expiry_day(exp_date)))
+                right.append(np.full(len(strikes), r))
+        if not quotes:
+            return cls.empty()
+        price_columns = {}
+        if prices:
+            price_columns = {
+                "bid": _column(quotes, "bid"),
+                "ask": _column(quotes, "ask"),
+                "iv": _volatility(_column(quotes, "volatility")),
+            }
+        return cls(
+            _column(quotes, "delta"),
+            _column(quotes, "totalVolume"),
+            np.concatenate(expiry),
+            _column(quotes, "strikePrice"),
+            np.concatenate(right),
+            **price_columns,
+        )
+
+    def select(self, mask):
+        return OptionChainArrays(
+            self.delta[mask],
+            self.volume[mask],
+            self.expiry[mask],
+            self.strike[mask],
+            self.right[mask],
+            **self._price_columns(lambda column: column[mask]),
+        )
+
+    def delta_volume(self):
+        # Quotes without a delta contribute nothing
+        dv = self.delta * self.volume
+        dv[np.isnan(dv)] = 0.0
+        return dv
+
+    def total_delta(self):
+        return float(self.delta_volume().sum())
+
+    def total_delta_by_right(self):
+        dv = self.delta_volume()
+        is_call = self.right == CALL
+        return float(dv[is_call].sum()), float(dv[~is_call].sum())
+
+    def _group_sum(self, keys):
+        groups, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(
+            inverse.ravel(), weights=self.delta_volume(), minlength=len(groups)
+        )
+        return groups, sums
+
+    def total_delta_by_expiry(self):
+        return self._group_sum(self.expiry)
+
+    def total_delta_by_strike(self):
+        return self._group_sum(self.strike)
+
+    def nope(self, underlying_volume):
+        return nope_from_delta(self.total_delta(), underlying_volume)
+
+    def nope_by_expiry(self, underlying_volume):
+        expiries, sums = self.total_delta_by_expiry()
+        return expiries, nope_from_delta(sums, underlying_volume)
+
+    def nope_by_strike(self, underlying_volume):
+        strikes, sums = self.total_delta_by_strike()
+        return strikes, nope_from_delta(sums, underlying_volume)
+
+
+def questrade_total_delta(option_quotes):
+    """Total delta·volume of Questrade option quotes, for when only the
+    total is needed: one pass in C over the quotes, no arrays or layout."""
+    try:
+        return float(
+            sum(
+                map(
+                    mul,
+                    map(itemgetter("delta"), option_quotes),
+                    map(itemgetter("volume"), option_quotes),
+                )
+            )
+        )
+    except TypeError:
+        # Providers occasionally send null greeks, which contribute nothing
+        dv = _column(option_quotes, "delta") * _column(option_quotes, "volume")
+        return float(np.nansum(dv))
+
+
+def nope_from_delta(total_delta, underlying_volume):
+    if not underlying_volume:
+        raise ZeroDivisionError("underlying volume is zero")
+    return total_delta * NOPE_SCALE / underlying_volume
+
+
+class IncrementalNope:
+    """Caches each expiry's delta·volume so only near-dated expiries are
+    refetched every cycle. Far-dated expiries, and the chain layout, are
+    refreshed every `full_refresh_cycles` cycles and at the start of each day.
+    """
+
+    def __init__(self, near_dte=7, full_refresh_cycles=10):
+        if full_refresh_cycles < 1:
+            raise ValueError(
+                f"full_refresh_cycles must be at least 1, got {full_refresh_cycles}"
+            )
+        self.near_dte = near_dte
+        self.full_refresh_cycles = full_refresh_cycles
+        self._contributions = {}
+        self._cycle = 0
+        self._day = None
+        self._full_refresh = True
+
+    def _today(self):
+        return np.datetime64(date.today(), "D")
+
+    def begin_cycle(self):
+        self._full_refresh = (
+            not self._contributions
+            or self._day != self._today()
+            or self._cycle % self.full_refresh_cycles == 0
+        )
+        return self._full_refresh
+
+    def is_near(self, expiry):
+        dte = (np.datetime64(expiry, "D") - self._today()).astype(int)
+        return dte <= self.near_dte
+
+    def near_expiries(self):
+        return [e for e in self._contributions if self.is_near(e)]
+
+    def update(self, options: OptionChainArrays, refreshed_expiries=None):
+        self._cycle += 1
+        expiries, sums = options.total_delta_by_expiry()
+        fresh = dict(zip(expiries, sums))
+        if self._full_refresh:
+            self._contributions = fresh
+            self._day = self._today()
+            # Identical to a from-scratch computation on full refresh
+            return options.total_delta()
+
+        for expiry in refreshed_expiries:
+            self._contributions[expiry] = fresh.get(expiry, 0.0)
+        return float(sum(self._contributions.values()))
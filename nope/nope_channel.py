@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import NamedTuple
+
+
+class NopeReading(NamedTuple):
+    seq: int
+    value: float
+    price: float
+    time: datetime
+    # time.monotonic() at publication, for latency measurements
+    monotonic: float
+
+
+class NopeChannel:
+    """Hands NOPE readings from the data thread to the IB event loop.
+
+    publish() may be called from any thread. Each reading is delivered to the
+    bound callback on the bound loop via call_soon_threadsafe; with a
+    debounce, bursts of readings collapse into one call with the newest.
+    Sinks get every reading on the publishing thread.
+    """
+
+    def __init__(self, debounce=0.0, max_latencies=1000):
+        self.debounce = debounce
+        self._lock = threading.Lock()
+        self._latest = None
+        self._seq = 0
+        self._loop = None
+        self._callback = None
+        self._pending = None
+        self._delivered_seq = 0
+        self._sinks = []
+        self.order_latencies = deque(maxlen=max_latencies)
+
+    def bind(self, loop, callback):
+        """Delivers readings to callback(reading) on `loop` from now on,
+        starting with the latest one if it has not been delivered yet, e.g.
+        a reading published before the first connect."""
+        with self._lock:
+            self._loop = loop
+            self._callback = callback
+            latest = self._latest
+        if latest is not None:
+            loop.call_soon_threadsafe(self._schedule)
+
+    def add_sink(self, sink):
+        """Calls sink(reading) for every reading published from now on,
+        e.g. to write it to a nope.nope_feed.NopeFeedWriter."""
+        with self._lock:
+            self._sinks.append(sink)
+
+    def latest(self):
+        with self._lock:
+            return self._latest
+
+    def publish(self, value, price):
+        with self._lock:
+            self._seq += 1
+            reading = NopeReading(
+                self._seq, value, price, datetime.now(), time.monotonic()
+            )
+            self._latest = reading
+            loop = self._loop
+            sinks = list(self._sinks)
+        for sink in sinks:
+            sink(reading)
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._schedule)
+        return reading
+
+    def _schedule(self):
+        # Runs on the bound loop
+        if self.debounce <= 0:
+            self._deliver()
+        elif self._pending is None:
+            self._pending = self._loop.call_later(self.debounce, self._deliver)
+
+    def _deliver(self):
+        self._pending = None
+        reading = self.latest()
+        if reading is None or reading.seq <= self._delivered_seq:
+            return
+        self._delivered_seq = reading.seq
+        self._callback(reading)
+
+    def record_order(self, reading: NopeReading):
+        """Record signal-to-order latency in seconds for an order placed on
+        the strength of `reading`."""
+        if reading is None:
+            return None
+        latency = time.monotonic() - reading.monotonic
+        self.order_latencies.append(latency)
+        return latency
@@ -0,0 +1,208 @@
+import asyncio
+import mmap
+import os
+import struct
+import time
+from typing import NamedTuple
+
+from nope.nope_channel import NopeReading
+from utils.util import log_error
+
+# A feed file holds, per symbol, a ring of the last `slots` NOPE readings and
+# the sequence number of the newest one. One publisher process writes it and
+# any number of strategy processes map it read-only; nobody takes a lock.
+#
+# Every slot carries a version: 2 * seq - 1 while reading `seq` is being
+# written, 2 * seq once it is complete. A reader checks the version before
+# and after copying the slot and retries if it changed, so it never returns
+# a half-written reading.
+MAGIC = b"NOPEFEED"
+HEADER = struct.Struct("<8sII")  # magic, slots, symbols
+SYMBOL = struct.Struct("<16sQ")  # name, newest seq
+SLOT = struct.Struct("<Qddd")  # version, value, price, timestamp
+VERSION = struct.Struct("<Q")
+DATA = struct.Struct("<ddd")
+
+
+class FeedReading(NamedTuple):
+    seq: int
+    value: float
+    price: float
+    # Seconds since the epoch at publication
+    timestamp: float
+
+
+def _layout(slots, symbols):
+    """(size, {symbol: (seq offset, ring offset)})"""
+    rings = HEADER.size + SYMBOL.size * len(symbols)
+    offsets = {
+        symbol: (
+            HEADER.size + SYMBOL.size * i + 16,
+            rings + SLOT.size * slots * i,
+        )
+        for i, symbol in enumerate(symbols)
+    }
+    return rings + SLOT.size * slots * len(symbols), offsets
+
+
+def _read_header(buf):
+    magic, slots, n_symbols = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a NOPE feed")
+    symbols = [
+        SYMBOL.unpack_from(buf, HEADER.size + SYMBOL.size * i)[0].rstrip(b"\0").decode()
+        for i in range(n_symbols)
+    ]
+    return slots, symbols
+
+
+class NopeFeedWriter:
+    """Publishes NOPE readings for `symbols` to the feed file at `path`.
+
+    An existing feed with the same layout is reused and its sequence numbers
+    continue, so subscribers carry on across a publisher restart. Otherwise
+    the file is replaced; subscribers notice the new file and reopen it.
+    """
+
+    def __init__(self, path, symbols, slots=256):
+        self.path = path
+        self.slots = slots
+        self.symbols = list(symbols)
+        size, self._offsets = _layout(slots, self.symbols)
+        if not self._matches(size):
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.truncate(size)
+                f.write(HEADER.pack(MAGIC, slots, len(self.symbols)))
+                for symbol in self.symbols:
+                    f.write(SYMBOL.pack(symbol.encode(), 0))
+            # Readers holding the old file keep a valid mapping of it
+            os.replace(tmp, path)
+        with open(path, "r+b") as f:
+            self._buf = mmap.mmap(f.fileno(), size)
+        self._seq = {
+            symbol: VERSION.unpack_from(self._buf, seq_offset)[0]
+            for symbol, (seq_offset, _) in self._offsets.items()
+        }
+
+    def _matches(self, size):
+        try:
+            if os.path.getsize(self.path) != size:
+                return False
+            with open(self.path, "rb") as f:
+                return _read_header(f.read(size)) == (self.slots, self.symbols)
+        except (OSError, ValueError):
+            return False
+
+    def publish(self, symbol, reading: NopeReading):
+        seq = self._seq[symbol] + 1
+        seq_offset, ring = self._offsets[symbol]
+        slot = ring + SLOT.size * ((seq - 1) % self.slots)
+        VERSION.pack_into(self._buf, slot, 2 * seq - 1)
+        DATA.pack_into(
+            self._buf,
+            slot + VERSION.size,
+            reading.value,
+            reading.price,
+            reading.time.timestamp(),
+        )
+        VERSION.pack_into(self._buf, slot, 2 * seq)
+        VERSION.pack_into(self._buf, seq_offset, seq)
+        self._seq[symbol] = seq
+
+    def close(self):
+        self._buf.close()
+
+
+class NopeFeedReader:
+    """NOPE provider reading `symbol` from a feed written by another process.
+
+    get_nope() waits for the next reading, checking every `poll_seconds`,
+    and returns None when none newer than `max_age` seconds arrives within
+    that time, e.g. while the publisher is down, so nothing is published.
+    """
+
+    # Fetches cost no provider requests
+    requests = 0
+
+    def __init__(self, path, symbol, max_age=180.0, poll_seconds=0.05):
+        self.path = path
+        self.symbol = symbol
+        self.max_age = max_age
+        self.poll_seconds = poll_seconds
+        self._buf = None
+        self._inode = None
+        self._seq = 0
+
+    def _open(self):
+        """Maps the feed file if it is new or was replaced; False while
+        there is no feed of this symbol."""
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return False
+        if inode == self._inode:
+            return self._buf is not None
+        self._inode = inode
+        if self._buf is not None:
+            self._buf.close()
+            self._buf = None
+        with open(self.path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        slots, symbols = _read_header(buf)
+        if self.symbol not in symbols:
+            # Wait for a publisher with this symbol to replace the file
+            buf.close()
+            log_error(f"{self.symbol} is not in the NOPE feed {self.path}\n")
+            return False
+        self._buf = buf
+        self._slots = slots
+        _, offsets = _layout(slots, symbols)
+        self._seq_offset, self._ring = offsets[self.symbol]
+        self._seq = 0
+        return True
+
+    def latest_seq(self):
+        return VERSION.unpack_from(self._buf, self._seq_offset)[0]
+
+    def read(self, seq):
+        """The reading with sequence number `seq`, None if it has not been
+        written yet or was overwritten."""
+        slot = self._ring + SLOT.size * ((seq - 1) % self._slots)
+        for _ in range(100):
+            [version] = VERSION.unpack_from(self._buf, slot)
+            if version > 2 * seq:
+                return None
+            if version == 2 * seq:
+                data = DATA.unpack_from(self._buf, slot + VERSION.size)
+                if VERSION.unpack_from(self._buf, slot)[0] == version:
+                    return FeedReading(seq, *data)
+            elif version < 2 * seq - 1:
+                return None
+        return None
+
+    def _next_reading(self):
+        seq = self.latest_seq()
+        if seq <= self._seq:
+            return None
+        self._seq = seq
+        return self.read(seq)
+
+    async def get_nope(self):
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.max_age
+        while True:
+            if self._open():
+                reading = self._next_reading()
+                if (
+                    reading is not None
+                    and time.time() - reading.timestamp <= self.max_age
+                ):
+                    return [reading.value, reading.price]
+            if loop.time() >= deadline:
+                return None
+            await asyncio.sleep(self.poll_seconds)
+
+    def refresh_access_token(self):
+        # The publisher holds the provider tokens
+        pass
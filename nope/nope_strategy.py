@@ -1,33 +1,228 @@
 import asyncio
+import os
 import threading
-from functools import reduce
+from functools import partial, reduce
 
 from ib_insync import IB, Option, Stock, TagValue, util
-from ib_insync.order import LimitOrder, StopOrder
-
+from ib_insync.order import LimitOrder
+
+from nope.cadence import AdaptiveCadence
+from nope.chain_recorder import ChainRecorder
+from nope.contract_cache import ContractCache
+from nope.greeks import IVSurface, chain_greeks, nearest_delta
+from nope.market_data import MarketDataManager
+from nope.nope_calc import IncrementalNope
+from nope.nope_channel import NopeChannel
+from nope.nope_feed import NopeFeedReader
+from nope.order_deadlines import OrderDeadlines
+from nope.order_executor import BatchOrderExecutor
+from nope.position_book import PositionBook
+from nope.providers import HedgedNopeProvider, RateLimiter
+from nope.stop_losses import StopLossManager
 from qt.qtrade_client import QuestradeClient
+from utils.metrics import MetricsExporter, metrics
 from utils.util import (
-    get_datetime_diff_from_now,
+    DEFAULT_SYMBOL,
     get_datetime_for_logging,
+    log_error,
     log_exception,
     log_fill,
+    log_prefix,
     midpoint_or_market_price,
-    stop_order_price,
+    now_utc,
+    write_log,
 )
 
 
+def symbol_config(config, symbol):
+    """config with the [nope.<symbol>] table, if any, overriding [nope]."""
+    nope_config = {k: v for k, v in config["nope"].items() if not isinstance(v, dict)}
+    nope_config.update(config["nope"].get(symbol, {}))
+    return {**config, "nope": nope_config}
+
+
 class NopeStrategy:
     QT_ACCESS_TOKEN = "qt/access_token.yml"
-    SYMBOL = "SPY"
-
-    def __init__(self, config, ib: IB):
-        self.config = config
+    CONTRACT_CACHE = "logs/contract_cache.json"
+
+    def __init__(
+        self,
+        config,
+        ib: IB,
+        nope_provider=None,
+        symbol=DEFAULT_SYMBOL,
+        shared: "NopeStrategy" = None,
+        sinks=(),
+    ):
+        """Trades options on `symbol`. With `shared`, the strategy of another
+        symbol on the same IB connection, the contract cache, provider clients
+        and data thread are shared with it. `sinks` are added to the NOPE
+        channel before the first fetch, so they see every reading."""
+        self.config = symbol_config(config, symbol)
+        config = self.config
         self.ib = ib
+        self.symbol = symbol
+        # Logs of symbols other than SPY are prefixed, e.g. logs/QQQ-2021-03-02.txt
+        self.log_prefix = log_prefix(symbol)
+        self._data_loop = None
         self._nope_value = 0
         self._underlying_price = 0
+        self._nope_reading = None
+        # Sequence number of the last reading positions were evaluated on
+        self._evaluated_seq = 0
+        # (action, right) pairs with an order decision in flight
+        self._orders_in_flight = set()
+        self.nope_channel = NopeChannel(debounce=config["signal"]["debounce_seconds"])
+        for sink in sinks:
+            self.nope_channel.add_sink(sink)
         self.ib_tasks_dict = dict()
-        self.qt = QuestradeClient(token_yaml=self.QT_ACCESS_TOKEN)
-        self.run_qt_tasks()
+        self.contract_cache = (
+            ContractCache(self.CONTRACT_CACHE)
+            if shared is None
+            else shared.contract_cache
+        )
+        self.position_book = PositionBook(ib, symbol, account=config["ib"]["account"])
+        self.order_deadlines = OrderDeadlines(ib, reprice=self.reprice_order)
+        self.order_executor = BatchOrderExecutor(
+            ib, self.contract_cache, self.get_tickers
+        )
+        self.stop_losses = StopLossManager(
+            ib,
+            self.position_book,
+            config["nope"]["stop_loss_percentage"],
+            self.order_executor,
+            on_place=lambda contract, quantity, price: self.log_order(
+                contract, quantity, price, "STOP"
+            ),
+        )
+        # The market data line allowance is split between the symbols
+        self.market_data = MarketDataManager(
+            ib,
+            max_lines=config["market_data"]["max_lines"]
+            // len(config["nope"]["symbols"]),
+            recenter_threshold=config["market_data"]["recenter_threshold"],
+        )
+        self.iv_surface = IVSurface()
+        self.cadence = AdaptiveCadence.from_config(config)
+        if shared is None:
+            self.start_metrics()
+        # Provider clients by name, for other symbols to share
+        self.providers = {}
+        if nope_provider is not None:
+            # The caller runs data_tasks(), e.g. the backtester on its own loop
+            self.qt = nope_provider
+        elif shared is None:
+            self.qt = self.make_nope_provider()
+            self.run_qt_tasks()
+        else:
+            self.qt = self.make_nope_provider(shared.providers)
+            shared.add_data_tasks(self)
+
+    @classmethod
+    def for_symbols(cls, config, ib: IB, sink=None):
+        """One strategy per [nope] symbols entry, all on `ib`. The first
+        one's data thread fetches every symbol's NOPE concurrently. `sink`,
+        if given, is called as sink(symbol, reading) with every reading."""
+
+        def sinks(symbol):
+            return () if sink is None else (partial(sink, symbol),)
+
+        first, *rest = config["nope"]["symbols"]
+        strategy = cls(config, ib, symbol=first, sinks=sinks(first))
+        return [strategy] + [
+            cls(config, ib, symbol=symbol, shared=strategy, sinks=sinks(symbol))
+            for symbol in rest
+        ]
+
+    def make_nope_provider(self, shared_providers=None):
+        """With `shared_providers`, another symbol's provider clients, the
+        new clients share their sessions, tokens and rate limiters."""
+        feed_config = self.config["feed"]
+        if feed_config["subscribe"]:
+            # nope_publisher.py fetches NOPE for every subscribed process
+            return NopeFeedReader(
+                feed_config["path"],
+                self.symbol,
+                max_age=feed_config["max_age_seconds"],
+                poll_seconds=feed_config["poll_seconds"],
+            )
+        provider_config = self.config["provider"]
+        # Only the first provider records chains, so both don't write the
+        # same day's files
+        recorder = self.make_chain_recorder()
+        for name in provider_config["providers"]:
+            kwargs = {
+                "incremental": self.make_incremental_nope(),
+                "recorder": recorder,
+            }
+            if name == "questrade":
+                kwargs["greeks"] = chain_greeks(
+                    self.config["questrade"]["delta_source"]
+                )
+            if shared_providers is not None:
+                self.providers[name] = shared_providers[name].sibling(
+                    self.symbol, **kwargs
+                )
+            elif name == "questrade":
+                self.providers[name] = QuestradeClient(
+                    token_yaml=self.QT_ACCESS_TOKEN,
+                    batch_size=self.config["questrade"]["option_quote_batch_size"],
+                    max_concurrency=self.config["questrade"]["max_concurrent_requests"],
+                    ticker=self.symbol,
+                    limiter=RateLimiter(
+                        self.config["questrade"]["max_requests_per_second"]
+                    ),
+                    **kwargs,
+                )
+            elif name == "tda":
+                # tda-api is only needed when TDA is configured
+                from tda.tda_client import TDAClient
+
+                self.providers[name] = TDAClient(
+                    ticker=self.symbol,
+                    limiter=RateLimiter(self.config["tda"]["max_requests_per_second"]),
+                    **kwargs,
+                )
+            else:
+                raise ValueError(f"Unknown NOPE provider {name}")
+            recorder = None
+
+        if len(self.providers) == 1:
+            [provider] = self.providers.values()
+            return provider
+        return HedgedNopeProvider(
+            self.providers,
+            hedge_after=provider_config["hedge_after_seconds"],
+            adaptive=provider_config["adaptive"],
+        )
+
+    def make_incremental_nope(self):
+        incremental_config = self.config["incremental"]
+        if not incremental_config["enabled"]:
+            return None
+        return IncrementalNope(
+            near_dte=incremental_config["near_dte"],
+            full_refresh_cycles=incremental_config["full_refresh_cycles"],
+        )
+
+    def make_chain_recorder(self):
+        recorder_config = self.config["recorder"]
+        if not recorder_config["enabled"]:
+            return None
+        path = recorder_config["path"]
+        if self.symbol != DEFAULT_SYMBOL:
+            path = os.path.join(path, self.symbol)
+        return ChainRecorder(path, max_pending=recorder_config["max_pending"])
+
+    def start_metrics(self):
+        metrics_config = self.config["metrics"]
+        metrics.enabled = metrics_config["enabled"]
+        if metrics.enabled:
+            MetricsExporter(
+                metrics,
+                prometheus_file=metrics_config["prometheus_file"],
+                http_port=metrics_config["http_port"],
+            ).start()
 
     def console_log(self, s):
         if self.config["debug"]["verbose"]:
@@ -43,37 +238,115 @@ class NopeStrategy:
         self.ib.reqAllOpenOrders()
         self.ib.reqPositions()
 
-    def set_nope_value(self):
-        self._nope_value, self._underlying_price = self.qt.get_nope()
-
-    def get_portfolio(self):
-        portfolio = self.ib.portfolio()
-        # Filter out non-SPY contracts
-        portfolio = [item for item in portfolio if item.contract.symbol == self.SYMBOL]
-        return portfolio
-
-    def get_trades(self):
-        trades = self.ib.openTrades()
-        trades = [
-            t for t in trades if t.isActive() and t.contract.symbol == self.SYMBOL
+    async def get_stock(self, symbol):
+        stock = Stock(symbol, "SMART", currency="USD")
+        await self.contract_cache.qualify_async(self.ib, stock)
+        return stock
+
+    async def get_underlying_price(self, stock):
+        price = self.market_data.underlying_price()
+        if util.isNan(price):
+            with metrics.timer("reqTickers"):
+                [ticker] = await self.ib.reqTickersAsync(stock)
+            price = ticker.marketPrice()
+        return price
+
+    async def get_tickers(self, contracts, require_greeks=False):
+        tickers, missing = self.market_data.get_tickers(contracts, require_greeks)
+        if len(missing) > 0:
+            with metrics.timer("reqTickers"):
+                tickers += await self.ib.reqTickersAsync(*missing)
+        return tickers
+
+    async def refresh_market_data(self):
+        if not self.market_data.enabled:
+            return
+        stock = await self.get_stock(self.symbol)
+        self.market_data.subscribe_underlying(stock)
+        if self.market_data.needs_recenter():
+            calls, puts = await asyncio.gather(
+                self.find_eligible_contracts(self.symbol, "C"),
+                self.find_eligible_contracts(self.symbol, "P"),
+            )
+            qualified_window = await self.contract_cache.qualify_async(
+                self.ib, *calls, *puts
+            )
+            price = self.market_data.underlying_price()
+            # Nearest the money first, in case the window exceeds the line limit
+            qualified_window.sort(
+                key=lambda c: (abs(c.strike - price), c.lastTradeDateOrContractMonth)
+            )
+            self.market_data.set_window(qualified_window)
+        held_contracts = [
+            c["contract"]
+            for right in ("C", "P")
+            for c in self.get_held_contracts_info(right)
         ]
-        return trades
+        self.market_data.set_held(
+            await self.contract_cache.qualify_async(self.ib, *held_contracts)
+        )
 
-    # From thetagang
-    # https://github.com/brndnmtthws/thetagang
-    def find_eligible_contracts(self, symbol, right):
+    async def set_nope_value(self):
+        reading = await self.qt.get_nope()
+        if reading is None:
+            # A failed fetch or a stalled feed; acting on a placeholder NOPE
+            # of 0 would meet both exit thresholds
+            return
+        nope_value, underlying_price = reading
+        self.nope_channel.publish(nope_value, underlying_price)
+
+    def on_nope_reading(self, reading):
+        # Runs on the IB event loop as soon as a new NOPE value is published
+        self._nope_reading = reading
+        self._nope_value = reading.value
+        self._underlying_price = reading.price
+        if not self.ib.isConnected():
+            return
+        asyncio.get_event_loop().create_task(self.evaluate_positions())
+
+    async def evaluate_positions(self):
+        if self._nope_reading is not None:
+            self._evaluated_seq = self._nope_reading.seq
+
+        async def enter_pos():
+            try:
+                await self.enter_positions()
+            except Exception as e:
+                log_exception(e, "enter_positions")
+
+        async def exit_pos():
+            try:
+                await self.exit_positions()
+            except Exception as e:
+                log_exception(e, "exit_positions")
+
+        await asyncio.gather(enter_pos(), exit_pos())
+
+    def record_signal_latency(self):
+        latency = self.nope_channel.record_order(self._nope_reading)
+        if latency is not None:
+            if metrics.enabled:
+                metrics.observe("signal_to_order", latency)
+            self.console_log(f"Signal to order latency {latency * 1000:.1f} ms")
+
+    def get_trades(self, **criteria):
+        return self.position_book.trades(**criteria)
+
+    @metrics.timed("find_eligible_contracts")
+    async def find_eligible_contracts(self, symbol, right):
         is_auto_select = self.config["nope"]["contract_auto_select"]
         EXCHANGE = "SMART"
         MAX_STRIKE_OFFSET = 6 if is_auto_select else 11
 
-        stock = Stock(symbol, EXCHANGE, currency="USD")
-        self.ib.qualifyContracts(stock)
-        [ticker] = self.ib.reqTickers(stock)
-        ticker_value = ticker.marketPrice()
-        chains = self.ib.reqSecDefOptParams(
-            stock.symbol, "", stock.secType, stock.conId
-        )
-        chain = next(c for c in chains if c.exchange == EXCHANGE)
+        stock = await self.get_stock(symbol)
+        ticker_value = await self.get_underlying_price(stock)
+        chain = self.contract_cache.get_chain(symbol)
+        if chain is None:
+            chains = await self.ib.reqSecDefOptParamsAsync(
+                stock.symbol, "", stock.secType, stock.conId
+            )
+            chain = next(c for c in chains if c.exchange == EXCHANGE)
+            self.contract_cache.set_chain(symbol, chain)
 
         def valid_strike(strike):
             if strike % 1 == 0:
@@ -110,12 +383,12 @@ class NopeStrategy:
 
         contracts = [
             Option(
-                self.SYMBOL,
+                self.symbol,
                 expiration,
                 strike,
                 right,
                 EXCHANGE,
-                tradingClass=self.SYMBOL,
+                tradingClass=self.symbol,
             )
             for expiration in expirations
             for strike in strikes
@@ -124,123 +397,43 @@ class NopeStrategy:
         return contracts
 
     def get_num_open_buy_orders(self, right):
-        trades = self.get_trades()
-        return sum(
-            map(
-                lambda t: t.order.totalQuantity,
-                filter(
-                    lambda t: t.contract.right == right and t.order.action == "BUY",
-                    trades,
-                ),
-            )
-        )
+        return self.position_book.open_quantity(right, "BUY")
 
     def get_total_position(self, right):
         held_contracts = self.get_held_contracts_info(right)
         return sum(map(lambda c: c["position"], held_contracts))
 
-    def cancel_order_type(self, action, order_type="LMT"):
-        trades = self.get_trades()
-        filtered = list(
-            filter(
-                lambda t: t.order.action == action and t.order.orderType == order_type,
-                trades,
-            )
-        )
-        for trade in filtered:
-            self.ib.cancelOrder(trade.order)
-
-    def get_open_stop_orders(self):
-        trades = self.get_trades()
-        return set(
-            map(
-                lambda t: t.contract.conId,
-                filter(lambda t: t.order.orderType == "STP", trades),
-            )
-        )
-
-    def cancel_stop_loss_task(self):
-        if "set_stop_loss" in self.ib_tasks_dict:
-            stop_loss_task = self.ib_tasks_dict.pop("set_stop_loss")
-            stop_loss_task.cancel()
-
-    def set_stop_loss(self, right):
-        self.console_log("Check stop loss conditions")
-        total_position = self.get_total_position(right)
-        buy_limit = (
-            self.config["nope"]["call_limit"]
-            if right == "C"
-            else self.config["nope"]["put_limit"]
-        )
-        if total_position >= buy_limit:
-            existing_stop_orders = self.get_open_stop_orders()
-            held_contracts_info_no_stop_order = filter(
-                lambda c: c["contract"].conId not in existing_stop_orders,
-                self.get_held_contracts_info(right),
-            )
-            for contract_info in held_contracts_info_no_stop_order:
-                position = contract_info["position"]
-                avg_price = contract_info["avg"] / 100
-                contract = contract_info["contract"]
-                qualified_contracts = self.ib.qualifyContracts(contract)
-                order_price = stop_order_price(
-                    avg_price, self.config["nope"]["stop_loss_percentage"]
-                )
-
-                if len(qualified_contracts) > 0:
-                    stop_loss_order = StopOrder(
-                        "SELL",
-                        position,
-                        order_price,
-                        tif="DAY",
-                    )
-                    qualified_contract = qualified_contracts[0]
-                    trade = self.ib.placeOrder(qualified_contract, stop_loss_order)
-                    trade.filledEvent += log_fill
-                    self.log_order(qualified_contract, position, order_price, "STOP")
-                    self.cancel_stop_loss_task()
-
-    def schedule_stop_order_task(self, right):
-        async def stop_loss_periodic():
-            async def schedule_stop_loss():
-                try:
-                    self.set_stop_loss(right)
-                except Exception as e:
-                    log_exception(e, "schedule_stop_order_task")
-
-            while True:
-                await asyncio.gather(asyncio.sleep(120), schedule_stop_loss())
-
-        if "set_stop_loss" not in self.ib_tasks_dict:
-            loop = asyncio.get_event_loop()
-            self.ib_tasks_dict["set_stop_loss"] = loop.create_task(stop_loss_periodic())
-
-    def on_buy_fill(self, trade):
-        try:
-            fill = trade.fills[0]
-        except Exception as e:
-            log_exception(e, "on_buy_fill")
-            return
-
-        self.schedule_stop_order_task(fill.contract.right)
-
     def check_acc_balance(self, price, quantity):
         ib_account = self.config["ib"]["account"]
         if not ib_account:
             return True
-        acc_values = self.ib.accountValues(account=ib_account)
-        buy_power = list(
-            filter(lambda a: a.tag == "BuyingPower" and a.currency == "USD", acc_values)
-        )
-        try:
-            balance = buy_power[0]
-        except Exception as e:
-            log_exception(e, "check_acc_balance")
+        buying_power = self.position_book.buying_power
+        if buying_power is None:
+            log_exception(Exception("No BuyingPower value"), "check_acc_balance")
             return False
 
-        return float(balance.value) > price * 100 * quantity
+        return buying_power > price * 100 * quantity
+
+    def prefilter_by_delta(self, contracts, target_delta):
+        # Rank candidates by a local delta estimate so only the closest few
+        # are qualified and snapshotted from TWS
+        count = self.config["nope"]["auto_prefilter_count"]
+        price = self.market_data.underlying_price()
+        if util.isNan(price):
+            price = self._underlying_price
+        if count <= 0 or not price or len(contracts) <= count:
+            return contracts
+        return nearest_delta(
+            contracts,
+            price,
+            target_delta,
+            self.iv_surface.lookup(contracts),
+            now_utc().timestamp(),
+            count,
+        )
 
-    def select_contract(self, contracts, right):
+    @metrics.timed("select_contract")
+    async def select_contract(self, contracts, right):
         if self.config["nope"]["contract_auto_select"]:
             target = self.config["nope"]["auto_target_delta"] / 100
             target_delta = target if right == "C" else -target
@@ -264,8 +457,11 @@ class NopeStrategy:
 
                 return ticker_next
 
-            qualified_contracts = self.ib.qualifyContracts(*contracts)
-            tickers = self.ib.reqTickers(*qualified_contracts)
+            qualified_contracts = await self.contract_cache.qualify_async(
+                self.ib, *self.prefilter_by_delta(contracts, target_delta)
+            )
+            tickers = await self.get_tickers(qualified_contracts, require_greeks=True)
+            self.iv_surface.update(tickers)
             if len(tickers) > 0:
                 closest = reduce(reducer, tickers)
                 return closest
@@ -276,16 +472,18 @@ class NopeStrategy:
                 else -self.config["nope"]["put_strike_offset"] - 1
             )
             contract_to_buy = contracts[offset]
-            qualified_contracts = self.ib.qualifyContracts(contract_to_buy)
-            tickers = self.ib.reqTickers(*qualified_contracts)
+            qualified_contracts = await self.contract_cache.qualify_async(
+                self.ib, contract_to_buy
+            )
+            tickers = await self.get_tickers(qualified_contracts)
             if len(tickers) > 0:
                 return tickers[0]
         return None
 
-    def buy_contracts(self, right):
+    async def buy_contracts(self, right):
         action = "BUY"
-        contracts = self.find_eligible_contracts(self.SYMBOL, right)
-        ticker = self.select_contract(contracts, right)
+        contracts = await self.find_eligible_contracts(self.symbol, right)
+        ticker = await self.select_contract(contracts, right)
         if ticker is not None:
             price = midpoint_or_market_price(ticker)
             quantity = (
@@ -303,23 +501,23 @@ class NopeStrategy:
                     algoParams=[TagValue(tag="adaptivePriority", value="Normal")],
                     tif="DAY",
                 )
-                self.cancel_order_type("SELL", "STP")
-                trade = self.ib.placeOrder(contract, order)
+                with metrics.timer("placeOrder"):
+                    trade = self.ib.placeOrder(contract, order)
                 trade.filledEvent += log_fill
-                trade.filledEvent += self.on_buy_fill
+                self.set_order_deadline(trade)
+                self.record_signal_latency()
                 self.log_order(contract, quantity, price, action)
             else:
-                with open("logs/errors.txt", "a") as f:
-                    f.write(
-                        f"Error buying {right} at {self._nope_value} | {self._underlying_price}\n"
-                    )
+                log_error(
+                    f"Error buying {right} at {self._nope_value} | {self._underlying_price}\n"
+                )
 
     def get_total_buys(self, right):
         held_puts = self.get_total_position(right)
         existing_order_quantity = self.get_num_open_buy_orders(right)
         return held_puts + existing_order_quantity
 
-    def enter_positions(self):
+    async def enter_positions(self):
         self.console_log("Check enter thresholds")
         if (
             self.config["nope"]["long_enter"]
@@ -328,7 +526,7 @@ class NopeStrategy:
         ):
             total_buys = self.get_total_buys("C")
             if total_buys < self.config["nope"]["call_limit"]:
-                self.buy_contracts("C")
+                await self.place_once("BUY", "C", self.buy_contracts)
         elif (
             self.config["nope"]["short_enter"]
             < self._nope_value
@@ -336,51 +534,60 @@ class NopeStrategy:
         ):
             total_buys = self.get_total_buys("P")
             if total_buys < self.config["nope"]["put_limit"]:
-                self.buy_contracts("P")
+                await self.place_once("BUY", "P", self.buy_contracts)
 
     def get_held_contracts_info(self, right):
-        portfolio = self.get_portfolio()
+        positions = self.position_book.positions(right)
         return [
-            c
-            for c in map(
-                lambda p: {
-                    "contract": p.contract,
-                    "position": p.position,
-                    "avg": p.averageCost,
-                },
-                portfolio,
-            )
-            if c["contract"].right == right and c["position"] > 0
+            {
+                "contract": p.contract,
+                "position": p.position,
+                "avg": p.avgCost,
+            }
+            for p in positions
+            if p.position > 0
         ]
 
     def get_existing_order_ids(self, right, action):
-        trades = self.get_trades()
+        trades = self.get_trades(right=right, action=action)
         return set(
             map(
                 lambda t: t.contract.conId,
-                filter(
-                    lambda t: t.contract.right == right
-                    and t.order.action == action
-                    and t.order.orderType != "STP",
-                    trades,
-                ),
+                filter(lambda t: t.order.orderType != "STP", trades),
             )
         )
 
+    def order_deadline_args(self):
+        return {
+            "seconds": self.config["nope"]["minutes_cancel_unfilled"] * 60,
+            "reprices": self.config["nope"]["reprice_unfilled"],
+        }
+
+    def set_order_deadline(self, trade):
+        self.order_deadlines.register(trade, **self.order_deadline_args())
+
+    async def reprice_order(self, trade):
+        [ticker] = await self.get_tickers([trade.contract])
+        price = midpoint_or_market_price(ticker)
+        if trade.order.action == "SELL":
+            # As in sell_held_contracts, only sell at a gain
+            position = self.position_book.position(trade.contract.conId)
+            if position is None or not price > position.avgCost / 100:
+                return None
+        self.console_log("Repriced unfilled order")
+        return price
+
     def log_order(self, contract, quantity, price, action, avg=0):
         curr_date, curr_dt = get_datetime_for_logging()
         log_str = f"Placed {action} order {quantity} {contract.strike}{contract.right}{contract.lastTradeDateOrContractMonth}"
         if action == "SELL":
             log_str += f" ({round(avg, 2)} average)"
         log_str += f" for {round(price * 100, 2)} each, {self._nope_value} | {self._underlying_price} | {curr_dt}\n"
-        with open(f"logs/{curr_date}-trade.txt", "a") as f:
-            f.write(log_str)
-
-    def on_sell_fill(self, trade):
-        self.cancel_order_type("SELL", "STP")
-        self.cancel_stop_loss_task()
+        write_log(
+            f"logs/{self.log_prefix}{curr_date}-trade.txt", log_str, critical=True
+        )
 
-    def sell_held_contracts(self, right):
+    async def sell_held_contracts(self, right):
         action = "SELL"
         held_contracts_info = self.get_held_contracts_info(right)
         existing_contract_order_ids = self.get_existing_order_ids(right, action)
@@ -391,113 +598,148 @@ class NopeStrategy:
             )
         )
 
-        if len(remaining_contracts_info) > 0:
-            remaining_contracts_info.sort(key=lambda c: c["contract"].conId)
-            remaining_contracts = [c["contract"] for c in remaining_contracts_info]
-            qualified_contracts = self.ib.qualifyContracts(*remaining_contracts)
-            tickers = self.ib.reqTickers(*qualified_contracts)
-            tickers.sort(key=lambda t: t.contract.conId)
-            for idx, ticker in enumerate(tickers):
-                price = midpoint_or_market_price(ticker)
-                avg = remaining_contracts_info[idx]["avg"]
-                if not util.isNan(price) and price > (avg / 100):
-                    quantity = remaining_contracts_info[idx]["position"]
-                    order = LimitOrder(
-                        action,
-                        quantity,
-                        price,
-                        algoStrategy="Adaptive",
-                        algoParams=[TagValue(tag="adaptivePriority", value="Normal")],
-                        tif="DAY",
-                    )
-                    contract = ticker.contract
-                    trade = self.ib.placeOrder(contract, order)
-                    trade.filledEvent += log_fill
-                    trade.filledEvent += self.on_sell_fill
-                    self.log_order(contract, quantity, price, action, avg)
-                else:
-                    with open("logs/errors.txt", "a") as f:
-                        f.write(
-                            f"Error selling {right} at {self._nope_value} | {self._underlying_price}\n"
-                        )
-
-    def exit_positions(self):
+        if len(remaining_contracts_info) == 0:
+            return
+        held = {c["contract"].conId: c for c in remaining_contracts_info}
+
+        def make_order(contract, ticker):
+            price = midpoint_or_market_price(ticker)
+            avg = held[contract.conId]["avg"]
+            if util.isNan(price) or not price > (avg / 100):
+                return None
+            return LimitOrder(
+                action,
+                held[contract.conId]["position"],
+                price,
+                algoStrategy="Adaptive",
+                algoParams=[TagValue(tag="adaptivePriority", value="Normal")],
+                tif="DAY",
+            )
+
+        results = await self.order_executor.submit(
+            [c["contract"] for c in remaining_contracts_info], make_order
+        )
+        for result in results:
+            if result.trade is None:
+                # Same line as before the executor; the outcome of each leg
+                # goes to the console summary below and the order_leg metrics
+                log_error(
+                    f"Error selling {right} at {self._nope_value} | {self._underlying_price}\n"
+                )
+                continue
+            trade = result.trade
+            trade.filledEvent += log_fill
+            self.set_order_deadline(trade)
+            self.record_signal_latency()
+            self.log_order(
+                trade.contract,
+                trade.order.totalQuantity,
+                trade.order.lmtPrice,
+                action,
+                held[trade.contract.conId]["avg"],
+            )
+        self.console_log(
+            "Sell legs: "
+            + ", ".join(
+                f"{r.contract.localSymbol or r.contract.conId} {r.outcome} "
+                f"{r.seconds * 1000:.0f}ms"
+                for r in results
+            )
+        )
+
+    async def place_once(self, action, right, place):
+        # Skip if the same decision is already awaiting TWS, so overlapping
+        # evaluations cannot both pass the position limit checks
+        key = (action, right)
+        if key in self._orders_in_flight:
+            return
+        self._orders_in_flight.add(key)
+        try:
+            await place(right)
+        finally:
+            self._orders_in_flight.discard(key)
+
+    async def exit_positions(self):
         self.console_log("Check exit thresholds")
         if self._nope_value > self.config["nope"]["long_exit"]:
-            self.sell_held_contracts("C")
+            await self.place_once("SELL", "C", self.sell_held_contracts)
         if self._nope_value < self.config["nope"]["short_exit"]:
-            self.sell_held_contracts("P")
+            await self.place_once("SELL", "P", self.sell_held_contracts)
 
     def run_ib(self):
         async def ib_periodic():
-            async def enter_pos():
+            async def refresh_market_data():
                 try:
-                    self.enter_positions()
+                    await self.refresh_market_data()
                 except Exception as e:
-                    log_exception(e, "enter_positions")
-
-            async def exit_pos():
-                try:
-                    self.exit_positions()
-                except Exception as e:
-                    log_exception(e, "exit_positions")
-
-            while True:
-                await asyncio.gather(asyncio.sleep(60), enter_pos(), exit_pos())
-
-        async def check_orders():
-            cancel_after = self.config["nope"]["minutes_cancel_unfilled"]
-
-            async def cancel_unfilled_orders():
-                cancellable_statuses = ["PreSubmitted", "Submitted"]
-                trades = self.get_trades()
-                filtered = list(
-                    filter(
-                        lambda t: t.order.orderType != "STP",
-                        trades,
-                    )
-                )
-                for trade in filtered:
-                    submit_logs = list(
-                        filter(lambda l: l.status in cancellable_statuses, trade.log)
-                    )
-                    try:
-                        submit_log = submit_logs[0]
-                    except Exception as e:
-                        log_exception(e, "cancel_unfilled_orders")
-                        return
+                    log_exception(e, "refresh_market_data")
 
-                    diff = get_datetime_diff_from_now(submit_log.time)
-                    if diff > cancel_after:
-                        self.ib.cancelOrder(trade.order)
-                        self.console_log("Cancelled unfilled order")
+            async def evaluate_missed_reading():
+                # Every new reading is evaluated as it arrives; this only
+                # catches one that arrived while disconnected
+                reading = self._nope_reading
+                if reading is not None and reading.seq != self._evaluated_seq:
+                    await self.evaluate_positions()
 
             while True:
+                await refresh_market_data()
+                # The interval set by the NOPE fetch loop's last reading
                 await asyncio.gather(
-                    asyncio.sleep(cancel_after * 60), cancel_unfilled_orders()
+                    asyncio.sleep(self.cadence.interval), evaluate_missed_reading()
                 )
 
         loop = asyncio.get_event_loop()
         self.ib_tasks_dict["run_ib"] = loop.create_task(ib_periodic())
-        self.ib_tasks_dict["check_orders"] = loop.create_task(check_orders())
 
-    def run_qt_tasks(self):
+    def data_tasks(self, shared_tasks=True):
+        """The NOPE fetch loop, and with `shared_tasks` the token refresh and
+        metrics summary, which one strategy runs for all symbols."""
+
         async def nope_periodic():
+            loop = asyncio.get_event_loop()
+            # A feed paces its own readings, and the publisher logs them
+            subscribed = isinstance(self.qt, NopeFeedReader)
+
             async def fetch_and_report():
+                previous = self.nope_channel.latest()
+                requests = getattr(self.qt, "requests", None)
                 try:
-                    self.set_nope_value()
+                    await self.set_nope_value()
                 except Exception as e:
                     log_exception(e, "set_nope_value")
 
+                reading = self.nope_channel.latest()
+                nope_value, underlying_price = (
+                    (reading.value, reading.price) if reading else (0, 0)
+                )
                 self.console_log("Updated NOPE and stock price")
                 curr_date, curr_dt = get_datetime_for_logging()
-                with open(f"logs/{curr_date}.txt", "a") as f:
-                    f.write(
-                        f"NOPE @ {self._nope_value} | Stock Price @ {self._underlying_price} | {curr_dt}\n"
+                if not subscribed:
+                    write_log(
+                        f"logs/{self.log_prefix}{curr_date}.txt",
+                        f"NOPE @ {nope_value} | Stock Price @ {underlying_price} | {curr_dt}\n",
+                    )
+
+                # Providers without a request count are counted once per fetch
+                requests = 1 if requests is None else self.qt.requests - requests
+                fresh = reading is not previous and underlying_price
+                interval = self.cadence.update(
+                    nope_value if fresh else None, loop.time(), requests
+                )
+                if not subscribed:
+                    write_log(
+                        f"logs/{self.log_prefix}{curr_date}-cadence.txt",
+                        f"Interval @ {interval:.1f}s | Distance @ {self.cadence.distance:.1f} "
+                        f"| Velocity @ {self.cadence.velocity * 60:.1f}/min "
+                        f"| Requests @ {self.cadence.requests_per_hour()}/hr | {curr_dt}\n",
                     )
+                return interval
 
             while True:
-                await asyncio.gather(asyncio.sleep(60), fetch_and_report())
+                start = loop.time()
+                interval = await fetch_and_report()
+                if not subscribed:
+                    await asyncio.sleep(max(start + interval - loop.time(), 0))
 
         async def token_refresh_periodic():
             async def refresh_token():
@@ -510,16 +752,55 @@ class NopeStrategy:
                 await asyncio.sleep(120)
                 await refresh_token()
 
+        async def metrics_summary_periodic():
+            interval = self.config["metrics"]["summary_interval_minutes"]
+            while metrics.enabled:
+                await asyncio.sleep(interval * 60)
+                curr_date, curr_dt = get_datetime_for_logging()
+                for line in metrics.summary_lines(curr_dt):
+                    write_log(f"logs/{curr_date}-metrics.txt", line)
+
+        if not shared_tasks:
+            return [nope_periodic()]
+        return [nope_periodic(), token_refresh_periodic(), metrics_summary_periodic()]
+
+    def run_qt_tasks(self):
+        started = threading.Event()
+
         def run_thread():
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
-            loop.create_task(nope_periodic())
-            loop.create_task(token_refresh_periodic())
+            for coro in self.data_tasks():
+                loop.create_task(coro)
+            self._data_loop = loop
+            started.set()
             loop.run_forever()
 
         thread = threading.Thread(target=run_thread)
         thread.start()
+        started.wait()
+
+    def add_data_tasks(self, strategy: "NopeStrategy"):
+        """Runs another symbol's NOPE fetch loop on this strategy's data
+        thread, concurrently with its own."""
+
+        def start():
+            for coro in strategy.data_tasks(shared_tasks=False):
+                self._data_loop.create_task(coro)
+
+        self._data_loop.call_soon_threadsafe(start)
 
     def execute(self):
+        self.market_data.reset()
         self.req_market_data()
+        self.position_book.reset()
+        self.ib_tasks_dict["stop_loss_sync"] = asyncio.ensure_future(
+            self.stop_losses.sync()
+        )
+        self.order_deadlines.reset()
+        self.order_deadlines.adopt(
+            [t for t in self.get_trades() if t.order.orderType != "STP"],
+            **self.order_deadline_args(),
+        )
+        self.nope_channel.bind(asyncio.get_event_loop(), self.on_nope_reading)
         self.run_ib()
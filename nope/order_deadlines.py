@@ -0,0 +1,90 @@
+import asyncio
+
+from ib_insync import IB, OrderStatus, Trade, util
+
+from utils.metrics import metrics
+from utils.util import log_exception, now_utc
+
+
+class OrderDeadlines:
+    """Gives every registered order its own deadline on the event loop.
+
+    An order still working when its deadline passes is cancelled, or first
+    repriced up to `reprices` times, each reprice starting a new deadline.
+    Fills and cancels remove the deadline, so nothing is rescanned.
+    `reprice(trade)` is awaited for the new limit price; None cancels.
+    """
+
+    WORKING_STATUSES = (OrderStatus.PreSubmitted, OrderStatus.Submitted)
+
+    def __init__(self, ib: IB, reprice=None):
+        self.ib = ib
+        self.reprice = reprice
+        self._timers = {}
+        ib.orderStatusEvent += self.on_order_status
+
+    def __len__(self):
+        return len(self._timers)
+
+    def register(self, trade: Trade, seconds, reprices=0):
+        self.remove(trade)
+        loop = asyncio.get_event_loop()
+        self._timers[id(trade)] = loop.call_at(
+            loop.time() + seconds, self._expire, trade, seconds, reprices
+        )
+
+    def adopt(self, trades, seconds, reprices=0):
+        """Registers orders that were already working, e.g. after a
+        reconnect, with deadlines counted from their submission."""
+        now = now_utc()
+        for trade in trades:
+            submitted = [
+                entry.time
+                for entry in trade.log
+                if entry.status in self.WORKING_STATUSES
+            ]
+            age = (now - submitted[0]).total_seconds() if submitted else 0
+            self.register(trade, max(seconds - age, 0), reprices)
+
+    def remove(self, trade: Trade):
+        timer = self._timers.pop(id(trade), None)
+        if timer is not None:
+            timer.cancel()
+
+    def reset(self):
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+
+    def on_order_status(self, trade: Trade):
+        if trade.isDone():
+            self.remove(trade)
+
+    def _expire(self, trade: Trade, seconds, reprices):
+        self._timers.pop(id(trade), None)
+        if not trade.isActive():
+            return
+        if reprices > 0 and self.reprice is not None:
+            asyncio.ensure_future(self._reprice(trade, seconds, reprices))
+        else:
+            self._cancel(trade)
+
+    def _cancel(self, trade: Trade):
+        with metrics.timer("cancel_unfilled_orders"):
+            self.ib.cancelOrder(trade.order)
+
+    async def _reprice(self, trade: Trade, seconds, reprices):
+        try:
+            price = await self.reprice(trade)
+        except Exception as e:
+            log_exception(e, "reprice")
+            price = None
+        if not trade.isActive():
+            return
+        if price is None or util.isNan(price):
+            self._cancel(trade)
+            return
+        trade.order.lmtPrice = price
+        with metrics.timer("placeOrder"):
+            self.ib.placeOrder(trade.contract, trade.order)
+        self.register(trade, seconds, reprices - 1)
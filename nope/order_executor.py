@@ -0,0 +1,89 @@
+import time
+from typing import NamedTuple, Optional
+
+from ib_insync import IB, Contract, OrderStatus, Trade
+
+from nope.contract_cache import ContractCache
+from utils.metrics import metrics
+
+PLACED = "placed"
+SKIPPED = "skipped"
+UNQUALIFIED = "unqualified"
+NO_QUOTE = "no_quote"
+
+
+class LegResult(NamedTuple):
+    contract: Contract
+    outcome: str
+    trade: Optional[Trade]
+    # From the start of the batch until the leg was placed or given up on
+    seconds: float
+
+
+class BatchOrderExecutor:
+    """Places a batch of order legs after resolving them together: one
+    qualifyContracts call for the legs not in the contract cache and one
+    reqTickers snapshot for the legs without a stream. Legs are paired with
+    their tickers by conId, so a leg that fails to qualify or has no quote
+    only drops itself.
+
+    Per-leg latency goes to the "order_leg" stage, and the time until TWS
+    acknowledges each placed leg to "order_ack".
+    """
+
+    def __init__(self, ib: IB, contract_cache: ContractCache, get_tickers):
+        self.ib = ib
+        self.contract_cache = contract_cache
+        # async get_tickers(contracts) -> tickers, e.g. NopeStrategy.get_tickers
+        self.get_tickers = get_tickers
+
+    async def submit(self, contracts, make_order, quotes=True):
+        """Calls make_order(contract, ticker) for every leg that qualified
+        (and, with `quotes`, has a ticker) and places the orders it returns;
+        None skips the leg. Returns a LegResult per contract, in order."""
+        start = time.perf_counter()
+        qualified = await self.contract_cache.qualify_async(self.ib, *contracts)
+        qualified_ids = set(map(id, qualified))
+        tickers = {}
+        if quotes and qualified:
+            tickers = {t.contract.conId: t for t in await self.get_tickers(qualified)}
+
+        results = []
+        for contract in contracts:
+            trade = None
+            ticker = tickers.get(contract.conId)
+            if id(contract) not in qualified_ids:
+                outcome = UNQUALIFIED
+            elif quotes and ticker is None:
+                outcome = NO_QUOTE
+            else:
+                order = make_order(contract, ticker)
+                if order is None:
+                    outcome = SKIPPED
+                else:
+                    with metrics.timer("placeOrder"):
+                        trade = self.ib.placeOrder(contract, order)
+                    self._time_ack(trade)
+                    outcome = PLACED
+            results.append(
+                LegResult(contract, outcome, trade, time.perf_counter() - start)
+            )
+
+        if metrics.enabled:
+            for result in results:
+                metrics.observe("order_leg", result.seconds)
+                metrics.incr(f"order_leg_{result.outcome}")
+        return results
+
+    def _time_ack(self, trade: Trade):
+        if not metrics.enabled:
+            return
+        placed = time.perf_counter()
+
+        def on_status(trade):
+            if trade.orderStatus.status != OrderStatus.PendingSubmit:
+                metrics.observe("order_ack", time.perf_counter() - placed)
+                trade.statusEvent.disconnect(on_status)
+
+        # A closure is otherwise only weakly referenced by the event
+        trade.statusEvent.connect(on_status, keep_ref=True)
@@ -0,0 +1,150 @@
+from collections import defaultdict
+
+from ib_insync import IB, AccountValue, Fill, Position, Trade
+
+
+class PositionBook:
+    """Open orders, positions and buying power for one symbol, maintained
+    incrementally from ib_insync events instead of rescanning
+    ib.openTrades()/ib.portfolio() on every query.
+    """
+
+    def __init__(self, ib: IB, symbol, account=""):
+        self.ib = ib
+        self.symbol = symbol
+        self.account = account
+        self.buying_power = None
+        self._trades = {}
+        self._trade_keys = {}
+        self._trade_index = defaultdict(set)
+        self._positions = {}
+        self._position_index = defaultdict(set)
+
+        ib.newOrderEvent += self.on_trade
+        ib.openOrderEvent += self.on_trade
+        ib.orderStatusEvent += self.on_trade
+        ib.cancelOrderEvent += self.on_trade
+        ib.execDetailsEvent += self.on_exec_details
+        ib.positionEvent += self.on_position
+        ib.accountValueEvent += self.on_account_value
+
+    def reset(self):
+        # Rebuild from ib_insync's state, e.g. after a reconnect
+        self._trades.clear()
+        self._trade_keys.clear()
+        self._trade_index.clear()
+        self._positions.clear()
+        self._position_index.clear()
+        for trade in self.ib.openTrades():
+            self.on_trade(trade)
+        for position in self.ib.positions():
+            self.on_position(position)
+        for account_value in self.ib.accountValues(account=self.account):
+            self.on_account_value(account_value)
+
+    @staticmethod
+    def _keys(trade: Trade):
+        right = trade.contract.right
+        action = trade.order.action
+        order_type = trade.order.orderType
+        return (
+            ("right", right),
+            ("action", action),
+            ("type", order_type),
+            ("right_action", right, action),
+            ("action_type", action, order_type),
+        )
+
+    def on_trade(self, trade: Trade):
+        if trade.contract.symbol != self.symbol:
+            return
+        key = id(trade)
+        for index_key in self._trade_keys.pop(key, ()):
+            self._trade_index[index_key].discard(key)
+        self._trades.pop(key, None)
+        if trade.isActive():
+            self._trades[key] = trade
+            self._trade_keys[key] = self._keys(trade)
+            for index_key in self._trade_keys[key]:
+                self._trade_index[index_key].add(key)
+
+    def on_exec_details(self, trade: Trade, fill: Fill):
+        self.on_trade(trade)
+        contract = fill.contract
+        if contract.symbol != self.symbol:
+            return
+        # Applied right away; the following positionEvent is authoritative
+        shares = fill.execution.shares
+        if fill.execution.side == "SLD":
+            shares = -shares
+        held = self._positions.get(contract.conId)
+        position = held.position if held else 0
+        avg_cost = held.avgCost if held else 0
+        new_position = position + shares
+        if shares > 0 and new_position > 0:
+            multiplier = float(contract.multiplier or 100)
+            cost = fill.execution.price * multiplier
+            avg_cost = (avg_cost * position + cost * shares) / new_position
+        self.on_position(
+            Position(fill.execution.acctNumber, contract, new_position, avg_cost)
+        )
+
+    def on_position(self, position: Position):
+        contract = position.contract
+        if contract.symbol != self.symbol:
+            return
+        if self.account and position.account and position.account != self.account:
+            return
+        held = self._positions.pop(contract.conId, None)
+        if held is not None:
+            self._position_index[held.contract.right].discard(contract.conId)
+        if position.position != 0:
+            # Keep the contract object we already have, it may be qualified
+            if held is not None:
+                position = position._replace(contract=held.contract)
+            self._positions[contract.conId] = position
+            self._position_index[contract.right].add(contract.conId)
+
+    def on_account_value(self, account_value: AccountValue):
+        if (
+            account_value.tag == "BuyingPower"
+            and account_value.currency == "USD"
+            and (not self.account or account_value.account == self.account)
+        ):
+            self.buying_power = float(account_value.value)
+
+    def trades(self, **criteria):
+        """Active trades, optionally narrowed by right, action and order_type."""
+        right = criteria.get("right")
+        action = criteria.get("action")
+        order_type = criteria.get("order_type")
+        if right is not None and action is not None:
+            keys = self._trade_index[("right_action", right, action)]
+        elif action is not None and order_type is not None:
+            keys = self._trade_index[("action_type", action, order_type)]
+        elif right is not None:
+            keys = self._trade_index[("right", right)]
+        elif action is not None:
+            keys = self._trade_index[("action", action)]
+        elif order_type is not None:
+            keys = self._trade_index[("type", order_type)]
+        else:
+            keys = self._trades.keys()
+
+        trades = [self._trades[k] for k in keys]
+        if order_type is not None and right is not None:
+            trades = [t for t in trades if t.order.orderType == order_type]
+        return trades
+
+    def open_quantity(self, right, action):
+        return sum(
+            t.order.totalQuantity for t in self.trades(right=right, action=action)
+        )
+
+    def positions(self, right=None):
+        if right is None:
+            return list(self._positions.values())
+        return [self._positions[c] for c in self._position_index[right]]
+
+    def position(self, con_id):
+        return self._positions.get(con_id)
@@ -0,0 +1,172 @@
+import asyncio
+import math
+import time
+
+from utils.metrics import metrics
+from utils.util import log_exception
+
+# A NOPE provider is anything with `async get_nope()` returning [nope, price],
+# or None when there is no reading to publish (the fetch failed, the chain had
+# no volume, or nope.nope_feed.NopeFeedReader has nothing new), and
+# `refresh_access_token()`.
+# Providers that count their HTTP calls in `requests` get rate limited by
+# nope.cadence.AdaptiveCadence. Implementations:
+# QuestradeClient, TDAClient, backtest.replay.ReplayProvider and
+# HedgedNopeProvider below.
+
+
+class RateLimiter:
+    """Token bucket shared by every request to one provider, across all
+    symbols. `rate` requests per second with bursts of up to `burst`; a rate
+    of 0 does not limit."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self._tokens = self.burst
+        self._last = None
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        loop = asyncio.get_event_loop()
+        while True:
+            now = loop.time()
+            if self._last is not None:
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._last) * self.rate
+                )
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def valid_reading(reading):
+    return (
+        reading is not None
+        and reading[1] > 0
+        and math.isfinite(reading[0])
+        and math.isfinite(reading[1])
+    )
+
+
+class ProviderStats:
+    """Exponentially weighted latency and error rate of one provider."""
+
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.latency = None
+        self.error_rate = 0.0
+        self.requests = 0
+
+    def record(self, seconds, ok):
+        self.requests += 1
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += self.alpha * (seconds - self.latency)
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+
+    def expected_seconds(self, failure_cost):
+        """Expected wait for a valid reading when every error costs
+        `failure_cost` seconds more."""
+        if self.latency is None:
+            return math.inf
+        return self.latency + self.error_rate * failure_cost
+
+
+class HedgedNopeProvider:
+    """Asks the primary provider for NOPE and, if it has not answered within
+    `hedge_after` seconds or answers without a valid reading, the next one as
+    well. The first valid reading wins.
+
+    Requests that lose the race keep running so their latency still counts
+    towards the provider's stats. A provider with a request still in flight
+    is not asked again; the next cycle waits on that request instead.
+
+    With `adaptive`, providers are tried in order of recent latency plus
+    error rate times `hedge_after`; providers without a measurement keep
+    their configured order, after the measured ones.
+    """
+
+    def __init__(self, providers: dict, hedge_after=5.0, adaptive=True, alpha=0.2):
+        self.providers = providers
+        self.hedge_after = hedge_after
+        self.adaptive = adaptive
+        self.stats = {name: ProviderStats(alpha) for name in providers}
+        self._in_flight = {}
+
+    @property
+    def requests(self):
+        return sum(getattr(p, "requests", 0) for p in self.providers.values())
+
+    def ranked(self):
+        names = list(self.providers)
+        if not self.adaptive:
+            return names
+        return sorted(
+            names,
+            key=lambda name: (
+                self.stats[name].expected_seconds(self.hedge_after),
+                names.index(name),
+            ),
+        )
+
+    async def _timed_get_nope(self, name):
+        start = time.perf_counter()
+        try:
+            reading = await self.providers[name].get_nope()
+        except Exception as e:
+            log_exception(e, f"{name} get_nope")
+            reading = None
+        ok = valid_reading(reading)
+        self.stats[name].record(time.perf_counter() - start, ok)
+        return reading if ok else None
+
+    def _request(self, name):
+        task = self._in_flight.get(name)
+        if task is None:
+            task = asyncio.ensure_future(self._timed_get_nope(name))
+            self._in_flight[name] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(name, None))
+        return task
+
+    async def get_nope(self):
+        remaining = self.ranked()
+        pending = {}
+
+        def request_next():
+            name = remaining.pop(0)
+            pending[self._request(name)] = name
+
+        request_next()
+        while pending:
+            done, _ = await asyncio.wait(
+                pending,
+                timeout=self.hedge_after if remaining else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                if metrics.enabled:
+                    metrics.incr("nope_provider_hedged")
+                request_next()
+                continue
+            for task in done:
+                name = pending.pop(task)
+                reading = task.result()
+                if reading is not None:
+                    if metrics.enabled:
+                        metrics.incr(f"nope_provider_{name}_wins")
+                    return reading
+            if remaining:
+                request_next()
+        return None
+
+    def refresh_access_token(self):
+        for name, provider in self.providers.items():
+            try:
+                provider.refresh_access_token()
+            except Exception as e:
+                log_exception(e, f"{name} refresh_access_token")
@@ -0,0 +1,129 @@
+from ib_insync import IB, Contract, Fill, StopOrder, Trade
+
+from nope.order_executor import BatchOrderExecutor
+from nope.position_book import PositionBook
+from utils.metrics import metrics
+from utils.util import log_fill, stop_order_price
+
+
+class StopLossManager:
+    """Keeps one SELL stop per held contract, keyed by conId, for the whole
+    position at `percentage` below its average cost.
+
+    Stops are placed, resized or cancelled from execDetailsEvent as fills
+    come in, using the fill-updated position book, so a new position is
+    protected as soon as its entry fills. Resizing modifies the working stop
+    in place. sync() adopts open stops and protects positions held from
+    before, e.g. after a reconnect or once DAY stops have expired, placing
+    their stops as one batch.
+    """
+
+    def __init__(
+        self,
+        ib: IB,
+        position_book: PositionBook,
+        percentage,
+        executor: BatchOrderExecutor,
+        on_place=None,
+    ):
+        self.ib = ib
+        self.position_book = position_book
+        self.percentage = percentage
+        self.executor = executor
+        # Called with (contract, quantity, stop price) for every stop placed
+        self.on_place = on_place
+        self._stops = {}
+        ib.execDetailsEvent += self.on_exec_details
+        ib.orderStatusEvent += self.on_order_status
+
+    def stop(self, con_id):
+        return self._stops.get(con_id)
+
+    async def sync(self):
+        self._stops = {
+            trade.contract.conId: trade
+            for trade in self.position_book.trades(action="SELL", order_type="STP")
+        }
+        for trade in list(self._stops.values()):
+            self.update(trade.contract)
+
+        def make_order(contract, ticker):
+            # A fill may have placed the stop while the batch resolved
+            target = self._target(contract.conId)
+            if target is None or contract.conId in self._stops:
+                return None
+            return StopOrder("SELL", *target, tif="DAY")
+
+        # Position contracts carry no exchange, the batch qualifies them
+        unprotected = [
+            position.contract
+            for position in self.position_book.positions()
+            if position.position > 0 and position.contract.conId not in self._stops
+        ]
+        if unprotected:
+            results = await self.executor.submit(unprotected, make_order, quotes=False)
+            for result in results:
+                if result.trade is not None:
+                    result.trade.filledEvent += log_fill
+                    self._placed(result.trade)
+
+    def on_exec_details(self, trade: Trade, fill: Fill):
+        # The position book handles execDetailsEvent first, it was created
+        # before this manager
+        if fill.contract.symbol != self.position_book.symbol:
+            return
+        # The order's contract is routed SMART, the fill's names the exchange
+        self.update(trade.contract)
+
+    def on_order_status(self, trade: Trade):
+        # A stop cancelled outside this manager, e.g. a DAY stop expiring;
+        # sync() or the next fill in the contract places a new one
+        con_id = trade.contract.conId
+        if self._stops.get(con_id) is trade and trade.isDone():
+            del self._stops[con_id]
+
+    def _target(self, con_id):
+        """(quantity, stop price) for the held position, None when flat."""
+        position = self.position_book.position(con_id)
+        if position is None or position.position <= 0:
+            return None
+        return (
+            position.position,
+            stop_order_price(position.avgCost / 100, self.percentage),
+        )
+
+    def _placed(self, trade: Trade):
+        self._stops[trade.contract.conId] = trade
+        if self.on_place is not None:
+            order = trade.order
+            self.on_place(trade.contract, order.totalQuantity, order.auxPrice)
+
+    def update(self, contract: Contract):
+        con_id = contract.conId
+        target = self._target(con_id)
+        stop = self._stops.get(con_id)
+        if stop is not None and stop.isDone():
+            del self._stops[con_id]
+            stop = None
+
+        if target is None:
+            if stop is not None:
+                del self._stops[con_id]
+                self.ib.cancelOrder(stop.order)
+            return
+
+        quantity, price = target
+        if stop is None:
+            order = StopOrder("SELL", quantity, price, tif="DAY")
+        elif stop.order.totalQuantity == quantity and stop.order.auxPrice == price:
+            return
+        else:
+            order = stop.order
+            order.totalQuantity = quantity
+            order.auxPrice = price
+
+        with metrics.timer("placeOrder"):
+            trade = self.ib.placeOrder(contract, order)
+        if stop is None:
+            trade.filledEvent += log_fill
+        self._placed(trade)
@@ -0,0 +1,19 @@
+import toml
+from ib_insync import IB
+
+from nope.nope_feed import NopeFeedWriter
+from nope.nope_strategy import NopeStrategy
+
+with open("conf/conf.toml", "r") as f:
+    config = toml.load(f)
+
+# The one process fetching NOPE upstream; main.py processes with
+# [feed] subscribe = true read it from the feed
+config["feed"]["subscribe"] = False
+feed_config = config["feed"]
+feed = NopeFeedWriter(
+    feed_config["path"], config["nope"]["symbols"], slots=feed_config["slots"]
+)
+
+# Never connected, the strategies only fetch and log NOPE on their data thread
+nope_strategies = NopeStrategy.for_symbols(config, IB(), sink=feed.publish)
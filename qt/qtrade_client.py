@@ -1,59 +1,208 @@
-from datetime import datetime
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 from qtrade import Questrade
+from requests.adapters import HTTPAdapter
+
+from nope.chain_recorder import ChainRecorder
+from nope.greeks import ChainGreeks
+from nope.nope_calc import (
+    ChainLayout,
+    IncrementalNope,
+    OptionChainArrays,
+    expiry_day,
+    nope_from_delta,
+    questrade_total_delta,
+)
+from nope.providers import RateLimiter
+from utils.metrics import metrics
+from utils.util import get_datetime_for_logging, log_error, now_utc
 
 
 class QuestradeClient:
     TICKER = "SPY"
 
-    def __init__(self, token_yaml):
+    def __init__(
+        self,
+        token_yaml,
+        batch_size=10,
+        max_concurrency=4,
+        refresh_on_start=True,
+        incremental: IncrementalNope = None,
+        recorder: ChainRecorder = None,
+        greeks: ChainGreeks = None,
+        ticker=TICKER,
+        limiter: RateLimiter = None,
+        client: Questrade = None,
+    ):
         self.yaml_path = token_yaml
-        self.client = Questrade(token_yaml=token_yaml)
-        self.refresh_access_token()
+        self.ticker = ticker
+        # Throttles every request, shared by the clients of all underlyings
+        self.limiter = limiter
+        # Number of expiry filters per option quote request
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency + 2)
+        # Keep one pooled connection per concurrent request. A shared qtrade
+        # client (session and token) gets room for this client's requests too
+        pool_size = max_concurrency + 2
+        if client is None:
+            client = Questrade(token_yaml=token_yaml)
+        else:
+            pool_size += client.session.get_adapter("https://")._pool_maxsize
+        self.client = client
+        adapter = HTTPAdapter(pool_maxsize=pool_size)
+        self.client.session.mount("https://", adapter)
+        self.client.session.mount("http://", adapter)
+        self._underlying_id = None
+        self.incremental = incremental
+        self.recorder = recorder
+        # Computes deltas from quote mids instead of using Questrade's
+        self.greeks = greeks
+        self._chain = None
+        self._layout = None
+        # HTTP requests made, for rate limit accounting
+        self.requests = 0
+        if refresh_on_start:
+            self.refresh_access_token()
+
+    def sibling(self, ticker, **kwargs):
+        """A client for another underlying sharing this one's qtrade client
+        and rate limiter."""
+        return type(self)(
+            self.yaml_path,
+            batch_size=self.batch_size,
+            max_concurrency=self.max_concurrency,
+            refresh_on_start=False,
+            ticker=ticker,
+            limiter=self.limiter,
+            client=self.client,
+            **kwargs,
+        )
 
     def refresh_access_token(self):
         self.client.refresh_access_token(from_yaml=True, yaml_path=self.yaml_path)
 
-    def get_nope(self):
-        call_option_filters = []
-        put_option_filters = []
-        chain = self.client.get_option_chain(self.TICKER)
-        quote = self.client.get_quote(self.TICKER)
-        underlying_id = quote["symbolId"]
+    async def _run(self, fn, *args, **kwargs):
+        # qtrade is blocking, so every request runs on the client's thread pool
+        if self.limiter is not None:
+            await self.limiter.acquire()
+        self.requests += 1
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+
+    async def get_underlying_id(self):
+        if self._underlying_id is None:
+            info = await self._run(self.client.ticker_information, self.ticker)
+            self._underlying_id = info["symbolId"]
+        return self._underlying_id
+
+    async def fetch_chain(self, underlying_id):
+        return await self._run(
+            self.client._send_message, "get", f"symbols/{underlying_id}/options"
+        )
+
+    async def fetch_quote(self, underlying_id):
+        response = await self._run(
+            self.client._send_message,
+            "get",
+            "markets/quotes",
+            params={"ids": str(underlying_id)},
+        )
+        return response["quotes"][0]
+
+    async def fetch_option_quotes(self, option_filters):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
 
-        for optionChain in chain["optionChain"]:
+        async def fetch_batch(batch):
+            async with semaphore:
+                response = await self._run(self.client.get_option_quotes, batch, [])
+            return response["optionQuotes"]
+
+        batches = [
+            option_filters[i : i + self.batch_size]
+            for i in range(0, len(option_filters), self.batch_size)
+        ]
+        results = await asyncio.gather(*(fetch_batch(b) for b in batches))
+        return [q for quotes in results for q in quotes]
+
+    def option_filters(self, expiry_chains, underlying_id):
+        option_filters = []
+        for optionChain in expiry_chains:
             exp_date = optionChain["expiryDate"]
-            call_option_filters.append(
-                {
-                    "optionType": "Call",
-                    "expiryDate": exp_date,
-                    "underlyingId": underlying_id,
-                }
-            )
-            put_option_filters.append(
-                {
-                    "optionType": "Put",
-                    "expiryDate": exp_date,
-                    "underlyingId": underlying_id,
-                }
+            for option_type in ("Call", "Put"):
+                option_filters.append(
+                    {
+                        "optionType": option_type,
+                        "expiryDate": exp_date,
+                        "underlyingId": underlying_id,
+                    }
+                )
+        return option_filters
+
+    async def fetch_options(self, underlying_id, quote):
+        if self.incremental is None and self.greeks is None and self.recorder is None:
+            # Only the total is needed, which is cheaper to pack than the
+            # per-quote arrays
+            chain = await self.fetch_chain(underlying_id)
+            option_quotes = await self.fetch_option_quotes(
+                self.option_filters(chain["optionChain"], underlying_id)
             )
+            return None, questrade_total_delta(option_quotes), True
 
-        call_option_quotes = self.client.get_option_quotes(call_option_filters, [])
-        put_option_quotes = self.client.get_option_quotes(put_option_filters, [])
+        full_refresh = self.incremental is None or self.incremental.begin_cycle()
+        if full_refresh or self._layout is None:
+            chain = await self.fetch_chain(underlying_id)
+            self._chain = chain
+            # Reused while the chain lists the same contracts
+            self._layout = ChainLayout.from_questrade(chain, previous=self._layout)
+            expiry_chains = chain["optionChain"]
+        else:
+            near = set(self.incremental.near_expiries())
+            expiry_chains = [
+                c
+                for c in self._chain["optionChain"]
+                if expiry_day(c["expiryDate"]) in near
+            ]
 
-        total_call_delta = sum(
-            map(lambda q: q["volume"] * q["delta"], call_option_quotes["optionQuotes"])
+        option_quotes = await self.fetch_option_quotes(
+            self.option_filters(expiry_chains, underlying_id)
         )
-        total_put_delta = sum(
-            map(lambda q: q["volume"] * q["delta"], put_option_quotes["optionQuotes"])
+        options = OptionChainArrays.from_questrade(
+            self._layout,
+            option_quotes,
+            prices=self.recorder is not None or self.greeks is not None,
+        )
+        if self.greeks is not None:
+            quote = await quote
+            self.greeks.apply(options, quote["lastTradePrice"], now_utc().timestamp())
+        if self.incremental is None:
+            return options, options.total_delta(), full_refresh
+
+        refreshed = [expiry_day(c["expiryDate"]) for c in expiry_chains]
+        return options, self.incremental.update(options, refreshed), full_refresh
+
+    @metrics.timed("questrade_get_nope")
+    async def get_nope(self):
+        underlying_id = await self.get_underlying_id()
+        # The underlying quote is only needed at the end, so it overlaps the
+        # chain request and all option quote batches
+        quote = asyncio.ensure_future(self.fetch_quote(underlying_id))
+        (options, total_delta, full_refresh), quote = await asyncio.gather(
+            self.fetch_options(underlying_id, quote), quote
         )
 
         try:
-            nope = ((total_call_delta + total_put_delta) * 10000) / quote["volume"]
+            nope = nope_from_delta(total_delta, quote["volume"])
         except ZeroDivisionError:
-            curr_dt = datetime.now().strftime("%Y-%m-%d at %H:%M:%S")
-            with open("logs/errors.txt", "a") as f:
-                f.write(f'No volume data on {quote["symbol"]} | {curr_dt}\n')
-            return [0, 0]
+            _, curr_dt = get_datetime_for_logging()
+            log_error(f'No volume data on {quote["symbol"]} | {curr_dt}\n')
+            return None
 
-        return [nope, quote["lastTradePrice"]]
+        price = quote["lastTradePrice"]
+        if self.recorder is not None:
+            self.recorder.record(
+                now_utc(), options, price, quote["volume"], nope, full_refresh
+            )
+        return [nope, price]
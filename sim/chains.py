@@ -0,0 +1,171 @@
+import math
+import random
+from datetime import date, datetime, timedelta
+
+# Synthetic option chains shaped like the Questrade and TDA payloads, used by
+# the benchmarks and local stub servers
+
+
+def _expiries(n_expiries, start=None):
+    start = start or date.today()
+    expiries = []
+    day = start
+    while len(expiries) < n_expiries:
+        if day.weekday() < 5:
+            expiries.append(day)
+        day += timedelta(days=1)
+    return expiries
+
+
+def _call_delta(strike, price, dte):
+    # Rough logistic stand-in for N(d1), good enough for payload shape
+    width = max(1.0, price * 0.01 * math.sqrt(dte + 1))
+    return 1 / (1 + math.exp((strike - price) / width))
+
+
+def _value(strike, price, dte, right, iv=0.2):
+    # Black-Scholes at a flat IV, matching the delta only roughly
+    years = max(dte, 0.1) / 365
+    d1 = (math.log(price / strike) + 0.5 * iv * iv * years) / (iv * math.sqrt(years))
+    d2 = d1 - iv * math.sqrt(years)
+    n = lambda x: 0.5 * (1 + math.erf(x / math.sqrt(2)))  # noqa: E731
+    call = price * n(d1) - strike * n(d2)
+    return call if right == "C" else call - price + strike
+
+
+def synthetic_quotes(price=400.0, n_expiries=40, n_strikes=300, seed=0):
+    rng = random.Random(seed)
+    first_strike = round(price) - n_strikes // 2
+    rows = []
+    for dte, expiry in enumerate(_expiries(n_expiries)):
+        for i in range(n_strikes):
+            strike = float(first_strike + i)
+            call_delta = _call_delta(strike, price, dte)
+            for right, delta in (("C", call_delta), ("P", call_delta - 1)):
+                near = math.exp(-abs(strike - price) / 10)
+                value = _value(strike, price, dte, right)
+                rows.append(
+                    {
+                        "expiry": expiry,
+                        "strike": strike,
+                        "right": right,
+                        "delta": round(delta, 5),
+                        "volume": int(rng.random() * 5000 * near / (dte + 1)),
+                        "bid": max(round(value - 0.02, 2), 0.0),
+                        "ask": round(value + 0.02, 2),
+                        "iv": 20.0,
+                    }
+                )
+    return rows
+
+
+def questrade_payloads(underlying_id=9292, **kwargs):
+    rows = synthetic_quotes(**kwargs)
+    expiry_chains = {}
+    quotes = {"C": [], "P": []}
+    for i, row in enumerate(rows):
+        symbol_id = 1_000_000 + i
+        exp_date = row["expiry"].strftime("%Y-%m-%dT00:00:00.000000-05:00")
+        strikes = expiry_chains.setdefault(exp_date, {})
+        strike = strikes.setdefault(row["strike"], {"strikePrice": row["strike"]})
+        strike["callSymbolId" if row["right"] == "C" else "putSymbolId"] = symbol_id
+        quotes[row["right"]].append(
+            {
+                "underlyingId": underlying_id,
+                "symbolId": symbol_id,
+                "volume": row["volume"],
+                "delta": row["delta"],
+                "bidPrice": row["bid"],
+                "askPrice": row["ask"],
+                "volatility": row["iv"],
+            }
+        )
+
+    chain = {
+        "optionChain": [
+            {
+                "expiryDate": exp_date,
+                "chainPerRoot": [
+                    {
+                        "optionRoot": "SPY",
+                        "chainPerStrikePrice": list(strikes.values()),
+                        "multiplier": 100,
+                    }
+                ],
+            }
+            for exp_date, strikes in expiry_chains.items()
+        ]
+    }
+    return chain, {"optionQuotes": quotes["C"]}, {"optionQuotes": quotes["P"]}
+
+
+def tda_payload(**kwargs):
+    rows = synthetic_quotes(**kwargs)
+    chain = {"status": "SUCCESS", "callExpDateMap": {}, "putExpDateMap": {}}
+    today = date.today()
+    for row in rows:
+        dte = (row["expiry"] - today).days
+        chain_map_key = "callExpDateMap" if row["right"] == "C" else "putExpDateMap"
+        exp_key = f"{row['expiry'].isoformat()}:{dte}"
+        strikes = chain[chain_map_key].setdefault(exp_key, {})
+        put_call = "CALL" if row["right"] == "C" else "PUT"
+        symbol = f"SPY_{row['expiry']:%m%d%y}{row['right']}{row['strike']:g}"
+        mark = round((row["bid"] + row["ask"]) / 2, 2)
+        expiration = int(
+            datetime.combine(row["expiry"], datetime.min.time()).timestamp() * 1000
+        )
+        # Every field TDA sends per option, so payload size and decode time
+        # are realistic
+        strikes[f"{row['strike']:.1f}"] = [
+            {
+                "putCall": put_call,
+                "symbol": symbol,
+                "description": f"SPY {row['expiry']:%b %d %Y} {row['strike']:g} "
+                f"{put_call.title()}",
+                "exchangeName": "OPR",
+                "bid": row["bid"],
+                "ask": row["ask"],
+                "last": mark,
+                "mark": mark,
+                "bidSize": 50,
+                "askSize": 50,
+                "bidAskSize": "50X50",
+                "lastSize": 0,
+                "highPrice": mark,
+                "lowPrice": mark,
+                "openPrice": 0.0,
+                "closePrice": mark,
+                "totalVolume": row["volume"],
+                "tradeDate": None,
+                "tradeTimeInLong": 1614718799000,
+                "quoteTimeInLong": 1614718799000,
+                "netChange": 0.0,
+                "volatility": row["iv"],
+                "delta": row["delta"],
+                "gamma": 0.01,
+                "theta": -0.05,
+                "vega": 0.1,
+                "rho": 0.01,
+                "openInterest": row["volume"] * 3,
+                "timeValue": mark,
+                "theoreticalOptionValue": mark,
+                "theoreticalVolatility": 29.0,
+                "optionDeliverablesList": None,
+                "strikePrice": row["strike"],
+                "expirationDate": expiration,
+                "daysToExpiration": dte,
+                "expirationType": "S",
+                "lastTradingDay": expiration,
+                "multiplier": 100.0,
+                "settlementType": " ",
+                "deliverableNote": "",
+                "isIndexOption": None,
+                "percentChange": 0.0,
+                "markChange": 0.0,
+                "markPercentChange": 0.0,
+                "nonStandard": False,
+                "inTheMoney": row["delta"] > 0.5 or row["delta"] < -0.5,
+                "mini": False,
+            }
+        ]
+    return chain
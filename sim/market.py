@@ -0,0 +1,76 @@
+import math
+import random
+from datetime import datetime
+
+from nope.greeks import SECONDS_PER_YEAR, black_scholes, expiry_close
+from sim.chains import _expiries
+
+# A random-walk underlying with a Black-Scholes priced option chain, shared by
+# the local TWS and Questrade stubs so both see the same prices
+
+
+class SyntheticMarket:
+    def __init__(
+        self,
+        symbol="SPY",
+        price=400.0,
+        vol=0.2,
+        iv=0.2,
+        n_expiries=10,
+        strike_range=30,
+        half_spread=0.01,
+        seed=0,
+    ):
+        self.symbol = symbol
+        self.price = price
+        # Annualized volatility of the random walk, and the flat IV used to
+        # price the chain
+        self.vol = vol
+        self.iv = iv
+        self.half_spread = half_spread
+        self._rng = random.Random(seed)
+        self._expiries = _expiries(n_expiries)
+        center = round(price)
+        self._strikes = [
+            float(k) for k in range(center - strike_range, center + strike_range + 1)
+        ]
+        self._closes = {
+            expiry: expiry_close(expiry)
+            for expiry in (d.strftime("%Y%m%d") for d in self._expiries)
+        }
+
+    def expirations(self):
+        return list(self._closes)
+
+    def strikes(self):
+        return list(self._strikes)
+
+    def has_option(self, expiry, strike, right):
+        return (
+            expiry in self._closes
+            and float(strike) in self._strikes
+            and right in ("C", "P")
+        )
+
+    def step(self, seconds):
+        years = seconds / SECONDS_PER_YEAR
+        shock = self._rng.gauss(0, 1) * self.vol * math.sqrt(years)
+        self.price = round(self.price * math.exp(shock - 0.5 * self.vol**2 * years), 2)
+
+    def stock_quote(self):
+        """(bid, ask, last)"""
+        return round(self.price - 0.01, 2), round(self.price + 0.01, 2), self.price
+
+    def option_quote(self, expiry, strike, right, now=None):
+        """(bid, ask, delta, iv) at the current underlying price."""
+        now = now or datetime.now().timestamp()
+        years = (self._closes[expiry] - now) / SECONDS_PER_YEAR
+        value, delta = black_scholes(self.price, strike, years, self.iv, right == "C")
+        mid = round(float(value), 2)
+        spread = max(round(mid * self.half_spread, 2), 0.01)
+        return (
+            max(round(mid - spread, 2), 0.0),
+            round(mid + spread, 2),
+            float(delta),
+            self.iv,
+        )
@@ -0,0 +1,223 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import yaml
+
+from sim.chains import questrade_payloads
+
+# Local stand-in for the Questrade symbol, quote and option quote endpoints.
+# Run from the repo root: python -m sim.questrade_stub --latency 0.2
+
+
+class QuestradeStub:
+    def __init__(
+        self,
+        ticker="SPY",
+        underlying_id=9292,
+        latency=0.0,
+        quote_latency=0.0,
+        jitter=0.0,
+        market=None,
+        swing=0.0,
+        swing_period=600.0,
+        seed=0,
+        host="127.0.0.1",
+        port=0,
+        **chain_kwargs,
+    ):
+        self.ticker = ticker
+        self.underlying_id = underlying_id
+        self.latency = latency
+        # Extra server time per 1000 option quotes, so big requests cost more
+        self.quote_latency = quote_latency
+        # Each response waits an extra uniform +-jitter seconds
+        self.jitter = jitter
+        # A sim.market.SyntheticMarket, e.g. shared with sim.tws_stub, for
+        # the underlying price. The chain itself stays fixed
+        self.market = market
+        # Call volumes scale by 1 + swing * sin(2 pi t / swing_period) and
+        # put volumes by the opposite, so NOPE oscillates and crosses the
+        # entry and exit thresholds
+        self.swing = swing
+        self.swing_period = swing_period
+        self._rng = random.Random(seed)
+        self.requests = []
+        self.chain, calls, puts = questrade_payloads(
+            underlying_id=underlying_id, **chain_kwargs
+        )
+        expiry_by_symbol = {}
+        for option_chain in self.chain["optionChain"]:
+            for root in option_chain["chainPerRoot"]:
+                for s in root["chainPerStrikePrice"]:
+                    expiry_by_symbol[s["callSymbolId"]] = option_chain["expiryDate"]
+                    expiry_by_symbol[s["putSymbolId"]] = option_chain["expiryDate"]
+        # (optionType, expiryDate) -> quotes, to answer filter requests
+        self.option_quotes = {}
+        for option_type, quotes in (("Call", calls), ("Put", puts)):
+            for q in quotes["optionQuotes"]:
+                key = (option_type, expiry_by_symbol[q["symbolId"]])
+                self.option_quotes.setdefault(key, []).append(q)
+        self.quote = {
+            "symbol": ticker,
+            "symbolId": underlying_id,
+            "lastTradePrice": 400.0,
+            "volume": 50_000_000,
+        }
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    def _sleep(self, seconds):
+        time.sleep(max(seconds + self._rng.uniform(-self.jitter, self.jitter), 0.0))
+
+    def _volume_scale(self, option_type):
+        if not self.swing:
+            return 1.0
+        phase = math.sin(2 * math.pi * time.time() / self.swing_period)
+        return 1 + self.swing * phase * (1 if option_type == "Call" else -1)
+
+    def _quote(self):
+        if self.market is None:
+            return self.quote
+        return {**self.quote, "lastTradePrice": self.market.price}
+
+    @property
+    def api_server(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, payload, status=200):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                stub.requests.append(("GET", url.path))
+                stub._sleep(stub.latency)
+                query = parse_qs(url.query)
+                if url.path == "/v1/symbols":
+                    self._reply(
+                        {
+                            "symbols": [
+                                {"symbol": stub.ticker, "symbolId": stub.underlying_id}
+                            ]
+                        }
+                    )
+                elif url.path == f"/v1/symbols/{stub.underlying_id}/options":
+                    self._reply(stub.chain)
+                elif url.path == "/v1/markets/quotes" and query.get("ids") == [
+                    str(stub.underlying_id)
+                ]:
+                    self._reply({"quotes": [stub._quote()]})
+                else:
+                    self._reply({"code": 1001, "message": "Not found"}, 404)
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                stub.requests.append(("POST", url.path))
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if url.path != "/v1/markets/quotes/options":
+                    self._reply({"code": 1001, "message": "Not found"}, 404)
+                    return
+                quotes = []
+                for f in payload.get("filters") or []:
+                    key = (f["optionType"], f["expiryDate"])
+                    filter_quotes = stub.option_quotes.get(key, [])
+                    scale = stub._volume_scale(f["optionType"])
+                    if scale != 1.0:
+                        filter_quotes = [
+                            {**q, "volume": int(q["volume"] * scale)}
+                            for q in filter_quotes
+                        ]
+                    quotes += filter_quotes
+                stub._sleep(stub.latency + stub.quote_latency * len(quotes) / 1000)
+                self._reply({"optionQuotes": quotes})
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def write_token_yaml(self, path):
+        with open(path, "w") as f:
+            yaml.dump(
+                {
+                    "access_token": "stub",
+                    "api_server": self.api_server,
+                    "expires_in": 1800,
+                    "refresh_token": "stub",
+                    "token_type": "Bearer",
+                },
+                f,
+            )
+        return path
+
+
+def main():
+    from qt.qtrade_client import QuestradeClient
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--quote-latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--expiries", type=int, default=40)
+    parser.add_argument("--strikes", type=int, default=300)
+    args = parser.parse_args()
+
+    stub = QuestradeStub(
+        latency=args.latency,
+        quote_latency=args.quote_latency,
+        jitter=args.jitter,
+        n_expiries=args.expiries,
+        n_strikes=args.strikes,
+    ).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        token_yaml = stub.write_token_yaml(os.path.join(tmp, "access_token.yml"))
+        n_filters = 2 * args.expiries
+        for batch_size, max_concurrency in ((n_filters, 1), (20, 4), (8, 10)):
+            client = QuestradeClient(
+                token_yaml,
+                batch_size=batch_size,
+                max_concurrency=max_concurrency,
+                refresh_on_start=False,
+            )
+            stub.requests.clear()
+            start = time.perf_counter()
+            nope, price = asyncio.run(client.get_nope())
+            elapsed = time.perf_counter() - start
+            print(
+                f"batch_size={batch_size:<3} max_concurrency={max_concurrency:<2} "
+                f"requests={len(stub.requests):<3} {elapsed * 1000:8.1f} ms "
+                f"NOPE {nope:.2f} @ {price}"
+            )
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
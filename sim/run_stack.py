@@ -0,0 +1,124 @@
+import argparse
+import os
+import tempfile
+import time
+
+import toml
+from ib_insync import IB, util
+
+from backtest.run import apply_overrides
+from nope.greeks import chain_greeks
+from nope.nope_strategy import NopeStrategy
+from qt.qtrade_client import QuestradeClient
+from sim.market import SyntheticMarket
+from sim.questrade_stub import QuestradeStub
+from sim.tws_stub import TWSStub
+from utils.metrics import metrics
+from utils.util import get_datetime_for_logging
+
+# Runs the main.py stack, NopeStrategy with live IB and Questrade clients,
+# against sim.tws_stub and sim.questrade_stub on one machine. Run from the
+# repo root:
+#   python -m sim.run_stack --minutes 10 --swing 0.5 --tws-latency 0.02
+
+
+class StubQuestradeClient(QuestradeClient):
+    # qtrade refreshes against the real login server, the stub token is static
+    def refresh_access_token(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=float, default=5)
+    parser.add_argument("--config", default="conf/conf.toml")
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="SECTION.KEY=VALUE",
+        help="Override a config value, e.g. --set nope.long_enter=-50",
+    )
+    parser.add_argument("--out", default="logs/stack", help="Working directory")
+    parser.add_argument("--tws-latency", type=float, default=0.0)
+    parser.add_argument("--tws-jitter", type=float, default=0.0)
+    parser.add_argument("--qt-latency", type=float, default=0.1)
+    parser.add_argument("--qt-quote-latency", type=float, default=0.02)
+    parser.add_argument("--qt-jitter", type=float, default=0.0)
+    parser.add_argument("--fill", choices=("mid", "always", "never"), default="mid")
+    parser.add_argument("--fill-delay", type=float, default=0.5)
+    parser.add_argument("--fill-probability", type=float, default=1.0)
+    parser.add_argument("--expiries", type=int, default=40)
+    parser.add_argument("--strikes", type=int, default=300)
+    parser.add_argument(
+        "--swing", type=float, default=0.5, help="NOPE oscillation, 0 holds it flat"
+    )
+    parser.add_argument("--swing-minutes", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = apply_overrides(toml.load(f), args.set)
+    config["metrics"]["enabled"] = True
+    config["metrics"]["http_port"] = 0
+    os.makedirs(os.path.join(args.out, "logs"), exist_ok=True)
+    os.chdir(args.out)
+
+    market = SyntheticMarket(seed=args.seed)
+    tws = TWSStub(
+        market,
+        latency=args.tws_latency,
+        jitter=args.tws_jitter,
+        fill=args.fill,
+        fill_delay=args.fill_delay,
+        fill_probability=args.fill_probability,
+        seed=args.seed,
+    ).start()
+    questrade = QuestradeStub(
+        latency=args.qt_latency,
+        quote_latency=args.qt_quote_latency,
+        jitter=args.qt_jitter,
+        market=market,
+        swing=args.swing,
+        swing_period=args.swing_minutes * 60,
+        seed=args.seed,
+        n_expiries=args.expiries,
+        n_strikes=args.strikes,
+    ).start()
+    token_yaml = questrade.write_token_yaml(
+        os.path.join(tempfile.mkdtemp(), "access_token.yml")
+    )
+
+    util.patchAsyncio()
+    ib = IB()
+    client = StubQuestradeClient(
+        token_yaml,
+        batch_size=config["questrade"]["option_quote_batch_size"],
+        max_concurrency=config["questrade"]["max_concurrent_requests"],
+        refresh_on_start=False,
+        greeks=chain_greeks(config["questrade"]["delta_source"]),
+    )
+    nope_strategy = NopeStrategy(config, ib, nope_provider=client)
+    client.incremental = nope_strategy.make_incremental_nope()
+    client.recorder = nope_strategy.make_chain_recorder()
+    nope_strategy.run_qt_tasks()
+    ib.connectedEvent += nope_strategy.execute
+
+    start = time.perf_counter()
+    ib.connect(tws.host, tws.port, clientId=1)
+    ib.sleep(args.minutes * 60)
+    elapsed = time.perf_counter() - start
+
+    _, curr_dt = get_datetime_for_logging()
+    print("".join(metrics.summary_lines(curr_dt)), end="")
+    print(
+        f"{elapsed:.0f}s: {tws.requests} TWS requests, {tws.fills} fills, "
+        f"{len(questrade.requests)} Questrade requests, "
+        f"{market.symbol} @ {market.price}"
+    )
+    # The NOPE thread loop runs forever, as it does under main.py
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
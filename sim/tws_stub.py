@@ -0,0 +1,620 @@
+import argparse
+import asyncio
+import itertools
+import random
+import struct
+import threading
+import time
+from datetime import datetime
+from typing import NamedTuple
+
+from backtest.sim_ib import MULTIPLIER, STOCK_CON_ID, sim_con_id
+from sim.market import SyntheticMarket
+
+# Local stand-in for TWS/IB Gateway. Speaks the subset of the TWS API socket
+# protocol that ib_insync and NopeStrategy use: the connect handshake,
+# contract details, option chain parameters, market data (snapshots and
+# streaming, with model greeks), orders, executions, positions and account
+# values. Run from the repo root: python -m sim.tws_stub --port 7497
+
+SERVER_VERSION = 152
+CONTRACT_FIELDS = (
+    "conId",
+    "symbol",
+    "secType",
+    "lastTradeDateOrContractMonth",
+    "strike",
+    "right",
+    "multiplier",
+    "exchange",
+    "primaryExchange",
+    "currency",
+    "localSymbol",
+    "tradingClass",
+)
+# Incoming message ids
+REQ_MKT_DATA = 1
+CANCEL_MKT_DATA = 2
+PLACE_ORDER = 3
+CANCEL_ORDER = 4
+REQ_OPEN_ORDERS = 5
+REQ_ACCOUNT_UPDATES = 6
+REQ_EXECUTIONS = 7
+REQ_IDS = 8
+REQ_CONTRACT_DATA = 9
+REQ_AUTO_OPEN_ORDERS = 15
+REQ_ALL_OPEN_ORDERS = 16
+REQ_CURRENT_TIME = 49
+REQ_POSITIONS = 61
+START_API = 71
+REQ_ACCOUNT_UPDATES_MULTI = 76
+REQ_SEC_DEF_OPT_PARAMS = 78
+REQ_COMPLETED_ORDERS = 99
+# Tick types
+BID, ASK, LAST, MODEL_OPTION = 1, 2, 4, 13
+
+
+def _prefix(payload: bytes):
+    return struct.pack(">I", len(payload)) + payload
+
+
+def _encode(fields):
+    return _prefix("".join(f"{'' if f is None else f}\0" for f in fields).encode())
+
+
+def _without_primary_exchange(contract):
+    # Position and execution messages leave primaryExchange out
+    return [contract[f] for f in CONTRACT_FIELDS if f != "primaryExchange"]
+
+
+class _Order(NamedTuple):
+    session: "_Session"
+    order_id: int
+    perm_id: int
+    contract: dict
+    action: str
+    quantity: float
+    kind: str
+    lmt: float
+    aux: float
+
+
+class _Session:
+    def __init__(self, writer):
+        self.writer = writer
+        self.client_id = 0
+        # reqId -> conId for streaming market data
+        self.streams = {}
+        # Keeps replies in request order when latency is jittered
+        self.next_reply = 0.0
+
+    def send(self, *fields):
+        if not self.writer.is_closing():
+            self.writer.write(_encode(fields))
+
+
+class TWSStub:
+    """Fake TWS on `host:port`, run on its own thread with start().
+
+    Every request is answered after `latency` seconds, plus or minus a
+    uniform `jitter`. The underlying follows `market`, stepped every
+    `tick_interval` seconds, when streaming ticks go out and resting orders
+    are matched again. `fill` picks how orders fill: "mid" fills buy limits
+    at the limit once it reaches the mid (sell limits the reverse, sell stops
+    at the bid once it trades through), "always" fills every order at its
+    limit and "never" leaves orders resting. Marketable orders are matched
+    `fill_delay` seconds after placement, and then fill with
+    `fill_probability` per attempt.
+    """
+
+    def __init__(
+        self,
+        market: SyntheticMarket = None,
+        latency=0.0,
+        jitter=0.0,
+        tick_interval=1.0,
+        fill="mid",
+        fill_delay=0.5,
+        fill_probability=1.0,
+        commission=0.65,
+        account="DU0000000",
+        cash=100_000.0,
+        host="127.0.0.1",
+        port=0,
+        seed=0,
+    ):
+        self.market = market or SyntheticMarket(seed=seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.tick_interval = tick_interval
+        self.fill = fill
+        self.fill_delay = fill_delay
+        self.fill_probability = fill_probability
+        self.commission = commission
+        self.account = account
+        self.cash = cash
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.fills = 0
+        self._rng = random.Random(seed)
+        self._perm_ids = itertools.count(1_000_000)
+        self._exec_ids = itertools.count(1)
+        self._sessions = set()
+        # conId -> contract field dict, filled in as contracts are qualified
+        self._contracts = {}
+        # (clientId, orderId) -> resting order
+        self._orders = {}
+        self._last_order_id = 0
+        # conId -> (position, avgCost)
+        self._positions = {}
+        self._loop = None
+        self._server = None
+        self._ready = threading.Event()
+        self._handlers = {
+            START_API: self._start_api,
+            REQ_IDS: lambda s, f: s.send(9, 1, self._last_order_id + 1),
+            REQ_CURRENT_TIME: lambda s, f: s.send(49, 1, int(time.time())),
+            REQ_POSITIONS: self._req_positions,
+            REQ_ACCOUNT_UPDATES: self._req_account_updates,
+            REQ_ACCOUNT_UPDATES_MULTI: lambda s, f: s.send(74, 1, f[2]),
+            REQ_EXECUTIONS: lambda s, f: s.send(55, 1, f[2]),
+            REQ_COMPLETED_ORDERS: lambda s, f: s.send(102),
+            REQ_OPEN_ORDERS: lambda s, f: s.send(53, 1),
+            REQ_ALL_OPEN_ORDERS: lambda s, f: s.send(53, 1),
+            REQ_AUTO_OPEN_ORDERS: lambda s, f: s.send(53, 1),
+            REQ_CONTRACT_DATA: self._req_contract_details,
+            REQ_SEC_DEF_OPT_PARAMS: self._req_sec_def_opt_params,
+            REQ_MKT_DATA: self._req_mkt_data,
+            CANCEL_MKT_DATA: lambda s, f: s.streams.pop(int(f[2]), None),
+            PLACE_ORDER: self._place_order,
+            CANCEL_ORDER: self._cancel_order,
+        }
+
+    # Lifecycle
+
+    def start(self):
+        threading.Thread(target=self._run, name="tws-stub", daemon=True).start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._serve, self.host, self.port)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._loop.create_task(self._tick())
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            self.market.step(self.tick_interval)
+            for session in list(self._sessions):
+                for req_id, con_id in session.streams.items():
+                    self._send_ticks(session, req_id, self._contracts[con_id])
+            for order in list(self._orders.values()):
+                self._match(order)
+
+    def _delay(self):
+        return max(self.latency + self._rng.uniform(-self.jitter, self.jitter), 0.0)
+
+    async def _serve(self, reader, writer):
+        session = _Session(writer)
+        try:
+            if await reader.readexactly(4) != b"API\0":
+                return
+            size = struct.unpack(">I", await reader.readexactly(4))[0]
+            await reader.readexactly(size)
+            connected = datetime.now().strftime("%Y%m%d %H:%M:%S EST")
+            session.send(SERVER_VERSION, connected)
+            self._sessions.add(session)
+            while True:
+                size = struct.unpack(">I", await reader.readexactly(4))[0]
+                fields = (await reader.readexactly(size)).decode().split("\0")[:-1]
+                self.requests += 1
+                when = max(self._loop.time() + self._delay(), session.next_reply)
+                session.next_reply = when
+                self._loop.call_at(when, self._dispatch, session, fields)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._sessions.discard(session)
+            writer.close()
+
+    def _dispatch(self, session, fields):
+        handler = self._handlers.get(int(fields[0]))
+        if handler is not None:
+            handler(session, fields)
+
+    # Connection and account
+
+    def _start_api(self, session, fields):
+        session.client_id = int(fields[2])
+        session.send(9, 1, self._last_order_id + 1)
+        session.send(15, 1, self.account)
+
+    def _req_positions(self, session, fields):
+        for con_id in self._positions:
+            self._send_position(session, con_id)
+        session.send(62, 1)
+
+    def _send_position(self, session, con_id):
+        position, avg_cost = self._positions[con_id]
+        session.send(
+            61,
+            3,
+            self.account,
+            *_without_primary_exchange(self._contracts[con_id]),
+            position,
+            avg_cost,
+        )
+
+    def _send_account_values(self, session):
+        for key in ("BuyingPower", "AvailableFunds", "TotalCashValue"):
+            session.send(6, 2, key, round(self.cash, 2), "USD", self.account)
+
+    def _req_account_updates(self, session, fields):
+        if fields[2] == "1":
+            self._send_account_values(session)
+            session.send(54, 1, self.account)
+
+    # Contracts
+
+    def _resolve(self, fields):
+        """Contract fields from a request to the qualified contract, or None
+        when the market has no such contract."""
+        c = dict(zip(CONTRACT_FIELDS, fields))
+        con_id = int(c["conId"] or 0)
+        if con_id in self._contracts:
+            return self._contracts[con_id]
+        symbol = self.market.symbol
+        if c["symbol"] != symbol:
+            return None
+        if c["secType"] == "STK":
+            contract = dict(
+                zip(
+                    CONTRACT_FIELDS,
+                    (STOCK_CON_ID, symbol, "STK", "", 0.0, "", "", "SMART"),
+                ),
+                primaryExchange="ARCA",
+                currency="USD",
+                localSymbol=symbol,
+                tradingClass=symbol,
+            )
+        elif c["secType"] == "OPT":
+            expiry = c["lastTradeDateOrContractMonth"]
+            strike = float(c["strike"] or 0)
+            right = c["right"][:1]
+            if not self.market.has_option(expiry, strike, right):
+                return None
+            contract = dict(
+                zip(
+                    CONTRACT_FIELDS,
+                    (
+                        sim_con_id(symbol, expiry, strike, right),
+                        symbol,
+                        "OPT",
+                        expiry,
+                        strike,
+                        right,
+                        MULTIPLIER,
+                        "SMART",
+                    ),
+                ),
+                primaryExchange="",
+                currency="USD",
+                localSymbol=f"{symbol:<6}{expiry[2:]}{right}{round(strike * 1000):08d}",
+                tradingClass=symbol,
+            )
+        else:
+            return None
+        self._contracts[contract["conId"]] = contract
+        return contract
+
+    def _req_contract_details(self, session, fields):
+        req_id = fields[2]
+        c = self._resolve(fields[3:15])
+        if c is not None:
+            option = c["secType"] == "OPT"
+            expiry = c["lastTradeDateOrContractMonth"]
+            session.send(
+                10,
+                8,
+                req_id,
+                c["symbol"],
+                c["secType"],
+                expiry,
+                c["strike"],
+                c["right"],
+                c["exchange"],
+                c["currency"],
+                c["localSymbol"],
+                c["symbol"],  # marketName
+                c["tradingClass"],
+                c["conId"],
+                0.01,  # minTick
+                1,  # mdSizeMultiplier
+                c["multiplier"],
+                "LMT,MKT,STP",
+                "SMART",
+                1,  # priceMagnifier
+                STOCK_CON_ID if option else 0,
+                c["symbol"],  # longName
+                c["primaryExchange"],
+                expiry[:6],
+                "",  # industry
+                "",  # category
+                "",  # subcategory
+                "US/Eastern",
+                "",  # tradingHours
+                "",  # liquidHours
+                "",  # evRule
+                "",  # evMultiplier
+                0,  # secIdList
+                1,  # aggGroup
+                c["symbol"] if option else "",
+                "STK" if option else "",
+                "",  # marketRuleIds
+                expiry,
+                "",  # stockType
+            )
+        session.send(52, 1, req_id)
+
+    def _req_sec_def_opt_params(self, session, fields):
+        req_id, symbol = fields[1], fields[2]
+        if symbol == self.market.symbol:
+            expirations = self.market.expirations()
+            strikes = self.market.strikes()
+            session.send(
+                75,
+                req_id,
+                "SMART",
+                STOCK_CON_ID,
+                symbol,
+                MULTIPLIER,
+                len(expirations),
+                *expirations,
+                len(strikes),
+                *strikes,
+            )
+        session.send(76, req_id)
+
+    # Market data
+
+    def _quote(self, c):
+        """(bid, ask, last, delta, iv), last for stocks and greeks for
+        options."""
+        if c["secType"] == "STK":
+            return (*self.market.stock_quote(), None, None)
+        bid, ask, delta, iv = self.market.option_quote(
+            c["lastTradeDateOrContractMonth"], c["strike"], c["right"]
+        )
+        return bid, ask, None, delta, iv
+
+    def _send_ticks(self, session, req_id, c):
+        bid, ask, last, delta, iv = self._quote(c)
+        session.send(1, 6, req_id, BID, bid, 100, 0)
+        session.send(1, 6, req_id, ASK, ask, 100, 0)
+        if last is not None:
+            session.send(1, 6, req_id, LAST, last, 100, 0)
+        if delta is not None:
+            # gamma, vega and theta are left unset
+            session.send(
+                21,
+                6,
+                req_id,
+                MODEL_OPTION,
+                iv,
+                delta,
+                round((bid + ask) / 2, 2),
+                0,
+                -2,
+                -2,
+                -2,
+                self.market.price,
+            )
+
+    def _req_mkt_data(self, session, fields):
+        req_id = int(fields[2])
+        c = self._resolve(fields[3:15])
+        if c is None:
+            session.send(4, 2, req_id, 200, "No security definition found")
+            return
+        self._send_ticks(session, req_id, c)
+        if fields[17] == "1":
+            session.send(57, 1, req_id)
+        else:
+            session.streams[req_id] = c["conId"]
+
+    # Orders
+
+    def _place_order(self, session, fields):
+        order_id = int(fields[1])
+        self._last_order_id = max(self._last_order_id, order_id)
+        c = self._resolve(fields[2:14])
+        if c is None:
+            session.send(4, 2, order_id, 200, "No security definition found")
+            return
+        # Placing a live orderId again modifies that order
+        existing = self._orders.get((session.client_id, order_id))
+        order = _Order(
+            session,
+            order_id,
+            existing.perm_id if existing else next(self._perm_ids),
+            c,
+            action=fields[16],
+            quantity=float(fields[17]),
+            kind=fields[18],
+            lmt=float(fields[19] or 0),
+            aux=float(fields[20] or 0),
+        )
+        self._orders[session.client_id, order_id] = order
+        self._send_status(order, "Submitted")
+        self._loop.call_later(self.fill_delay, self._match, order)
+
+    def _cancel_order(self, session, fields):
+        order = self._orders.pop((session.client_id, int(fields[2])), None)
+        if order is not None:
+            self._send_status(order, "Cancelled")
+
+    def _send_status(self, order, status, price=0.0):
+        filled = order.quantity if status == "Filled" else 0
+        order.session.send(
+            3,
+            order.order_id,
+            status,
+            filled,
+            order.quantity - filled,
+            price,
+            order.perm_id,
+            0,  # parentId
+            price,
+            order.session.client_id,
+            "",
+            0,
+        )
+
+    def _fill_price(self, order):
+        if self.fill == "never":
+            return None
+        bid, ask, *_ = self._quote(order.contract)
+        mid = (bid + ask) / 2
+        buy = order.action == "BUY"
+        if order.kind == "MKT":
+            return ask if buy else bid
+        if self.fill == "always":
+            return order.aux if order.kind == "STP" else order.lmt
+        if order.kind == "STP":
+            if buy:
+                return ask if ask >= order.aux else None
+            return bid if bid <= order.aux else None
+        if buy:
+            return order.lmt if order.lmt >= mid else None
+        return order.lmt if order.lmt <= mid else None
+
+    def _match(self, order):
+        key = (order.session.client_id, order.order_id)
+        if self._orders.get(key) is not order:
+            return
+        price = self._fill_price(order)
+        if price is None or self._rng.random() >= self.fill_probability:
+            return
+        del self._orders[key]
+        self._fill(order, price)
+
+    def _book(self, c, shares, price):
+        """Updates the position and cash for a fill of `shares` (negative
+        for sells), returns the realized P&L."""
+        multiplier = MULTIPLIER if c["secType"] == "OPT" else 1
+        cost = price * multiplier
+        position, avg_cost = self._positions.get(c["conId"], (0.0, 0.0))
+        realized = 0.0
+        new_position = position + shares
+        if position == 0 or (position > 0) == (shares > 0):
+            avg_cost = (position * avg_cost + shares * cost) / new_position
+        else:
+            closed = min(abs(shares), abs(position))
+            realized = (cost - avg_cost) * closed * (1 if position > 0 else -1)
+            if new_position == 0:
+                avg_cost = 0.0
+            elif (new_position > 0) != (position > 0):
+                avg_cost = cost
+        self._positions[c["conId"]] = (new_position, avg_cost)
+        self.cash -= shares * cost
+        return realized
+
+    def _fill(self, order, price):
+        self.fills += 1
+        c = order.contract
+        session = order.session
+        buy = order.action == "BUY"
+        commission = self.commission * order.quantity
+        realized = self._book(c, order.quantity if buy else -order.quantity, price)
+        self.cash -= commission
+        exec_id = f"sim.{next(self._exec_ids):08d}.01"
+        # Execution before status, so trade.fills is set when filledEvent fires
+        session.send(
+            11,
+            -1,  # live fill
+            order.order_id,
+            *_without_primary_exchange(c),
+            exec_id,
+            datetime.now().strftime("%Y%m%d  %H:%M:%S"),
+            self.account,
+            "SMART",
+            "BOT" if buy else "SLD",
+            order.quantity,
+            price,
+            order.perm_id,
+            session.client_id,
+            0,  # liquidation
+            order.quantity,
+            price,
+            "",  # orderRef
+            "",  # evRule
+            "",  # evMultiplier
+            "",  # modelCode
+            1,  # lastLiquidity
+        )
+        session.send(59, 1, exec_id, commission, "USD", realized, "", "")
+        self._send_status(order, "Filled", price)
+        for other in list(self._sessions):
+            self._send_position(other, c["conId"])
+            self._send_account_values(other)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7497)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--tick-interval", type=float, default=1.0)
+    parser.add_argument("--fill", choices=("mid", "always", "never"), default="mid")
+    parser.add_argument("--fill-delay", type=float, default=0.5)
+    parser.add_argument("--fill-probability", type=float, default=1.0)
+    parser.add_argument("--price", type=float, default=400.0)
+    parser.add_argument("--expiries", type=int, default=10)
+    parser.add_argument("--strike-range", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    market = SyntheticMarket(
+        price=args.price,
+        n_expiries=args.expiries,
+        strike_range=args.strike_range,
+        seed=args.seed,
+    )
+    stub = TWSStub(
+        market,
+        latency=args.latency,
+        jitter=args.jitter,
+        tick_interval=args.tick_interval,
+        fill=args.fill,
+        fill_delay=args.fill_delay,
+        fill_probability=args.fill_probability,
+        host=args.host,
+        port=args.port,
+        seed=args.seed,
+    ).start()
+    print(f"Fake TWS on {stub.host}:{stub.port}, Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(60)
+            print(
+                f"{stub.requests} requests, {stub.fills} fills, "
+                f"{stub.market.symbol} @ {stub.market.price}"
+            )
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
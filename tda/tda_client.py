@@ -1,10 +1,24 @@
+import asyncio
 import atexit
-from datetime import datetime
-from functools import reduce
+import threading
+from datetime import date, timedelta
 
+import numpy as np
 import toml
 
+from nope.chain_recorder import ChainRecorder
+from nope.greeks import ChainGreeks, chain_greeks
+from nope.nope_calc import IncrementalNope, OptionChainArrays, nope_from_delta
+from nope.providers import RateLimiter
 from tda.auth import easy_client
+from utils.metrics import metrics
+from utils.util import get_datetime_for_logging, log_error, now_utc
+
+try:
+    # Several times faster than json on multi-megabyte chains
+    from orjson import loads
+except ImportError:
+    from json import loads
 
 with open("conf/conf.toml", "r") as f:
     config = toml.load(f)
@@ -14,6 +28,8 @@ token_path = config["tda"]["token_path"]
 api_key = config["tda"]["api_key"]
 redirect_uri = config["tda"]["redirect_uri"]
 account_id = config["tda"]["account_id"]
+delta_source = config["tda"]["delta_source"]
+expiry_windows = config["tda"]["expiry_windows"]
 
 
 class OptionType:
@@ -24,9 +40,28 @@ class OptionType:
 # only using tda for data access, not trading
 # papertrading is not available with tda api
 class TDAClient:
-    ticker = "SPY"
+    def __init__(
+        self,
+        incremental: IncrementalNope = None,
+        recorder: ChainRecorder = None,
+        greeks: ChainGreeks = None,
+        windows=None,
+        ticker="SPY",
+        limiter: RateLimiter = None,
+        client=None,
+    ):
+        self.ticker = ticker
+        # Throttles every request, shared by the clients of all underlyings
+        self.limiter = limiter
+        self.incremental = incremental
+        self.recorder = recorder
+        self.greeks = chain_greeks(delta_source) if greeks is None else greeks
+        # DTE boundaries of the chain requests sent in parallel
+        self.windows = expiry_windows if windows is None else windows
+        self._decode_lock = threading.Lock()
+        # HTTP requests made, for rate limit accounting
+        self.requests = 0
 
-    def __init__(self):
         def make_webdriver():
             from selenium import webdriver
 
@@ -34,49 +69,107 @@ class TDAClient:
             atexit.register(lambda: driver.quit())
             return driver
 
-        self.client = easy_client(
-            api_key=api_key,
-            redirect_uri=redirect_uri,
-            token_path=token_path,
-            webdriver_func=make_webdriver,
+        if client is None:
+            client = easy_client(
+                api_key=api_key,
+                redirect_uri=redirect_uri,
+                token_path=token_path,
+                webdriver_func=make_webdriver,
+            )
+        self.client = client
+
+    def sibling(self, ticker, **kwargs):
+        """A client for another underlying sharing this one's tda-api client
+        and rate limiter."""
+        return type(self)(
+            windows=self.windows,
+            ticker=ticker,
+            limiter=self.limiter,
+            client=self.client,
+            **kwargs,
         )
 
-    def get_nope(self):
-        chain = self.client.get_option_chain(self.ticker).json()
-        quote = self.client.get_quote(self.ticker).json()[self.ticker]
-        if not chain["status"] == "SUCCESS":
+    def refresh_access_token(self):
+        # tda-api refreshes the token file itself when it expires
+        pass
+
+    def date_windows(self, max_dte=None):
+        """(first, last) DTE of each chain request, covering every expiry or
+        those up to max_dte. last is None for the open-ended window."""
+        firsts = [0] + [b + 1 for b in self.windows if max_dte is None or b < max_dte]
+        lasts = [f - 1 for f in firsts[1:]] + [max_dte]
+        return list(zip(firsts, lasts))
+
+    def fetch_window(self, first, last, prices):
+        # Runs on an executor thread, so decoding and packing one window
+        # overlaps the other requests
+        today = date.today()
+        kwargs = {"from_date": today + timedelta(days=first)}
+        if last is not None:
+            # toDate may be exclusive, so ask for one day past the window
+            kwargs["to_date"] = today + timedelta(days=last + 1)
+        content = self.client.get_option_chain(self.ticker, **kwargs).content
+        # Decoding holds the GIL either way; one window at a time keeps only
+        # one window's dicts alive
+        with self._decode_lock:
+            chain = loads(content)
+            if not chain["status"] == "SUCCESS":
+                return None
+            options = OptionChainArrays.from_tda(chain, prices=prices)
+            del chain
+        # Keep the windows disjoint
+        dte = (options.expiry - np.datetime64(today, "D")).astype(np.int64)
+        in_window = dte >= first
+        if last is not None:
+            in_window &= dte <= last
+        return options.select(in_window)
+
+    async def _run(self, fn, *args):
+        if self.limiter is not None:
+            await self.limiter.acquire()
+        return await asyncio.get_event_loop().run_in_executor(None, fn, *args)
+
+    @metrics.timed("tda_get_nope")
+    async def get_nope(self):
+        full_refresh = self.incremental is None or self.incremental.begin_cycle()
+        windows = self.date_windows(None if full_refresh else self.incremental.near_dte)
+        prices = self.recorder is not None or self.greeks is not None
+
+        # tda-api's default client is blocking; fetch the chain windows and
+        # the quote concurrently
+        self.requests += len(windows) + 1
+        quote_resp, *window_options = await asyncio.gather(
+            self._run(self.client.get_quote, self.ticker),
+            *(
+                self._run(self.fetch_window, first, last, prices)
+                for first, last in windows
+            ),
+        )
+        quote = loads(quote_resp.content)[self.ticker]
+        if any(o is None for o in window_options):
             print("error getting chain")
-            return [0, 0]
-
-        def add(x, y):
-            return x + y
-
-        def gen_deltas_at_exp(type: OptionType):
-            # Loop through chains at each expiry
-            chain_map_key = f"{type}ExpDateMap"
-            for exp_date in chain[chain_map_key]:
-
-                def delta_factor(q):
-                    return q["delta"] * q["totalVolume"]
-
-                call_options_delta = reduce(
-                    add,
-                    (
-                        delta_factor(chain[chain_map_key][exp_date][strike][0])
-                        for strike in chain[chain_map_key][exp_date].keys()
-                    ),
-                )
-                yield call_options_delta
-
-        total_call_delta = reduce(add, gen_deltas_at_exp(OptionType.CALL))
-        total_put_delta = reduce(add, gen_deltas_at_exp(OptionType.PUT))
+            return None
+
+        options = OptionChainArrays.concat(window_options)
+        if self.greeks is not None:
+            self.greeks.apply(options, quote["lastPrice"], now_utc().timestamp())
+        if self.incremental is None:
+            total_delta = options.total_delta()
+        else:
+            total_delta = self.incremental.update(
+                options, None if full_refresh else self.incremental.near_expiries()
+            )
 
         try:
-            nope = (total_call_delta + total_put_delta) * 10_000 / quote["totalVolume"]
+            nope = nope_from_delta(total_delta, quote["totalVolume"])
         except ZeroDivisionError:
-            curr_dt = datetime.now().strftime("%Y-%m-%d at %H:%M:%S")
-            with open("logs/errors.txt", "a") as f:
-                f.write(f'no volume data on {quote["symbol"]} | {curr_dt}\n')
-            return [0, 0]
-
-        return [nope, quote["lastPrice"]]
+            _, curr_dt = get_datetime_for_logging()
+            log_error(f'no volume data on {quote["symbol"]} | {curr_dt}\n')
+            return None
+
+        price = quote["lastPrice"]
+        if self.recorder is not None:
+            self.recorder.record(
+                now_utc(), options, price, quote["totalVolume"], nope, full_refresh
+            )
+        return [nope, price]
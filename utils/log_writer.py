@@ -0,0 +1,123 @@
+import atexit
+import threading
+from datetime import datetime
+
+
+class LogWriter:
+    """Buffers log lines in memory and appends them to their files from a
+    background thread, so callers on the event loop never touch the disk.
+
+    Lines are flushed once `flush_lines` are pending or every
+    `flush_interval` seconds. When `max_pending` lines are already queued,
+    non-critical lines are dropped (and the drop count logged) rather than
+    blocking the caller. Critical lines, e.g. trades, are always queued.
+    """
+
+    def __init__(
+        self,
+        max_pending=10_000,
+        flush_lines=100,
+        flush_interval=1.0,
+        errors_path="logs/errors.txt",
+    ):
+        self.max_pending = max_pending
+        self.flush_lines = flush_lines
+        self.flush_interval = flush_interval
+        self.errors_path = errors_path
+        self.dropped = 0
+        self._pending = []
+        self._flushing = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="log-writer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.close)
+
+    def write(self, path, text, critical=False):
+        self.start()
+        with self._cond:
+            if self._closed:
+                self._append({path: [text]})
+                return True
+            if len(self._pending) >= self.max_pending and not critical:
+                self.dropped += 1
+                return False
+            self._pending.append((path, text))
+            if len(self._pending) >= self.flush_lines:
+                self._cond.notify()
+        return True
+
+    def flush(self):
+        """Block until everything written so far is on disk."""
+        with self._cond:
+            if self._thread is None:
+                return
+            self._flushing = True
+            self._cond.notify()
+            self._cond.wait_for(lambda: not self._pending and not self._flushing)
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _take_batch(self):
+        batch = {}
+        for path, text in self._pending:
+            batch.setdefault(path, []).append(text)
+        self._pending = []
+        if self.dropped:
+            _, curr_dt = _now()
+            batch.setdefault(self.errors_path, []).append(
+                f"Log writer dropped {self.dropped} lines | {curr_dt}\n"
+            )
+            self.dropped = 0
+        return batch
+
+    def _append(self, batch):
+        for path, texts in batch.items():
+            try:
+                with open(path, "a") as f:
+                    f.write("".join(texts))
+            except OSError as e:
+                print(f"Error writing {path}: {e}")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: len(self._pending) >= self.flush_lines
+                    or self._flushing
+                    or self._closed,
+                    timeout=self.flush_interval,
+                )
+                batch = self._take_batch()
+                closed = self._closed
+
+            self._append(batch)
+
+            with self._cond:
+                if not self._pending:
+                    self._flushing = False
+                    self._cond.notify_all()
+            if closed:
+                return
+
+
+def _now():
+    now = datetime.now()
+    return now.strftime("%Y-%m-%d"), now.strftime("%Y-%m-%d at %H:%M:%S")
+
+
+log_writer = LogWriter()
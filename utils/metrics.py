@@ -0,0 +1,228 @@
+import functools
+import inspect
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Histogram:
+    """Log-linear histogram in the spirit of HdrHistogram: every power of two
+    is split into SUB_BUCKETS linear buckets, bounding the relative error of
+    any quantile to about 1.5% at constant recording cost."""
+
+    SUB_BUCKETS = 32
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counts = {}
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def _index(self, value):
+        mantissa, exponent = math.frexp(max(value, 1e-9))
+        return exponent * self.SUB_BUCKETS + int(
+            (mantissa - 0.5) * 2 * self.SUB_BUCKETS
+        )
+
+    def _value(self, index):
+        exponent, sub_bucket = divmod(index, self.SUB_BUCKETS)
+        mantissa = 0.5 + (sub_bucket + 0.5) / (2 * self.SUB_BUCKETS)
+        return math.ldexp(mantissa, exponent)
+
+    def record(self, value):
+        index = self._index(value)
+        with self._lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q):
+        with self._lock:
+            if self.count == 0:
+                return float("nan")
+            rank = q * self.count
+            seen = 0
+            for index in sorted(self.counts):
+                seen += self.counts[index]
+                if seen >= rank:
+                    return min(self._value(index), self.max)
+            return self.max
+
+
+class _Timer:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        if exc_type is not None:
+            self.metrics.incr(f"{self.stage}_errors")
+        return False
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """Per-stage latency histograms and counters. Disabled by default, in
+    which case timers are a shared no-op and decorated functions only pay
+    for one attribute check per call."""
+
+    def __init__(self):
+        self.enabled = False
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage):
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, Histogram())
+        return histogram
+
+    def observe(self, stage, seconds):
+        self.histogram(stage).record(seconds)
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def timer(self, stage):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage)
+
+    def timed(self, stage):
+        def decorator(fn):
+            if inspect.iscoroutinefunction(fn):
+
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await fn(*args, **kwargs)
+                    with _Timer(self, stage):
+                        return await fn(*args, **kwargs)
+
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with _Timer(self, stage):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP nope_stage_seconds Latency of NOPE pipeline stages",
+            "# TYPE nope_stage_seconds summary",
+        ]
+        for stage, histogram in sorted(self._histograms.items()):
+            for q in QUANTILES:
+                lines.append(
+                    f'nope_stage_seconds{{stage="{stage}",quantile="{q}"}} '
+                    f"{histogram.quantile(q):.6f}"
+                )
+            lines.append(
+                f'nope_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}'
+            )
+            lines.append(
+                f'nope_stage_seconds_count{{stage="{stage}"}} {histogram.count}'
+            )
+        lines += [
+            "# HELP nope_events_total Counted NOPE pipeline events",
+            "# TYPE nope_events_total counter",
+        ]
+        for name, value in sorted(self._counters.items()):
+            lines.append(f'nope_events_total{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def summary_lines(self, curr_dt):
+        return [
+            f"{stage}: n={h.count} p50={h.quantile(0.5) * 1000:.1f}ms "
+            f"p99={h.quantile(0.99) * 1000:.1f}ms max={h.max * 1000:.1f}ms | {curr_dt}\n"
+            for stage, h in sorted(self._histograms.items())
+            if h.count
+        ]
+
+
+metrics = Metrics()
+
+
+class MetricsExporter:
+    """Writes the Prometheus text file and serves it over HTTP on
+    127.0.0.1:`http_port` (0 disables the endpoint)."""
+
+    def __init__(self, registry: Metrics, prometheus_file="", http_port=0, interval=15):
+        self.registry = registry
+        self.prometheus_file = prometheus_file
+        self.http_port = http_port
+        self.interval = interval
+        self._server = None
+
+    def start(self):
+        if self.prometheus_file:
+            thread = threading.Thread(target=self._write_loop, daemon=True)
+            thread.start()
+        if self.http_port:
+            registry = self.registry
+
+            class Handler(BaseHTTPRequestHandler):
+                def log_message(self, format, *args):
+                    pass
+
+                def do_GET(self):
+                    body = registry.prometheus_text().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            self._server = ThreadingHTTPServer(("127.0.0.1", self.http_port), Handler)
+            thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+            thread.start()
+
+    def write_file(self):
+        tmp_path = f"{self.prometheus_file}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.registry.prometheus_text())
+        os.replace(tmp_path, self.prometheus_file)
+
+    def _write_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write_file()
+            except OSError as e:
+                print(f"Error writing {self.prometheus_file}: {e}")
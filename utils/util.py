@@ -4,6 +4,28 @@ from datetime import datetime, timezone
 
 from ib_insync import util
 
+from utils.log_writer import log_writer
+
+_clock = None
+
+# Logs for this symbol keep their original names, others are prefixed with
+# the symbol, e.g. logs/QQQ-2021-03-02.txt
+DEFAULT_SYMBOL = "SPY"
+
+
+def use_clock(now):
+    """Replace the wall clock used for logging and order ages, e.g. with a
+    backtest's virtual clock. `now` returns an aware datetime; None restores
+    the wall clock."""
+    global _clock
+    _clock = now
+
+
+def now_utc():
+    if _clock is not None:
+        return _clock()
+    return datetime.now(timezone.utc)
+
 
 # From thetagang
 # https://github.com/brndnmtthws/thetagang
@@ -15,17 +37,12 @@ def midpoint_or_market_price(ticker):
 
 
 def get_datetime_for_logging():
-    now = datetime.now()
+    now = now_utc().astimezone()
     curr_date = now.strftime("%Y-%m-%d")
     curr_dt = now.strftime("%Y-%m-%d at %H:%M:%S")
     return [curr_date, curr_dt]
 
 
-def get_datetime_diff_from_now(dt):
-    diff = datetime.utcnow().replace(tzinfo=timezone.utc) - dt
-    return diff.seconds / 60
-
-
 def get_stack_trace():
     exc = sys.exc_info()[0]
     stack = traceback.extract_stack()[:-1]
@@ -38,24 +55,39 @@ def get_stack_trace():
     return stack_str
 
 
+def write_log(path, text, critical=False):
+    # Buffered; the background writer appends to the file
+    return log_writer.write(path, text, critical=critical)
+
+
+def log_error(text):
+    write_log("logs/errors.txt", text)
+
+
 def log_exception(e: Exception, fn):
     str_err = "Error {0}".format(str(e))
     _, curr_dt = get_datetime_for_logging()
+    stack_trace = get_stack_trace()
     print(f"{str_err} in {fn} | {curr_dt}")
-    print(get_stack_trace())
-    with open("logs/errors.txt", "a") as f:
-        f.write(f"{str_err} in {fn} | {curr_dt}\n{get_stack_trace()}\n")
+    print(stack_trace)
+    log_error(f"{str_err} in {fn} | {curr_dt}\n{stack_trace}\n")
+
+
+def log_prefix(symbol):
+    return "" if symbol == DEFAULT_SYMBOL else f"{symbol}-"
 
 
 def log_fill(filled_trade):
     curr_date, curr_dt = get_datetime_for_logging()
+    prefix = log_prefix(filled_trade.contract.symbol)
 
     for fill in filled_trade.fills:
         avg_fill_price = round(fill.execution.avgPrice * 100, 2)
-        with open(f"logs/{curr_date}-trade.txt", "a") as f:
-            f.write(
-                f"{fill.execution.side} {fill.execution.shares} {fill.contract.strike}{fill.contract.right}{fill.contract.lastTradeDateOrContractMonth} for {avg_fill_price} each, {curr_dt}\n"
-            )
+        write_log(
+            f"logs/{prefix}{curr_date}-trade.txt",
+            f"{fill.execution.side} {fill.execution.shares} {fill.contract.strike}{fill.contract.right}{fill.contract.lastTradeDateOrContractMonth} for {avg_fill_price} each, {curr_dt}\n",
+            critical=True,
+        )
 
 
 def stop_order_price(price, stop_loss_percentage):